@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Alert State
+Per-gauge alert levels kept in the FloodMonitoringState table, so the
+predictor only notifies when something changes
+
+A gauge's level moves up as soon as its probability crosses a threshold, but
+only moves down once the probability drops ALERT_HYSTERESIS below it, so a
+reading hovering around a threshold does not flap. Notifications go out when
+the level escalates, when it clears back to NORMAL, or when an active alert
+has gone ALERT_RENOTIFY_HOURS without one; de-escalating to a lower alert
+level is recorded silently.
+"""
+
+import os
+import time
+
+from state_store import get_states, put_states
+
+ALERT_LEVELS = ('NORMAL', 'WATCH', 'WARNING', 'EMERGENCY')
+
+# Probability a level needs to exceed (same thresholds as demo mode)
+ALERT_THRESHOLDS = {'WATCH': 0.2, 'WARNING': 0.5, 'EMERGENCY': 0.8}
+
+DEFAULT_HYSTERESIS = 0.05
+DEFAULT_RENOTIFY_HOURS = 12
+
+def alert_state_id(gauge_id):
+    """State store key for a gauge's alert state"""
+    return f'alert#{gauge_id}'
+
+def level_rank(level):
+    """Position of a level in ALERT_LEVELS (NORMAL is 0)"""
+    return ALERT_LEVELS.index(level)
+
+def level_for(probability, margin=0.0):
+    """Highest level whose threshold (less margin) the probability exceeds"""
+    level = 'NORMAL'
+    for candidate in ALERT_LEVELS[1:]:
+        if probability > ALERT_THRESHOLDS[candidate] - margin:
+            level = candidate
+    return level
+
+def apply_hysteresis(probability, previous_level, margin=DEFAULT_HYSTERESIS):
+    """Level for a probability, holding the previous level until it falls margin below"""
+    level = level_for(probability)
+    if level_rank(level) >= level_rank(previous_level):
+        return level
+    held = level_for(probability, margin)
+    return held if level_rank(held) < level_rank(previous_level) else previous_level
+
+def notification_reason(level, previous_level, last_notified_at, now, renotify_seconds):
+    """'escalated', 'cleared', 'reminder' or None when nothing should be sent"""
+    if level_rank(level) > level_rank(previous_level):
+        return 'escalated'
+    if level == 'NORMAL':
+        return 'cleared' if previous_level != 'NORMAL' else None
+    if last_notified_at is None or now - float(last_notified_at) >= renotify_seconds:
+        return 'reminder'
+    return None
+
+def load_alert_states(gauge_ids, dynamodb=None):
+    """Current alert state per gauge (empty dict for gauges never alerted)"""
+    states = get_states([alert_state_id(gauge_id) for gauge_id in gauge_ids], dynamodb)
+    return {gauge_id: states.get(alert_state_id(gauge_id), {}) for gauge_id in gauge_ids}
+
+def evaluate_alerts(probabilities, states, now=None):
+    """
+    Decide each gauge's level and whether to notify
+    
+    probabilities maps gauge_id -> flood probability and states comes from
+    load_alert_states. Returns one decision dict per gauge with gauge_id,
+    probability, level, previous_level and reason (None = stay quiet).
+    """
+    now = time.time() if now is None else now
+    margin = float(os.environ.get('ALERT_HYSTERESIS', DEFAULT_HYSTERESIS))
+    renotify_seconds = float(os.environ.get('ALERT_RENOTIFY_HOURS', DEFAULT_RENOTIFY_HOURS)) * 3600
+    
+    decisions = []
+    for gauge_id, probability in probabilities.items():
+        state = states.get(gauge_id, {})
+        previous_level = state.get('level', 'NORMAL')
+        level = apply_hysteresis(probability, previous_level, margin)
+        decisions.append({
+            'gauge_id': gauge_id,
+            'probability': probability,
+            'level': level,
+            'previous_level': previous_level,
+            'reason': notification_reason(level, previous_level, state.get('last_notified_at'),
+                                          now, renotify_seconds),
+            'last_notified_at': state.get('last_notified_at'),
+            'level_since': state.get('level_since') if level == previous_level else None
+        })
+    return decisions
+
+def save_alert_states(decisions, notified_gauges, now=None, dynamodb=None):
+    """
+    Record the new levels
+    
+    Only gauges in notified_gauges get a new last_notified_at; a gauge whose
+    notification failed keeps its old state so the next run retries it.
+    """
+    now = int(time.time() if now is None else now)
+    items = []
+    for decision in decisions:
+        if decision['reason'] and decision['gauge_id'] not in notified_gauges:
+            continue
+        if decision['level'] == decision['previous_level'] and not decision['reason']:
+            continue  # nothing changed
+        
+        item = {
+            'state_id': alert_state_id(decision['gauge_id']),
+            'level': decision['level'],
+            'level_since': decision['level_since'] or now,
+            'updated_at': now
+        }
+        if decision['gauge_id'] in notified_gauges:
+            item['last_notified_at'] = now
+        elif decision['last_notified_at'] is not None:
+            item['last_notified_at'] = decision['last_notified_at']
+        items.append(item)
+    return put_states(items, dynamodb)
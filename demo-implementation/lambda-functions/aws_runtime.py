@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Shared AWS Runtime
+Lazily created, module-scoped boto3 clients/resources and keep-alive HTTP
+sessions, reused across warm invocations
+
+Shipped in the flood-monitoring-runtime Lambda layer (tools/build_runtime_layer.py)
+together with the other shared modules. Nothing is created at import time, so a
+cold start only pays for the services a handler actually uses; after that every
+warm run reuses the same clients and their open TLS connections.
+"""
+
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+from concurrent_fetch import DEFAULT_MAX_WORKERS, create_session
+
+# Connection pool per AWS client - sized for the largest worker pool that
+# shares one client (override with AWS_MAX_POOL_CONNECTIONS)
+DEFAULT_POOL_CONNECTIONS = DEFAULT_MAX_WORKERS
+
+# Seconds; short connects fail fast inside a Lambda's time budget
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+DEFAULT_MAX_ATTEMPTS = 3
+
+_lock = threading.Lock()
+_clients = {}
+_resources = {}
+_sessions = {}
+
+def get_client_config():
+    """botocore Config shared by every client (pool size, timeouts, retries, keep-alive)"""
+    return Config(
+        max_pool_connections=int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', DEFAULT_POOL_CONNECTIONS)),
+        connect_timeout=float(os.environ.get('AWS_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT)),
+        read_timeout=float(os.environ.get('AWS_READ_TIMEOUT', DEFAULT_READ_TIMEOUT)),
+        retries={'max_attempts': DEFAULT_MAX_ATTEMPTS, 'mode': 'standard'},
+        tcp_keepalive=True
+    )
+
+def get_client(service):
+    """boto3 client for a service, created once per execution environment"""
+    client = _clients.get(service)
+    if client is None:
+        # Handlers create clients from worker threads too
+        with _lock:
+            client = _clients.get(service)
+            if client is None:
+                client = boto3.client(service, config=get_client_config())
+                _clients[service] = client
+    return client
+
+def get_resource(service):
+    """boto3 resource (e.g. dynamodb), created once per execution environment"""
+    resource = _resources.get(service)
+    if resource is None:
+        with _lock:
+            resource = _resources.get(service)
+            if resource is None:
+                resource = boto3.resource(service, config=get_client_config())
+                _resources[service] = resource
+    return resource
+
+def get_http_session(name, pool_size=DEFAULT_MAX_WORKERS, headers=None):
+    """
+    Keep-alive requests session for one API (e.g. 'usgs', 'noaa')
+    
+    The first caller's pool size and headers are kept for the life of the
+    execution environment.
+    """
+    session = _sessions.get(name)
+    if session is None:
+        with _lock:
+            session = _sessions.get(name)
+            if session is None:
+                session = create_session(pool_size, headers=headers)
+                _sessions[name] = session
+    return session
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Cold Archive
+Compressed columnar archive files in S3 for readings the DynamoDB tables
+expire, with a per-ID min/max timestamp index for range reads
+
+Objects are partitioned as <prefix>/<source>/<key>=<id>/month=YYYY-MM/ and
+hold one zlib-compressed block per UTC day. Inside a block every column is
+stored separately - timestamps and numbers as zigzag varint deltas (see
+packed_readings), strings as a JSON list. The _index.json next to the
+month folders records each block's byte offset and time range, so a range
+read is one index GET plus one byte-range GET per run of adjacent blocks.
+Numbers keep up to MAX_DECIMALS decimal places.
+"""
+
+import json
+import os
+import struct
+import uuid
+import zlib
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from aws_runtime import get_client
+from packed_readings import decode_deltas, encode_deltas
+
+DEFAULT_PREFIX = 'archive'
+INDEX_NAME = '_index.json'
+FORMAT_VERSION = 1
+
+MAX_DECIMALS = 6
+COMPRESSION_LEVEL = 6
+
+# source -> partition key attribute
+KEY_NAMES = {'usgs': 'gauge_id', 'noaa': 'station_id'}
+
+def get_archive_bucket(bucket=None):
+    """Archive bucket from the argument or ARCHIVE_BUCKET"""
+    bucket = bucket or os.environ.get('ARCHIVE_BUCKET')
+    if not bucket:
+        raise ValueError("ARCHIVE_BUCKET is not set")
+    return bucket
+
+def get_archive_prefix():
+    """Key prefix for archive objects (ARCHIVE_PREFIX)"""
+    return os.environ.get('ARCHIVE_PREFIX', DEFAULT_PREFIX).strip('/')
+
+def partition_prefix(source, key_value):
+    """Key prefix holding one gauge's or station's archive"""
+    return f"{get_archive_prefix()}/{source}/{KEY_NAMES[source]}={key_value}"
+
+def decimal_places(value):
+    """Decimal places needed to store a number exactly (capped at MAX_DECIMALS)"""
+    exponent = Decimal(str(value)).normalize().as_tuple().exponent
+    return min(max(-exponent, 0), MAX_DECIMALS) if isinstance(exponent, int) else 0
+
+def is_number(value):
+    """True for ints, floats and Decimals (not bools)"""
+    return isinstance(value, (int, float, Decimal)) and not isinstance(value, bool)
+
+def encode_column(values):
+    """(spec, buffers) for one column of numbers or strings (None allowed)"""
+    present = [value for value in values if value is not None]
+    if present and all(is_number(value) for value in present):
+        places = max(decimal_places(value) for value in present)
+        scale = 10 ** places
+        mask = bytes(0 if value is None else 1 for value in values) if len(present) < len(values) else b''
+        data = encode_deltas([int(round(Decimal(str(value)) * scale)) for value in present])
+        return {'type': 'number', 'places': places}, [mask, data]
+    data = json.dumps([None if value is None else str(value) for value in values],
+                      separators=(',', ':')).encode('utf-8')
+    return {'type': 'string'}, [data]
+
+def decode_column(spec, buffers, rows):
+    """Inverse of encode_column; numbers come back as floats"""
+    if spec['type'] == 'string':
+        return json.loads(buffers[0].decode('utf-8'))
+    scale = 10 ** spec['places']
+    numbers = iter(value / scale for value in decode_deltas(buffers[1]))
+    mask = buffers[0]
+    if not mask:
+        return list(numbers)
+    return [next(numbers) if flag else None for flag in mask[:rows]]
+
+def encode_block(times, columns):
+    """
+    One compressed block: epoch-second times plus {name: values} columns
+    
+    The payload is a length-prefixed JSON header (column specs and buffer
+    sizes) followed by the column buffers, compressed together.
+    """
+    header = {'rows': len(times), 'columns': []}
+    buffers = [encode_deltas(times)]
+    header['times'] = len(buffers[0])
+    for name in sorted(columns):
+        spec, column_buffers = encode_column(columns[name])
+        spec.update(name=name, sizes=[len(buffer) for buffer in column_buffers])
+        header['columns'].append(spec)
+        buffers.extend(column_buffers)
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    payload = struct.pack('>I', len(header_bytes)) + header_bytes + b''.join(buffers)
+    return zlib.compress(payload, COMPRESSION_LEVEL)
+
+def decode_block(data):
+    """(times, {name: values}) from a compressed block"""
+    payload = zlib.decompress(data)
+    header_size = struct.unpack('>I', payload[:4])[0]
+    header = json.loads(payload[4:4 + header_size].decode('utf-8'))
+    offset = 4 + header_size
+    times = decode_deltas(payload[offset:offset + header['times']])
+    offset += header['times']
+    
+    columns = {}
+    for spec in header['columns']:
+        buffers = []
+        for size in spec['sizes']:
+            buffers.append(payload[offset:offset + size])
+            offset += size
+        columns[spec['name']] = decode_column(spec, buffers, header['rows'])
+    return times, columns
+
+def build_part(rows):
+    """
+    Archive object bytes and block index for rows of (epoch, {attribute: value})
+    
+    Rows are sorted and split into one block per UTC day.
+    """
+    rows = sorted(rows, key=lambda row: row[0])
+    days = {}
+    for epoch, values in rows:
+        days.setdefault(epoch // 86400, []).append((epoch, values))
+    
+    chunks = []
+    blocks = []
+    offset = 0
+    for day in sorted(days):
+        day_rows = days[day]
+        names = sorted(set().union(*(values.keys() for _, values in day_rows)))
+        columns = {name: [values.get(name) for _, values in day_rows] for name in names}
+        block = encode_block([epoch for epoch, _ in day_rows], columns)
+        blocks.append({'offset': offset, 'length': len(block), 'rows': len(day_rows),
+                       'min': day_rows[0][0], 'max': day_rows[-1][0]})
+        chunks.append(block)
+        offset += len(block)
+    return b''.join(chunks), blocks
+
+def month_of(epoch):
+    """YYYY-MM partition for an epoch (UTC)"""
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m')
+
+def empty_index(source, key_value):
+    """Index for an ID with nothing archived"""
+    return {'format': FORMAT_VERSION, 'source': source, 'id': key_value, 'max_time': None, 'parts': []}
+
+def load_index(source, key_value, bucket=None, s3=None):
+    """The min/max index for one ID (empty when nothing is archived yet)"""
+    s3 = s3 or get_client('s3')
+    try:
+        response = s3.get_object(Bucket=get_archive_bucket(bucket),
+                                 Key=f"{partition_prefix(source, key_value)}/{INDEX_NAME}")
+    except s3.exceptions.NoSuchKey:
+        return empty_index(source, key_value)
+    return json.loads(response['Body'].read())
+
+def save_index(index, bucket=None, s3=None):
+    """Write the index; this is what makes newly written parts visible"""
+    s3 = s3 or get_client('s3')
+    s3.put_object(Bucket=get_archive_bucket(bucket),
+                  Key=f"{partition_prefix(index['source'], index['id'])}/{INDEX_NAME}",
+                  Body=json.dumps(index, separators=(',', ':')).encode('utf-8'),
+                  ContentType='application/json')
+
+def write_parts(index, rows, bucket=None, s3=None):
+    """
+    Upload rows as one new part per month and add them to the index
+    
+    The index itself is not saved here. Returns the number of bytes written.
+    """
+    s3 = s3 or get_client('s3')
+    bucket = get_archive_bucket(bucket)
+    months = {}
+    for row in rows:
+        months.setdefault(month_of(row[0]), []).append(row)
+    
+    written = 0
+    for month, month_rows in sorted(months.items()):
+        body, blocks = build_part(month_rows)
+        key = f"{partition_prefix(index['source'], index['id'])}/month={month}/part-{uuid.uuid4().hex[:12]}.fca"
+        s3.put_object(Bucket=bucket, Key=key, Body=body, ContentType='application/octet-stream')
+        index['parts'].append({'key': key, 'month': month, 'size': len(body),
+                               'rows': sum(block['rows'] for block in blocks),
+                               'min': blocks[0]['min'], 'max': blocks[-1]['max'], 'blocks': blocks})
+        written += len(body)
+    
+    if rows:
+        newest = max(row[0] for row in rows)
+        index['max_time'] = max(index['max_time'] or newest, newest)
+    return written
+
+def read_blocks(part, blocks, bucket, s3):
+    """Decoded (times, columns) for blocks of one part, one ranged GET per adjacent run"""
+    runs = []
+    for block in sorted(blocks, key=lambda block: block['offset']):
+        if runs and runs[-1][-1]['offset'] + runs[-1][-1]['length'] == block['offset']:
+            runs[-1].append(block)
+        else:
+            runs.append([block])
+    
+    decoded = []
+    for run in runs:
+        start = run[0]['offset']
+        end = run[-1]['offset'] + run[-1]['length'] - 1
+        if start == 0 and end == part['size'] - 1:
+            data = s3.get_object(Bucket=bucket, Key=part['key'])['Body'].read()
+        else:
+            data = s3.get_object(Bucket=bucket, Key=part['key'], Range=f'bytes={start}-{end}')['Body'].read()
+        for block in run:
+            offset = block['offset'] - start
+            decoded.append(decode_block(data[offset:offset + block['length']]))
+    return decoded
+
+def compact_month(index, month, bucket=None, s3=None):
+    """
+    Rewrite a month's parts as one part, dropping rows repeated across parts
+    
+    The replaced objects are returned (not deleted) so the caller can delete
+    them once the new index is saved.
+    """
+    s3 = s3 or get_client('s3')
+    bucket = get_archive_bucket(bucket)
+    parts = [part for part in index['parts'] if part['month'] == month]
+    if len(parts) < 2:
+        return []
+    
+    rows = {}
+    for part in parts:
+        for times, columns in read_blocks(part, part['blocks'], bucket, s3):
+            for row, epoch in enumerate(times):
+                rows[epoch] = (epoch, {name: values[row] for name, values in columns.items()})
+    
+    index['parts'] = [part for part in index['parts'] if part['month'] != month]
+    write_parts(index, list(rows.values()), bucket, s3)
+    return [part['key'] for part in parts]
+
+def read_archive(source, key_value, start=None, end=None, bucket=None, s3=None):
+    """
+    Archived rows for one ID with start <= timestamp <= end, as columns
+    
+    start and end are aware datetimes or epoch seconds (None = unbounded).
+    Only the blocks whose min/max overlap the range are fetched. Returns a
+    dict of column lists sorted by time, with 'timestamp' in epoch seconds
+    and the ID column filled in.
+    """
+    s3 = s3 or get_client('s3')
+    bucket = get_archive_bucket(bucket)
+    lower = start.timestamp() if hasattr(start, 'timestamp') else start
+    upper = end.timestamp() if hasattr(end, 'timestamp') else end
+    
+    rows = {}
+    names = set()
+    index = load_index(source, key_value, bucket, s3)
+    for part in index['parts']:
+        blocks = [block for block in part['blocks']
+                  if (lower is None or block['max'] >= lower) and (upper is None or block['min'] <= upper)]
+        if not blocks:
+            continue
+        for times, columns in read_blocks(part, blocks, bucket, s3):
+            names.update(columns)
+            for row, epoch in enumerate(times):
+                if (lower is None or epoch >= lower) and (upper is None or epoch <= upper):
+                    rows[epoch] = {name: values[row] for name, values in columns.items()}
+    
+    ordered = sorted(rows)
+    result = {'timestamp': ordered, KEY_NAMES[source]: [key_value] * len(ordered)}
+    for name in sorted(names):
+        result[name] = [rows[epoch].get(name) for epoch in ordered]
+    return result
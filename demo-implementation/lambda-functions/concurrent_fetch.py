@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Concurrent HTTP Fetch Engine
+Runs many GET requests (or other tasks) on a bounded thread pool over one keep-alive session,
+with per-request timeouts and an overall deadline for the whole batch, plus the
+validator and freshness helpers used for conditional (ETag / If-Modified-Since) requests
+"""
+
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+
+# requests is only needed by the HTTP helpers - run_all works without it
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:
+    requests = None
+
+DEFAULT_MAX_WORKERS = 32
+DEFAULT_TIMEOUT = 10  # seconds per request (connect and read)
+
+# Seconds kept back from the Lambda's remaining time for writes and the response
+DEADLINE_MARGIN = 5.0
+
+def create_session(pool_size=DEFAULT_MAX_WORKERS, headers=None):
+    """Create a requests session whose connection pool fits the worker count"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+def get_deadline(context, margin=DEADLINE_MARGIN):
+    """Monotonic deadline derived from the Lambda context (None without one)"""
+    if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+        return None
+    remaining = context.get_remaining_time_in_millis() / 1000.0 - margin
+    return time.monotonic() + max(remaining, 1.0)
+
+def get_with_deadline(session, spec, timeout=DEFAULT_TIMEOUT, deadline=None):
+    """Single GET bounded by both its own timeout and the batch deadline"""
+    if deadline is not None:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise requests.exceptions.Timeout('Batch deadline reached before request started')
+        timeout = min(timeout, remaining)
+    return session.get(spec['url'], params=spec.get('params'), headers=spec.get('headers'),
+                       timeout=timeout, stream=spec.get('stream', False))
+
+def run_all(task, items, max_workers=DEFAULT_MAX_WORKERS, deadline=None):
+    """
+    Run task(item) for every item on a bounded thread pool
+    
+    Returns one dict per item, in input order, holding either 'result' or
+    'error'. Tasks still running at the deadline are reported as timeouts
+    rather than holding up the batch.
+    """
+    if not items:
+        return []
+    
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(items)))
+    try:
+        futures = [executor.submit(task, item) for item in items]
+        wait_timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+        wait(futures, timeout=wait_timeout)
+        
+        outcomes = []
+        for future in futures:
+            if not future.done():
+                future.cancel()
+                outcomes.append({'error': TimeoutError('Batch deadline reached')})
+            elif future.exception() is not None:
+                outcomes.append({'error': future.exception()})
+            else:
+                outcomes.append({'result': future.result()})
+        return outcomes
+    finally:
+        executor.shutdown(wait=False)
+
+def fetch_all(session, specs, max_workers=DEFAULT_MAX_WORKERS, timeout=DEFAULT_TIMEOUT,
+              deadline=None):
+    """
+    Fetch every spec ({'key', 'url', optional 'params'/'headers'}) concurrently
+    
+    Returns one dict per spec, in input order, holding 'key' plus either
+    'response' or 'error'.
+    """
+    outcomes = run_all(lambda spec: get_with_deadline(session, spec, timeout, deadline), specs,
+                       max_workers=max_workers, deadline=deadline)
+    
+    results = []
+    for spec, outcome in zip(specs, outcomes):
+        result = {'key': spec['key']}
+        if isinstance(outcome.get('error'), TimeoutError):
+            result['error'] = requests.exceptions.Timeout(str(outcome['error']))
+        elif 'error' in outcome:
+            result['error'] = outcome['error']
+        else:
+            result['response'] = outcome['result']
+        results.append(result)
+    return results
+
+def conditional_headers(validators):
+    """If-None-Match / If-Modified-Since headers from a cached response's validators"""
+    headers = {}
+    if validators and validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators and validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+    return headers
+
+def response_validators(response):
+    """ETag and Last-Modified of a response (only the ones the server sent)"""
+    validators = {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+    return {name: value for name, value in validators.items() if value}
+
+def fresh_until(response, now=None):
+    """
+    Epoch seconds until which a response may be reused without asking again
+    
+    Uses Cache-Control max-age (less the Age header), then Expires; a
+    response with neither is stale straight away.
+    """
+    now = time.time() if now is None else now
+    cache_control = response.headers.get('Cache-Control', '')
+    if 'no-cache' in cache_control or 'no-store' in cache_control:
+        return now
+    match = re.search(r'max-age=(\d+)', cache_control)
+    if match:
+        age = response.headers.get('Age', '0')
+        return now + int(match.group(1)) - (int(age) if age.isdigit() else 0)
+    try:
+        return parsedate_to_datetime(response.headers['Expires']).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return now
@@ -6,10 +6,13 @@ This triggers the ML predictor to send email alerts for demonstrations
 """
 
 import json
-import boto3
 from datetime import datetime
 from decimal import Decimal
 
+from aws_runtime import get_client
+from instrumentation import instrumented, phase
+
+@instrumented('demo-workflow-trigger')
 def lambda_handler(event, context):
     """
     Trigger demo workflow with simulated high water level data
@@ -19,17 +22,32 @@ def lambda_handler(event, context):
     
     Parameters in event (optional):
     - water_level: float (default 8.5) - Water level in feet
+    - scenario_sweep: dict - grids of water_level, flood_stage, rate_of_rise,
+      precipitation_1hr, precipitation_forecast_24hr and temperature values;
+      every combination is scored in one predictor call and no alert is sent
     """
     
     # Get parameters from event or use defaults
     water_level = event.get('water_level', 8.5)
     
     try:
+        if event.get('scenario_sweep'):
+            with phase('predict'):
+                sweep_result = trigger_scenario_sweep(event['scenario_sweep'])
+            return {
+                'statusCode': 200 if 'error' not in sweep_result else 400,
+                'body': json.dumps({
+                    'message': 'Scenario sweep completed' if 'error' not in sweep_result else 'Scenario sweep failed',
+                    'sweep': sweep_result
+                })
+            }
+        
         # Step 1: Prepare demo data (logging only, no DynamoDB write)
         demo_info = prepare_demo_data(water_level)
         
         # Step 2: Trigger ML predictor with demo mode
-        prediction_result = trigger_ml_predictor(water_level)
+        with phase('predict'):
+            prediction_result = trigger_ml_predictor(water_level)
         
         return {
             'statusCode': 200,
@@ -63,7 +81,7 @@ def prepare_demo_data(water_level):
 def trigger_ml_predictor(water_level):
     """Trigger the ML Flood Predictor Lambda in DEMO MODE"""
     
-    lambda_client = boto3.client('lambda')
+    lambda_client = get_client('lambda')
     
     try:
         # Pass demo_mode flag to ML predictor with simulated water level
@@ -91,3 +109,20 @@ def trigger_ml_predictor(water_level):
     except Exception as e:
         print(f"Error invoking ML Predictor: {e}")
         return {'error': str(e)}
+
+def trigger_scenario_sweep(sweep):
+    """Run a what-if sweep on the ML Flood Predictor (planning only, no SNS)"""
+    
+    lambda_client = get_client('lambda')
+    
+    response = lambda_client.invoke(
+        FunctionName='ml-flood-predictor',
+        InvocationType='RequestResponse',
+        Payload=json.dumps({'scenario_sweep': sweep})
+    )
+    
+    result = json.loads(response['Payload'].read())
+    body = json.loads(result['body']) if 'body' in result else result
+    if 'scenarios' in body:
+        print(f"Scenario sweep: {body['scenarios']} scenarios, {body['level_counts']} by alert level")
+    return body
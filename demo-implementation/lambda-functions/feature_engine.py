@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Flood Feature Engine
+Vectorized lag, rate-of-change and rolling precipitation features computed
+from sorted gauge and weather reading arrays with NumPy
+
+Feature names follow a small grammar so the engine can emit exactly the
+list stored in models/model_features.json:
+    water_level, flood_stage, water_level_ratio
+    water_level_lag_<n>        value <n> readings (15 min each) back
+    water_level_lag_<n>h       value <n> hours back
+    water_level_change_<n>h    change over the last <n> hours
+    water_level_rate_<n>h      average rise in feet per hour over <n> hours
+    precip_cumulative_<n>h     precipitation_1hr summed over <n> hours
+    precipitation_1hr, precipitation_forecast_24hr, temperature
+    hour, day_of_year, month
+"""
+
+import re
+import numpy as np
+from datetime import datetime, timezone
+
+from flood_data_access import parse_timestamp
+from temporal_align import asof_indices
+
+# Feature order used by models trained before model_features.json existed
+DEFAULT_FEATURES = [
+    'water_level', 'water_level_lag_1h', 'water_level_lag_6h',
+    'water_level_change_1h', 'water_level_change_6h',
+    'precipitation_1hr', 'precip_cumulative_6h', 'precip_cumulative_24h',
+    'precipitation_forecast_24hr',
+    'hour', 'day_of_year', 'month'
+]
+
+# Values used when there is no data at all for an input
+DEFAULT_WATER_LEVEL = 5.0
+DEFAULT_FLOOD_STAGE = 10.0
+DEFAULT_TEMPERATURE = 10.0
+
+# As-of lookups older than this are treated as missing
+MAX_READING_AGE = 3 * 3600.0
+
+_LAG_STEPS = re.compile(r'^water_level_lag_(\d+)$')
+_LAG_HOURS = re.compile(r'^water_level_lag_(\d+(?:\.\d+)?)h$')
+_CHANGE = re.compile(r'^water_level_change_(\d+(?:\.\d+)?)h$')
+_RATE = re.compile(r'^water_level_rate_(\d+(?:\.\d+)?)h$')
+_PRECIP_SUM = re.compile(r'^precip_cumulative_(\d+(?:\.\d+)?)h$')
+
+def to_epoch_seconds(timestamps):
+    """ISO-8601 strings (or datetimes) to float epoch seconds"""
+    seconds = np.empty(len(timestamps))
+    for idx, value in enumerate(timestamps):
+        if not isinstance(value, datetime):
+            value = parse_timestamp(value)
+        elif value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        seconds[idx] = value.timestamp()
+    return seconds
+
+def series_from_items(items, value_keys):
+    """
+    Sorted (times, values) arrays for several attributes of DynamoDB items
+    
+    Timestamps are parsed once per item, not once per attribute.
+    """
+    items = [item for item in items if 'timestamp' in item]
+    times = to_epoch_seconds([item['timestamp'] for item in items])
+    order = np.argsort(times, kind='stable')
+    times = times[order]
+    
+    series = {}
+    for key in value_keys:
+        values = np.array([
+            float(item[key]) if item.get(key) is not None else np.nan for item in items
+        ], dtype=float).reshape(-1)[order]
+        present = ~np.isnan(values)
+        series[key] = (times[present], values[present])
+    return series
+
+def value_at(times, values, query_times, max_age=MAX_READING_AGE, steps_back=0):
+    """Latest value at or before each query time (NaN if none or too old)"""
+    idx = asof_indices(query_times, times, direction='backward')
+    idx = np.where(idx >= steps_back, idx - steps_back, -1)
+    
+    result = np.full(len(query_times), np.nan)
+    found = idx >= 0
+    found[found] = query_times[found] - times[idx[found]] <= max_age
+    result[found] = values[idx[found]]
+    return result
+
+def window_sum(times, values, query_times, window):
+    """Sum of values with query_time - window < time <= query_time"""
+    cumulative = np.concatenate(([0.0], np.cumsum(values)))
+    upper = np.searchsorted(times, query_times, side='right')
+    lower = np.searchsorted(times, query_times - window, side='right')
+    return cumulative[upper] - cumulative[lower]
+
+def compute_features(feature_names, query_times, gauge, weather):
+    """
+    Feature matrix (len(query_times) x len(feature_names))
+    
+    gauge and weather are dicts of attribute -> (times, values) sorted
+    arrays. Missing inputs come back as NaN; see fill_missing.
+    """
+    query_times = np.asarray(query_times, dtype=float)
+    n = len(query_times)
+    empty = (np.empty(0), np.empty(0))
+    
+    level_times, level_values = gauge.get('water_level', empty)
+    current_level = value_at(level_times, level_values, query_times)
+    
+    def level_hours_back(hours):
+        return value_at(level_times, level_values, query_times - hours * 3600.0)
+    
+    calendar = None
+    columns = []
+    for name in feature_names:
+        if name == 'water_level':
+            column = current_level
+        elif name == 'flood_stage':
+            column = value_at(*gauge.get('flood_stage', empty), query_times, max_age=np.inf)
+        elif name == 'water_level_ratio':
+            stage = value_at(*gauge.get('flood_stage', empty), query_times, max_age=np.inf)
+            column = current_level / np.where(np.isnan(stage), DEFAULT_FLOOD_STAGE, stage)
+        elif _LAG_STEPS.match(name):
+            steps = int(_LAG_STEPS.match(name).group(1))
+            column = value_at(level_times, level_values, query_times, max_age=np.inf, steps_back=steps)
+        elif _LAG_HOURS.match(name):
+            column = level_hours_back(float(_LAG_HOURS.match(name).group(1)))
+        elif _CHANGE.match(name):
+            column = current_level - level_hours_back(float(_CHANGE.match(name).group(1)))
+        elif _RATE.match(name):
+            hours = float(_RATE.match(name).group(1))
+            column = (current_level - level_hours_back(hours)) / hours
+        elif _PRECIP_SUM.match(name):
+            hours = float(_PRECIP_SUM.match(name).group(1))
+            precip_times, precip_values = weather.get('precipitation_1hr', empty)
+            column = window_sum(precip_times, precip_values, query_times, hours * 3600.0)
+        elif name in ('precipitation_1hr', 'precipitation_forecast_24hr', 'temperature'):
+            column = value_at(*weather.get(name, empty), query_times)
+        elif name in ('hour', 'day_of_year', 'month'):
+            if calendar is None:
+                calendar = calendar_fields(query_times)
+            column = calendar[name]
+        else:
+            raise ValueError(f"Unknown feature: {name}")
+        columns.append(np.broadcast_to(np.asarray(column, dtype=float), (n,)))
+    
+    return np.column_stack(columns) if columns else np.empty((n, 0))
+
+def calendar_fields(query_times):
+    """UTC hour, day of year and month for epoch-second query times"""
+    moments = query_times.astype('datetime64[s]')
+    days = moments.astype('datetime64[D]')
+    years = moments.astype('datetime64[Y]')
+    months = moments.astype('datetime64[M]')
+    return {
+        'hour': ((moments - days).astype(np.int64) // 3600).astype(float),
+        'day_of_year': ((days - years.astype('datetime64[D]')).astype(np.int64) + 1).astype(float),
+        'month': ((months - years.astype('datetime64[M]')).astype(np.int64) + 1).astype(float)
+    }
+
+def fill_missing(matrix, feature_names):
+    """Replace NaNs with neutral values so a short history still scores"""
+    matrix = np.array(matrix, dtype=float)
+    level_col = feature_names.index('water_level') if 'water_level' in feature_names else None
+    
+    for col, name in enumerate(feature_names):
+        missing = np.isnan(matrix[:, col])
+        if not missing.any():
+            continue
+        if name == 'water_level':
+            fill = DEFAULT_WATER_LEVEL
+        elif _LAG_STEPS.match(name) or _LAG_HOURS.match(name):
+            # No history yet - assume the level has not moved
+            fill = matrix[missing, level_col] if level_col is not None else DEFAULT_WATER_LEVEL
+            fill = np.where(np.isnan(fill), DEFAULT_WATER_LEVEL, fill)
+        elif name in ('flood_stage',):
+            fill = DEFAULT_FLOOD_STAGE
+        elif name == 'temperature':
+            fill = DEFAULT_TEMPERATURE
+        elif name == 'water_level_ratio':
+            fill = DEFAULT_WATER_LEVEL / DEFAULT_FLOOD_STAGE
+        else:
+            fill = 0.0
+        matrix[missing, col] = fill
+    
+    return matrix
+
+def scenario_features(feature_names, inputs, query_time):
+    """
+    Feature matrix for hypothetical steady conditions, one row per scenario
+    
+    inputs holds equal-length arrays for water_level, flood_stage,
+    rate_of_rise (ft/hr), precipitation_1hr, precipitation_forecast_24hr and
+    temperature. The level is taken to have moved at rate_of_rise and the
+    hourly precipitation to have fallen every hour, so lags, changes and
+    cumulative sums follow from those without any stored history.
+    """
+    level = np.asarray(inputs['water_level'], dtype=float)
+    n = len(level)
+    rate = np.asarray(inputs['rate_of_rise'], dtype=float)
+    precip = np.asarray(inputs['precipitation_1hr'], dtype=float)
+    
+    calendar = None
+    columns = []
+    for name in feature_names:
+        if name in ('water_level', 'flood_stage', 'precipitation_1hr', 'precipitation_forecast_24hr',
+                    'temperature'):
+            column = inputs[name]
+        elif name == 'water_level_ratio':
+            column = level / np.asarray(inputs['flood_stage'], dtype=float)
+        elif _LAG_STEPS.match(name):
+            column = level - rate * int(_LAG_STEPS.match(name).group(1)) * 0.25
+        elif _LAG_HOURS.match(name):
+            column = level - rate * float(_LAG_HOURS.match(name).group(1))
+        elif _CHANGE.match(name):
+            column = rate * float(_CHANGE.match(name).group(1))
+        elif _RATE.match(name):
+            column = rate
+        elif _PRECIP_SUM.match(name):
+            column = precip * float(_PRECIP_SUM.match(name).group(1))
+        elif name in ('hour', 'day_of_year', 'month'):
+            if calendar is None:
+                calendar = calendar_fields(np.array([query_time], dtype=float))
+            column = calendar[name][0]
+        else:
+            raise ValueError(f"Unknown feature: {name}")
+        columns.append(np.broadcast_to(np.asarray(column, dtype=float), (n,)))
+    
+    return np.column_stack(columns) if columns else np.empty((n, 0))
+
+def build_feature_row(usgs_data, noaa_data, feature_names=None, query_time=None):
+    """
+    One feature row (1 x n) for the latest gauge reading
+    
+    usgs_data/noaa_data are DynamoDB items for one gauge and its station.
+    Without a query_time the newest gauge reading time is used (or now).
+    """
+    feature_names = feature_names or DEFAULT_FEATURES
+    gauge = series_from_items(usgs_data, ('water_level', 'flood_stage'))
+    weather = series_from_items(noaa_data, ('precipitation_1hr', 'precipitation_forecast_24hr',
+                                            'temperature'))
+    
+    if query_time is None:
+        level_times = gauge['water_level'][0]
+        query_time = level_times[-1] if len(level_times) else datetime.now(timezone.utc).timestamp()
+    
+    matrix = compute_features(feature_names, np.array([query_time]), gauge, weather)
+    return fill_missing(matrix, feature_names)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Flood Feature Pipeline
+One versioned artifact (feature list + scaler + model) shared by the
+training notebook and the ML predictor Lambda, so both build and scale
+features with the same vectorized code
+"""
+
+import json
+import numpy as np
+from datetime import datetime, timezone
+
+from feature_engine import DEFAULT_FEATURES, compute_features, fill_missing, build_feature_row
+from temporal_align import to_epoch_array
+
+ARTIFACT_VERSION = 1
+ARTIFACT_KEY = 'models/flood_pipeline.joblib'
+
+# Readable copy of the artifact's feature list (the artifact itself is authoritative)
+FEATURES_KEY = 'models/pipeline_features.json'
+
+# The same artifact compiled to flat arrays (forest_model), loaded without joblib/sklearn
+FOREST_KEY = 'models/flood_forest.bin'
+
+# Pre-pipeline bare model and the feature list it was trained on, still read
+# when no pipeline artifact exists; nothing published now writes either key
+MODEL_KEY = 'models/flood_prediction_model.joblib'
+MODEL_FEATURES_KEY = 'models/model_features.json'
+
+# Features the pipeline trains on by default
+PIPELINE_FEATURES = DEFAULT_FEATURES + ['temperature']
+
+GAUGE_COLUMNS = ('water_level', 'flood_stage')
+WEATHER_COLUMNS = ('precipitation_1hr', 'precipitation_forecast_24hr', 'temperature')
+
+def series_from_columns(timestamps, columns):
+    """Sorted (times, values) arrays per column, dropping missing values"""
+    times = to_epoch_array(timestamps)
+    order = np.argsort(times, kind='stable')
+    times = times[order]
+    
+    series = {}
+    for name, values in columns.items():
+        values = np.asarray(values, dtype=float)[order]
+        present = ~np.isnan(values)
+        series[name] = (times[present], values[present])
+    return series
+
+def build_feature_frame(gauge_df, weather_df, feature_names=None):
+    """
+    Training features for every reading of one gauge (pandas in, pandas out)
+    
+    Uses the same compute_features/fill_missing code the Lambda runs for a
+    single row. The frame keeps timestamp and flood_stage for labelling.
+    """
+    import pandas as pd
+    
+    feature_names = list(feature_names or PIPELINE_FEATURES)
+    gauge = series_from_columns(
+        gauge_df['timestamp'],
+        {name: gauge_df[name] for name in GAUGE_COLUMNS if name in gauge_df}
+    )
+    weather = {}
+    if weather_df is not None and len(weather_df):
+        weather = series_from_columns(
+            weather_df['timestamp'],
+            {name: weather_df[name] for name in WEATHER_COLUMNS if name in weather_df}
+        )
+    
+    query_times = gauge['water_level'][0]
+    matrix = fill_missing(compute_features(feature_names, query_times, gauge, weather), feature_names)
+    
+    frame = pd.DataFrame(matrix, columns=feature_names)
+    frame.insert(0, 'timestamp', pd.to_datetime(query_times, unit='s', utc=True))
+    if 'flood_stage' not in frame:
+        stage_times, stage_values = gauge.get('flood_stage', (np.empty(0), np.empty(0)))
+        if len(stage_times):
+            idx = np.clip(np.searchsorted(stage_times, query_times, side='right') - 1, 0, None)
+            frame['flood_stage'] = stage_values[idx]
+    return frame
+
+def build_inference_matrix(artifact, batch):
+    """Unscaled feature matrix, one row per {'usgs_data', 'noaa_data'} entry"""
+    feature_names = artifact['feature_names']
+    return np.vstack([
+        build_feature_row(entry['usgs_data'], entry['noaa_data'], feature_names) for entry in batch
+    ])
+
+def fit_pipeline(X, y, feature_names, model, metadata=None):
+    """
+    Fit the scaler and model together and return the artifact dict
+    
+    The scaler matches sklearn's StandardScaler (population std, zero
+    spread treated as 1) but is stored as plain arrays so inference is a
+    single fused (X - mean) / scale.
+    """
+    X = np.asarray(X, dtype=float)
+    mean = X.mean(axis=0)
+    scale = X.std(axis=0)
+    scale[scale == 0] = 1.0
+    
+    model.fit((X - mean) / scale, np.asarray(y))
+    
+    return {
+        'version': ARTIFACT_VERSION,
+        'feature_names': list(feature_names),
+        'scaler_mean': mean,
+        'scaler_scale': scale,
+        'model': model,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'metadata': metadata or {}
+    }
+
+def wrap_legacy_model(model, feature_names):
+    """Artifact for a bare model trained on unscaled features"""
+    n_features = len(feature_names or DEFAULT_FEATURES)
+    return {
+        'version': ARTIFACT_VERSION,
+        'feature_names': list(feature_names or DEFAULT_FEATURES),
+        'scaler_mean': np.zeros(n_features),
+        'scaler_scale': np.ones(n_features),
+        'model': model,
+        'created_at': None,
+        'metadata': {'legacy': True}
+    }
+
+def transform(artifact, X):
+    """Scale a feature matrix with the artifact's scaler"""
+    return (np.asarray(X, dtype=float) - artifact['scaler_mean']) / artifact['scaler_scale']
+
+def predict_proba(artifact, X):
+    """Flood (class 1) probability for every row in one predict_proba call"""
+    model = artifact['model']
+    if isinstance(model, dict):
+        # Compiled forest arrays already hold the class 1 probability
+        from forest_model import forest_proba
+        return forest_proba(model, transform(artifact, X))
+    
+    proba = model.predict_proba(transform(artifact, X))
+    classes = list(model.classes_)
+    
+    # Handle a model that only learned one class
+    if 1 in classes:
+        return proba[:, classes.index(1)]
+    return np.zeros(len(proba))
+
+def save_artifact(artifact, path, features_path=None):
+    """Serialize the artifact (and optionally its feature list as JSON)"""
+    import joblib
+    
+    joblib.dump(artifact, path)
+    if features_path:
+        with open(features_path, 'w') as f:
+            json.dump(artifact['feature_names'], f)
+
+def load_artifact(path):
+    """Load an artifact, rejecting versions this code cannot run"""
+    import joblib
+    
+    artifact = joblib.load(path)
+    if not isinstance(artifact, dict) or artifact.get('version') != ARTIFACT_VERSION:
+        found = artifact.get('version') if isinstance(artifact, dict) else type(artifact).__name__
+        raise ValueError(f"Unsupported pipeline artifact version: {found}")
+    return artifact
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Flood Data Access Layer
+Time-windowed reads and batched writes for USGS gauge readings and
+NOAA weather observations in DynamoDB
+
+Gauge readings are stored one item per reading, or with STORAGE_MODE=bucketed
+as packed per-gauge buckets of BUCKET_HOURS in FloodGaugeBuckets (see
+packed_readings). Both modes return the same reading dicts.
+"""
+
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from aws_runtime import get_resource
+from packed_readings import (bucket_key, bucket_keys, bucket_start, bucket_to_items,
+                             build_bucket_item, merge_readings, unpack_readings)
+
+USGS_TABLE = 'FloodGaugeReadings'
+NOAA_TABLE = 'WeatherObservations'
+GAUGE_BUCKET_TABLE = 'FloodGaugeBuckets'
+
+STORAGE_MODES = ('items', 'bucketed')
+
+# One bucket per gauge per UTC day; must divide 24 and match what was written
+DEFAULT_BUCKET_HOURS = 24
+
+# How far back the predictor looks by default (override with LOOKBACK_HOURS)
+DEFAULT_LOOKBACK_HOURS = 24
+
+# USGS stores site-local times (e.g. -05:00) and NOAA stores UTC, so the
+# sort key strings are not all on the same clock. The key condition is
+# widened by the largest possible UTC offset and then filtered exactly.
+TIMESTAMP_SKEW = timedelta(hours=14)
+
+# Only the attributes the predictor actually reads
+GAUGE_ATTRIBUTES = ['gauge_id', 'timestamp', 'water_level', 'flood_stage', 'trend',
+                    'rate_of_rise']
+WEATHER_ATTRIBUTES = ['station_id', 'timestamp', 'precipitation_1hr',
+                      'precipitation_forecast_24hr', 'temperature']
+
+
+def parse_timestamp(value):
+    """Parse a USGS/NOAA ISO-8601 timestamp into an aware UTC datetime"""
+    text = str(value).strip()
+    if text.endswith('Z'):
+        text = text[:-1] + '+00:00'
+    parsed = datetime.fromisoformat(text)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def get_storage_mode():
+    """How gauge readings are stored: 'items' (default) or 'bucketed' (STORAGE_MODE)"""
+    mode = os.environ.get('STORAGE_MODE', 'items').strip().lower()
+    if mode not in STORAGE_MODES:
+        raise ValueError(f"STORAGE_MODE must be one of {', '.join(STORAGE_MODES)}, got {mode!r}")
+    return mode
+
+
+def get_bucket_hours():
+    """Hours per gauge bucket in bucketed mode (BUCKET_HOURS)"""
+    hours = int(os.environ.get('BUCKET_HOURS', DEFAULT_BUCKET_HOURS))
+    if hours <= 0 or 24 % hours:
+        raise ValueError(f"BUCKET_HOURS must divide 24, got {hours}")
+    return hours
+
+
+def get_lookback_hours(lookback_hours=None):
+    """Resolve the lookback window from the argument or LOOKBACK_HOURS"""
+    if lookback_hours is None:
+        lookback_hours = os.environ.get('LOOKBACK_HOURS', DEFAULT_LOOKBACK_HOURS)
+    return float(lookback_hours)
+
+
+def query_time_window(table, key_name, key_value, start_time, end_time, attributes=None):
+    """
+    Query one partition for items with start_time <= timestamp <= end_time
+
+    Follows LastEvaluatedKey so windows larger than one 1 MB page come back
+    complete. Items are returned sorted oldest first.
+    """
+    if start_time.tzinfo is None:
+        start_time = start_time.replace(tzinfo=timezone.utc)
+    if end_time.tzinfo is None:
+        end_time = end_time.replace(tzinfo=timezone.utc)
+
+    lower = (start_time - TIMESTAMP_SKEW).strftime('%Y-%m-%dT%H:%M:%S')
+    upper = (end_time + TIMESTAMP_SKEW).strftime('%Y-%m-%dT%H:%M:%S')
+
+    params = {
+        'KeyConditionExpression': '#key = :key AND #ts BETWEEN :lower AND :upper',
+        'ExpressionAttributeNames': {'#key': key_name, '#ts': 'timestamp'},
+        'ExpressionAttributeValues': {':key': key_value, ':lower': lower, ':upper': upper}
+    }
+
+    if attributes:
+        # Placeholders for every name - 'timestamp' and 'ttl' are reserved words
+        placeholders = []
+        for idx, attribute in enumerate(attributes):
+            placeholder = f'#a{idx}'
+            params['ExpressionAttributeNames'][placeholder] = attribute
+            placeholders.append(placeholder)
+        params['ProjectionExpression'] = ', '.join(placeholders)
+
+    items = []
+    while True:
+        response = table.query(**params)
+        items.extend(response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            break
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    in_window = []
+    for item in items:
+        try:
+            item_time = parse_timestamp(item['timestamp'])
+        except (KeyError, ValueError):
+            continue
+        if start_time <= item_time <= end_time:
+            in_window.append((item_time, item))
+
+    in_window.sort(key=lambda pair: pair[0])
+    return [item for _, item in in_window]
+
+
+def batch_get_items(table, keys, attributes=None, max_retries=8):
+    """
+    Fetch items by key with BatchGetItem (100 keys per request)
+
+    Unprocessed keys are retried with exponential backoff. Missing items
+    are simply absent from the returned list.
+    """
+    client = table.meta.client
+    request = {}
+    if attributes:
+        request['ProjectionExpression'] = ', '.join(f'#a{idx}' for idx in range(len(attributes)))
+        request['ExpressionAttributeNames'] = {f'#a{idx}': name for idx, name in enumerate(attributes)}
+
+    items = []
+    for start in range(0, len(keys), 100):
+        pending = keys[start:start + 100]
+        attempt = 0
+        while pending:
+            response = client.batch_get_item(RequestItems={table.name: dict(request, Keys=pending)})
+            items.extend(response.get('Responses', {}).get(table.name, []))
+            pending = response.get('UnprocessedKeys', {}).get(table.name, {}).get('Keys', [])
+            if pending:
+                attempt += 1
+                if attempt > max_retries:
+                    raise RuntimeError(f"{len(pending)} keys still unprocessed "
+                                       f"after {max_retries} retries")
+                time.sleep(min(0.05 * (2 ** attempt), 2.0))
+    return items
+
+
+def read_gauge_buckets(table, gauge_id, start_time, end_time, bucket_hours=None):
+    """
+    Readings with start_time <= timestamp <= end_time from a gauge's buckets
+
+    A window needs only the buckets it overlaps (one or two for 24 hours of
+    daily buckets), fetched by key. Readings are returned oldest first.
+    """
+    keys = [{'gauge_id': gauge_id, 'timestamp': key}
+            for key in bucket_keys(start_time, end_time, bucket_hours or get_bucket_hours())]
+    readings = []
+    for item in batch_get_items(table, keys):
+        readings.extend(bucket_to_items(item))
+
+    in_window = []
+    for reading in readings:
+        reading_time = parse_timestamp(reading['timestamp'])
+        if start_time <= reading_time <= end_time:
+            in_window.append((reading_time, reading))
+    in_window.sort(key=lambda pair: pair[0])
+    return [reading for _, reading in in_window]
+
+
+def get_recent_gauge_readings(gauge_id, lookback_hours=None, end_time=None, dynamodb=None):
+    """Get one gauge's readings for the lookback window"""
+    dynamodb = dynamodb or get_resource('dynamodb')
+    end_time = end_time or datetime.now(timezone.utc)
+    start_time = end_time - timedelta(hours=get_lookback_hours(lookback_hours))
+
+    if get_storage_mode() == 'bucketed':
+        return read_gauge_buckets(dynamodb.Table(GAUGE_BUCKET_TABLE), gauge_id, start_time, end_time)
+    return query_time_window(dynamodb.Table(USGS_TABLE), 'gauge_id', gauge_id,
+                             start_time, end_time, GAUGE_ATTRIBUTES)
+
+
+def get_recent_weather(station_id, lookback_hours=None, end_time=None, dynamodb=None):
+    """Get one station's weather observations for the lookback window"""
+    dynamodb = dynamodb or get_resource('dynamodb')
+    end_time = end_time or datetime.now(timezone.utc)
+    start_time = end_time - timedelta(hours=get_lookback_hours(lookback_hours))
+
+    return query_time_window(dynamodb.Table(NOAA_TABLE), 'station_id', station_id,
+                             start_time, end_time, WEATHER_ATTRIBUTES)
+
+
+def get_latest_timestamp(table, key_name, key_value):
+    """Get the newest stored timestamp for one partition (None if empty)"""
+    response = table.query(
+        KeyConditionExpression='#key = :key',
+        ExpressionAttributeNames={'#key': key_name, '#ts': 'timestamp'},
+        ExpressionAttributeValues={':key': key_value},
+        ProjectionExpression='#ts',
+        ScanIndexForward=False,
+        Limit=1
+    )
+    items = response.get('Items', [])
+    return items[0]['timestamp'] if items else None
+
+
+def get_latest_bucket_timestamp(table, gauge_id):
+    """Get the newest reading time stored in a gauge's buckets (None if empty)"""
+    response = table.query(
+        KeyConditionExpression='gauge_id = :key',
+        ExpressionAttributeValues={':key': gauge_id},
+        ProjectionExpression='last_time',
+        ScanIndexForward=False,
+        Limit=1
+    )
+    items = response.get('Items', [])
+    return items[0]['last_time'] if items else None
+
+
+def filter_new_items(items, key_name, latest_timestamps):
+    """Drop items at or below their partition's last stored timestamp"""
+    cutoffs = {}
+    for key_value, latest in latest_timestamps.items():
+        if latest:
+            cutoffs[key_value] = parse_timestamp(latest)
+
+    new_items = []
+    for item in items:
+        cutoff = cutoffs.get(item[key_name])
+        if cutoff is None or parse_timestamp(item['timestamp']) > cutoff:
+            new_items.append(item)
+    return new_items
+
+
+def batch_write_items(table, items, key_names, max_retries=8):
+    """
+    Write items with BatchWriteItem (25 per request)
+
+    Unprocessed items are retried with exponential backoff. Duplicate keys
+    are collapsed first since DynamoDB rejects them within one batch.
+    Returns the number of items written.
+    """
+    unique = {}
+    for item in items:
+        unique[tuple(item[name] for name in key_names)] = item
+    pending = [{'PutRequest': {'Item': item}} for item in unique.values()]
+
+    client = table.meta.client
+    written = 0
+    for start in range(0, len(pending), 25):
+        requests_batch = pending[start:start + 25]
+        attempt = 0
+        while requests_batch:
+            response = client.batch_write_item(RequestItems={table.name: requests_batch})
+            unprocessed = response.get('UnprocessedItems', {}).get(table.name, [])
+            written += len(requests_batch) - len(unprocessed)
+            requests_batch = unprocessed
+            if requests_batch:
+                attempt += 1
+                if attempt > max_retries:
+                    raise RuntimeError(f"{len(requests_batch)} items still unprocessed "
+                                       f"after {max_retries} retries")
+                time.sleep(min(0.05 * (2 ** attempt), 2.0))
+    return written
+
+
+def write_gauge_buckets(table, items, bucket_hours=None, cache=None):
+    """
+    Merge reading items into their gauge buckets and write the changed buckets
+
+    Each affected bucket is read once, merged with the new readings and put
+    back whole, so a gauge's buckets must have a single writer (the
+    collector chunk that owns the gauge). cache maps (gauge_id, key) to
+    the bucket's readings and saves the re-read when the same caller
+    flushes into a bucket again. Returns the number of readings added.
+    """
+    bucket_hours = bucket_hours or get_bucket_hours()
+    cache = {} if cache is None else cache
+
+    groups = {}
+    attributes = {}
+    for item in items:
+        epoch = int(parse_timestamp(item['timestamp']).timestamp())
+        bucket = (item['gauge_id'], bucket_key(bucket_start(epoch, bucket_hours)))
+        groups.setdefault(bucket, []).append((epoch, item['water_level'], item.get('rate_of_rise'),
+                                              item.get('trend')))
+        shared = attributes.setdefault(bucket, {})
+        for name in ('flood_stage', 'location_name', 'ttl'):
+            if name in item:
+                shared[name] = item[name]
+
+    missing = [bucket for bucket in groups if bucket not in cache]
+    if missing:
+        for bucket in missing:
+            cache[bucket] = []
+        for stored in batch_get_items(table, [{'gauge_id': gauge_id, 'timestamp': key}
+                                              for gauge_id, key in missing]):
+            cache[(stored['gauge_id'], stored['timestamp'])] = unpack_readings(stored)
+
+    added = 0
+    bucket_items = []
+    for (gauge_id, key), readings in groups.items():
+        existing = cache[(gauge_id, key)]
+        merged = merge_readings(existing, sorted(readings, key=lambda reading: reading[0]))
+        added += len(merged) - len(existing)
+        cache[(gauge_id, key)] = merged
+        bucket_items.append(build_bucket_item(gauge_id, key, merged, attributes[(gauge_id, key)]))
+
+    batch_write_items(table, bucket_items, ('gauge_id', 'timestamp'))
+    return added
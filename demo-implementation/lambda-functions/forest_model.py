@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Compiled Forest Model
+Flattens a trained scikit-learn forest (and the pipeline scaler) into flat
+NumPy arrays in one memory-mapped file, and scores it with plain NumPy so
+the predictor needs neither joblib nor scikit-learn
+
+Every tree's nodes are stored back to back: split feature, threshold, the
+two child node indices and the class 1 probability of the node, plus each
+tree's root. Leaves point to themselves, so a walk that reaches a leaf
+early simply stays there. The file is an 8 byte magic, a length-prefixed
+JSON header (feature names, scaler, array offsets) and the arrays, each
+64-byte aligned, so loading maps the file instead of reading it.
+
+Evaluation reproduces RandomForestClassifier.predict_proba bit for bit:
+inputs are cast to float32 before comparing against the float64 thresholds,
+leaf values are normalized the way DecisionTreeClassifier does, and tree
+probabilities are summed in tree order before dividing by the tree count.
+"""
+
+import json
+import os
+import struct
+import numpy as np
+from datetime import datetime, timezone
+
+MAGIC = b'FLFOREST'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+# sklearn's marker for a missing child (leaf)
+NO_CHILD = -1
+
+# (tree, row) pairs walked together - small enough for the working arrays to stay in cache
+DEFAULT_CHUNK_PAIRS = 1 << 16
+
+# Levels between dropping finished walks; only deep trees get that far
+COMPACT_LEVELS = 8
+
+ARRAY_DTYPES = {
+    'feature': '<i4',
+    'threshold': '<f8',
+    'children': '<i4',
+    'value': '<f8',
+    'missing_left': 'u1',
+    'roots': '<i4'
+}
+
+def compile_forest(model):
+    """
+    Flat arrays for a fitted forest (or single tree) of classification trees
+    
+    Trees are concatenated in estimator order; child indices point into the
+    concatenated arrays. value holds each node's class 1 probability (all
+    zero when the model never saw class 1).
+    """
+    trees = getattr(model, 'estimators_', [model])
+    classes = [int(label) if float(label).is_integer() else label for label in model.classes_]
+    if getattr(model, 'n_outputs_', 1) != 1:
+        raise ValueError("Only single-output classifiers can be compiled")
+    positive = classes.index(1) if 1 in classes else None
+    
+    parts = {name: [] for name in ARRAY_DTYPES}
+    offset = 0
+    max_depth = 0
+    for estimator in trees:
+        tree = estimator.tree_
+        leaf = tree.children_left == NO_CHILD
+        nodes = np.arange(tree.node_count) + offset
+        parts['roots'].append([offset])
+        parts['feature'].append(np.where(leaf, 0, tree.feature))
+        parts['threshold'].append(np.where(leaf, 0.0, tree.threshold))
+        parts['children'].append(np.stack([np.where(leaf, nodes, tree.children_left + offset),
+                                           np.where(leaf, nodes, tree.children_right + offset)], axis=1))
+        
+        # Same normalization as DecisionTreeClassifier.predict_proba
+        proba = tree.value[:, 0, :len(classes)].astype(np.float64)
+        normalizer = proba.sum(axis=1)
+        normalizer[normalizer == 0.0] = 1.0
+        values = proba[:, positive] / normalizer if positive is not None else np.zeros(tree.node_count)
+        parts['value'].append(values)
+        
+        missing_left = getattr(tree, 'missing_go_to_left', None)
+        parts['missing_left'].append(np.zeros(tree.node_count) if missing_left is None else missing_left)
+        offset += tree.node_count
+        max_depth = max(max_depth, int(tree.max_depth))
+    
+    forest = {name: np.ascontiguousarray(np.concatenate(parts[name]), dtype=dtype)
+              for name, dtype in ARRAY_DTYPES.items()}
+    forest.update(n_trees=len(trees), max_depth=max_depth, n_features=int(model.n_features_in_),
+                  classes=classes)
+    return forest
+
+def export_forest(artifact, path):
+    """
+    Write a pipeline artifact (feature list, scaler, forest) as one compiled file
+    
+    Returns the number of bytes written. The file is written beside path
+    and renamed into place, so readers never see a partial file.
+    """
+    forest = compile_forest(artifact['model'])
+    if forest['n_features'] != len(artifact['feature_names']):
+        raise ValueError(f"Model expects {forest['n_features']} features, "
+                         f"artifact lists {len(artifact['feature_names'])}")
+    
+    header = {
+        'format': FORMAT_VERSION,
+        'pipeline_version': artifact['version'],
+        'feature_names': list(artifact['feature_names']),
+        'scaler_mean': [float(value) for value in artifact['scaler_mean']],
+        'scaler_scale': [float(value) for value in artifact['scaler_scale']],
+        'n_trees': forest['n_trees'],
+        'max_depth': forest['max_depth'],
+        'classes': forest['classes'],
+        'created_at': artifact.get('created_at'),
+        'compiled_at': datetime.now(timezone.utc).isoformat(),
+        'metadata': artifact.get('metadata') or {},
+        'arrays': {}
+    }
+    
+    # Offsets are relative to the end of the header, which is padded to ALIGNMENT
+    offset = 0
+    for name in ARRAY_DTYPES:
+        array = forest[name]
+        header['arrays'][name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header_bytes = json.dumps(header, separators=(',', ':'), default=str).encode('utf-8')
+    data_start = -(-(len(MAGIC) + 4 + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+    
+    partial_path = path + '.partial'
+    with open(partial_path, 'wb') as f:
+        f.write(MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes)
+        for name in ARRAY_DTYPES:
+            f.seek(data_start + header['arrays'][name]['offset'])
+            f.write(forest[name].tobytes())
+        f.truncate(data_start + offset)
+    os.replace(partial_path, path)
+    return data_start + offset
+
+def load_forest(path):
+    """
+    Pipeline artifact dict backed by a compiled forest file
+    
+    Arrays are read-only views of a memory map, so only the pages a
+    prediction touches are read from disk. The artifact works anywhere a
+    joblib pipeline artifact does (feature_pipeline.predict_proba).
+    """
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    if bytes(data[:len(MAGIC)]) != MAGIC:
+        raise ValueError(f"{path} is not a compiled forest file")
+    header_size = struct.unpack('<I', bytes(data[len(MAGIC):len(MAGIC) + 4]))[0]
+    header_end = len(MAGIC) + 4 + header_size
+    header = json.loads(bytes(data[len(MAGIC) + 4:header_end]).decode('utf-8'))
+    if header.get('format') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported compiled forest format: {header.get('format')}")
+    data_start = -(-header_end // ALIGNMENT) * ALIGNMENT
+    
+    forest = {'n_trees': header['n_trees'], 'max_depth': header['max_depth'], 'classes': header['classes'],
+              'n_features': len(header['feature_names'])}
+    for name, spec in header['arrays'].items():
+        dtype = np.dtype(spec['dtype'])
+        start = data_start + spec['offset']
+        count = int(np.prod(spec['shape'], dtype=np.int64))
+        forest[name] = data[start:start + count * dtype.itemsize].view(dtype).reshape(spec['shape'])
+    forest['leaf'] = forest['children'][:, 0] == np.arange(len(forest['children']))
+    
+    return {
+        'version': header['pipeline_version'],
+        'feature_names': header['feature_names'],
+        'scaler_mean': np.array(header['scaler_mean']),
+        'scaler_scale': np.array(header['scaler_scale']),
+        'model': forest,
+        'created_at': header.get('created_at'),
+        'metadata': dict(header.get('metadata') or {}, compiled_at=header.get('compiled_at'))
+    }
+
+def forest_proba(forest, X, chunk_pairs=DEFAULT_CHUNK_PAIRS):
+    """
+    Class 1 probability for every row of an (already scaled) feature matrix
+    
+    All (tree, row) pairs of a chunk descend one level per step for
+    max_depth steps. Every COMPACT_LEVELS levels the pairs already at a
+    leaf are dropped, so deep, uneven trees stop paying for short paths.
+    """
+    X = np.asarray(X)
+    if X.ndim != 2 or X.shape[1] != forest['n_features']:
+        raise ValueError(f"Expected {forest['n_features']} features, got shape {X.shape}")
+    # Trees compare float32 inputs with float64 thresholds, as sklearn does
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    feature = forest['feature']
+    threshold = forest['threshold']
+    children = forest['children'].reshape(-1)
+    leaf = forest.get('leaf')
+    if leaf is None:
+        leaf = forest['children'][:, 0] == np.arange(len(forest['children']))
+    n_trees = forest['n_trees']
+    n_features = X.shape[1]
+    
+    probabilities = np.empty(len(X))
+    chunk_rows = max(chunk_pairs // n_trees, 1)
+    for start in range(0, len(X), chunk_rows):
+        flat = X[start:start + chunk_rows].reshape(-1)
+        rows = len(flat) // n_features
+        # NaN fails every <= test and goes right unless the split learned otherwise
+        missing = np.isnan(flat).any()
+        
+        # Tree-major: pair t * rows + r is tree t on row r
+        node = np.repeat(forest['roots'], rows)
+        cell = np.tile(np.arange(rows, dtype=np.int32) * n_features, n_trees)
+        active = None
+        for level in range(forest['max_depth']):
+            if level and level % COMPACT_LEVELS == 0:
+                active = np.flatnonzero(~leaf[node]) if active is None else active[~leaf[node[active]]]
+                if not len(active):
+                    break
+            current = node if active is None else node[active]
+            values = flat[(cell if active is None else cell[active]) + feature[current]]
+            if missing:
+                go_right = ~(values <= threshold[current])
+                go_right &= ~(np.isnan(values) & forest['missing_left'][current].astype(bool))
+            else:
+                go_right = values > threshold[current]
+            current = children[current * 2 + go_right]
+            if active is None:
+                node = current
+            else:
+                node[active] = current
+        
+        leaf_values = forest['value'][node].reshape(n_trees, rows)
+        total = np.zeros(rows)
+        for tree_values in leaf_values:
+            total += tree_values
+        probabilities[start:start + rows] = total / n_trees
+    return probabilities
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Handler Instrumentation
+Per-phase timings and counts emitted as CloudWatch Embedded Metric Format,
+plus level-controlled, sampled debug logging
+
+Shared by all Lambda handlers. Wrap a handler with @instrumented('name'),
+time its phases (fetch, parse, write, query, feature_build, predict,
+publish) with `with phase('fetch'):` and count work with add_count().
+One EMF line is printed per invocation, which CloudWatch turns into metrics
+without any PutMetricData calls.
+
+Debug output is off unless LOG_LEVEL=DEBUG, and then only for a
+DEBUG_SAMPLE_RATE fraction of invocations. When off, debug() returns before
+formatting anything, so pass callables for anything expensive to build.
+"""
+
+import functools
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'FloodMonitoring')
+
+LOG_LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+
+# Per-invocation state; collectors record phases from worker threads
+_lock = threading.Lock()
+_timings = {}
+_counts = {}
+_debug_sampled = False
+
+def get_log_level():
+    """Numeric level from LOG_LEVEL (default INFO)"""
+    return LOG_LEVELS.get(os.environ.get('LOG_LEVEL', 'INFO').upper(), LOG_LEVELS['INFO'])
+
+def start_invocation():
+    """Reset metrics and decide whether this invocation logs at debug level"""
+    global _debug_sampled
+    
+    with _lock:
+        _timings.clear()
+        _counts.clear()
+    
+    sample_rate = float(os.environ.get('DEBUG_SAMPLE_RATE', 1.0))
+    _debug_sampled = get_log_level() <= LOG_LEVELS['DEBUG'] and random.random() < sample_rate
+
+def debug_enabled():
+    """True when this invocation was sampled for debug logging"""
+    return _debug_sampled
+
+def debug(message):
+    """
+    Print a debug line if this invocation is sampled
+    
+    message may be a string or a zero-argument callable returning one; the
+    callable is only invoked when debug logging is on.
+    """
+    if not _debug_sampled:
+        return
+    print(message() if callable(message) else message)
+
+def add_timing(name, milliseconds):
+    """Add time (ms) to a phase; phases run by several workers accumulate"""
+    with _lock:
+        _timings[name] = _timings.get(name, 0.0) + milliseconds
+
+def add_count(name, value=1):
+    """Add to a per-invocation count"""
+    with _lock:
+        _counts[name] = _counts.get(name, 0) + value
+
+@contextmanager
+def phase(name):
+    """Time the enclosed block as one phase"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(name, (time.perf_counter() - started) * 1000)
+
+def build_metrics_record(function_name, status_code=None):
+    """EMF record for the current invocation"""
+    with _lock:
+        timings = {f'{name}_ms': round(value, 2) for name, value in _timings.items()}
+        counts = dict(_counts)
+    
+    metrics = [{'Name': name, 'Unit': 'Milliseconds'} for name in timings]
+    metrics += [{'Name': name, 'Unit': 'Count'} for name in counts]
+    
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': NAMESPACE,
+                'Dimensions': [['FunctionName']],
+                'Metrics': metrics
+            }]
+        },
+        'FunctionName': function_name
+    }
+    record.update(timings)
+    record.update(counts)
+    if status_code is not None:
+        record['status_code'] = status_code
+    return record
+
+def emit_metrics(function_name, status_code=None):
+    """Print the EMF record (one line, as CloudWatch expects)"""
+    print(json.dumps(build_metrics_record(function_name, status_code)))
+
+def instrumented(function_name):
+    """
+    Decorator for lambda_handler: resets metrics, times the whole invocation
+    and emits the EMF record however the handler returns
+    """
+    def decorate(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            start_invocation()
+            started = time.perf_counter()
+            response = None
+            try:
+                response = handler(event, context)
+                return response
+            finally:
+                add_timing('total', (time.perf_counter() - started) * 1000)
+                status_code = response.get('statusCode') if isinstance(response, dict) else None
+                emit_metrics(function_name, status_code)
+        return wrapper
+    return decorate
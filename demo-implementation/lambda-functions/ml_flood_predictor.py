@@ -4,9 +4,16 @@ ML Flood Predictor Lambda Function
 Uses machine learning to predict flood probability
 """
 
+import time
+
+# Cold start bookkeeping - per-phase init times (ms) reported on first use
+_module_start = time.perf_counter()
+init_timings = {}
+init_reported = False
+
 import json
-import boto3
-from datetime import datetime, timedelta
+from botocore.exceptions import ClientError
+from datetime import datetime
 import os
 
 # Import numpy only when needed (not for demo mode)
@@ -16,39 +23,160 @@ except ImportError:
     np = None
 from decimal import Decimal
 
-# Global model variable for caching
+from alert_state import evaluate_alerts, load_alert_states, save_alert_states
+from aws_runtime import get_client, get_resource
+from concurrent_fetch import run_all
+from flood_data_access import get_recent_gauge_readings, get_recent_weather
+from instrumentation import add_count, debug, debug_enabled, instrumented, phase
+from monitoring_config import get_gauge_station_pairs, get_pairs_for_gauges
+from stream_events import claim_gauges, is_stream_event, touched_gauges
+
+# /tmp copies of the model files, reused while their ETags are unchanged
+MODEL_PATH = '/tmp/model.joblib'
+FEATURES_PATH = '/tmp/features.json'
+PIPELINE_PATH = '/tmp/flood_pipeline.joblib'
+FOREST_PATH = '/tmp/flood_forest.bin'
+
+# Global pipeline artifact (or "threshold") for caching
 model = None
 feature_columns = None
 
-def load_model():
-    """Load ML model from S3 (cached)"""
+# SNS caps a message at 256 KB; batched alerts are split below that
+MAX_MESSAGE_BYTES = 240 * 1024
+
+# Cached across warm invocations instead of calling STS every run
+account_id = None
+topic_arns = None
+
+def record_phase(phase, started):
+    """Record how long an init phase took (ms)"""
+    init_timings[phase] = round((time.perf_counter() - started) * 1000, 1)
+
+record_phase('imports', _module_start)
+
+def get_account_id(context=None):
+    """Account ID from AWS_ACCOUNT_ID, the invoked function ARN, or STS (once)"""
+    global account_id
+    
+    if account_id is None:
+        started = time.perf_counter()
+        account_id = os.environ.get('AWS_ACCOUNT_ID')
+        
+        function_arn = getattr(context, 'invoked_function_arn', None)
+        if not account_id and function_arn:
+            # arn:aws:lambda:<region>:<account>:function:<name>
+            account_id = function_arn.split(':')[4]
+        
+        if not account_id:
+            sts = get_client('sts')
+            account_id = sts.get_caller_identity()['Account']
+        record_phase('account_id', started)
+    
+    return account_id
+
+def get_topic_arns(context=None):
+    """SNS topic ARN per alert level, from EMERGENCY/WARNING/WATCH_TOPIC when set"""
+    global topic_arns
+    
+    if topic_arns is None:
+        region = os.environ.get('AWS_REGION', 'us-east-1')
+        topic_arns = {}
+        for alert_level in ('EMERGENCY', 'WARNING', 'WATCH'):
+            topic_arn = os.environ.get(f'{alert_level}_TOPIC')
+            if not topic_arn:
+                topic_arn = f"arn:aws:sns:{region}:{get_account_id(context)}:flood-alerts-{alert_level.lower()}"
+            topic_arns[alert_level] = topic_arn
+    
+    return topic_arns
+
+def download_if_changed(s3, bucket_name, key, path):
+    """
+    Download an S3 object unless the /tmp copy has the same ETag
+    
+    Uses a conditional GET (If-None-Match), so an unchanged model costs one
+    round trip and no transfer. Returns True if a new copy was written.
+    """
+    etag_path = path + '.etag'
+    params = {'Bucket': bucket_name, 'Key': key}
+    if os.path.exists(path) and os.path.exists(etag_path):
+        with open(etag_path, 'r') as f:
+            params['IfNoneMatch'] = f.read().strip()
+    
+    try:
+        response = s3.get_object(**params)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('304', 'NotModified'):
+            return False
+        raise
+    
+    # Write to a temp file first so a failed download never leaves a torn copy
+    partial_path = path + '.partial'
+    with open(partial_path, 'wb') as f:
+        for chunk in response['Body'].iter_chunks(1024 * 1024):
+            f.write(chunk)
+    os.replace(partial_path, path)
+    
+    with open(etag_path, 'w') as f:
+        f.write(response['ETag'])
+    return True
+
+def load_model(context=None):
+    """
+    Load the feature pipeline artifact from S3 (cached, reusing /tmp copies
+    with unchanged ETags)
+    
+    The compiled forest file is preferred - it is memory-mapped and scored
+    with NumPy alone. Otherwise the joblib artifact bundles the feature
+    list, scaler and model, and buckets that only hold the older bare model
+    + model_features.json still load, unscaled.
+    """
     global model, feature_columns
     
     if model is None:
         try:
-            import joblib
-            s3 = boto3.client('s3')
+            started = time.perf_counter()
+            s3 = get_client('s3')
+            bucket_name = os.environ.get('S3_BUCKET') or \
+                f'flood-prediction-models-{get_account_id(context)}'
             
-            # Get account ID for bucket name
-            sts = boto3.client('sts')
-            account_id = sts.get_caller_identity()['Account']
-            bucket_name = f'flood-prediction-models-{account_id}'
-            
-            # Download model from S3
-            s3.download_file(bucket_name, 
-                            'models/flood_prediction_model.joblib', 
-                            '/tmp/model.joblib')
+            from feature_pipeline import ARTIFACT_KEY, FOREST_KEY, MODEL_FEATURES_KEY, MODEL_KEY
             
-            # Download feature list
-            s3.download_file(bucket_name,
-                            'models/model_features.json',
-                            '/tmp/features.json')
+            # Download the newest format present (skipped when unchanged)
+            kind = None
+            for candidate, key, path in (('forest', FOREST_KEY, FOREST_PATH),
+                                         ('pipeline', ARTIFACT_KEY, PIPELINE_PATH),
+                                         ('legacy', MODEL_KEY, MODEL_PATH)):
+                try:
+                    downloaded = download_if_changed(s3, bucket_name, key, path)
+                except ClientError as e:
+                    if e.response.get('Error', {}).get('Code') not in ('NoSuchKey', '404'):
+                        raise
+                    continue
+                kind = candidate
+                break
+            if kind is None:
+                raise FileNotFoundError(f"No model in s3://{bucket_name}/models/")
+            if kind == 'legacy':
+                download_if_changed(s3, bucket_name, MODEL_FEATURES_KEY, FEATURES_PATH)
+            record_phase('model_download' if downloaded else 'model_revalidate', started)
             
-            model = joblib.load('/tmp/model.joblib')
+            started = time.perf_counter()
+            if kind == 'forest':
+                from forest_model import load_forest
+                model = load_forest(FOREST_PATH)
+            elif kind == 'pipeline':
+                # joblib/sklearn are only imported for a joblib artifact
+                from feature_pipeline import load_artifact
+                model = load_artifact(PIPELINE_PATH)
+            else:
+                import joblib
+                from feature_pipeline import wrap_legacy_model
+                with open(FEATURES_PATH, 'r') as f:
+                    model = wrap_legacy_model(joblib.load(MODEL_PATH), json.load(f))
+            record_phase('model_deserialize', started)
             
-            with open('/tmp/features.json', 'r') as f:
-                feature_columns = json.load(f)
-                
+            feature_columns = model['feature_names']
+        
         except Exception as e:
             print(f"Could not load ML model: {e}")
             # Use simple threshold model as fallback
@@ -57,125 +185,356 @@ def load_model():
     
     return model, feature_columns
 
-def get_recent_data():
+def report_init_timings():
+    """Init phase timings, returned once per execution environment"""
+    global init_reported
+    
+    if init_reported:
+        return None
+    init_reported = True
+    print(json.dumps({'init_timings_ms': init_timings}))
+    return dict(init_timings)
+
+def get_recent_data(gauge_id='01646500', station_id='KDCA', lookback_hours=None):
     """Get recent USGS and NOAA data for prediction"""
-    dynamodb = boto3.resource('dynamodb')
+    dynamodb = get_resource('dynamodb')
     
-    # Get recent USGS data (last 24 hours)
-    usgs_table = dynamodb.Table('FloodGaugeReadings')
-    noaa_table = dynamodb.Table('WeatherObservations')
+    # Query only the lookback window (default last 24 hours) for
+    # Chain Bridge gauge (01646500) and its paired weather station
+    usgs_data = get_recent_gauge_readings(gauge_id, lookback_hours, dynamodb=dynamodb)
+    noaa_data = get_recent_weather(station_id, lookback_hours, dynamodb=dynamodb)
     
-    # Query for Chain Bridge gauge (01646500)
-    end_time = datetime.utcnow()
-    start_time = end_time - timedelta(hours=24)
+    return usgs_data, noaa_data
+
+def get_batch_data(pairs, lookback_hours=None):
+    """
+    Get recent data for every (gauge_id, station_id) pair
     
-    # Simplified - in production would do proper time-based queries
-    usgs_response = usgs_table.scan(
-        FilterExpression='gauge_id = :gauge_id',
-        ExpressionAttributeValues={':gauge_id': '01646500'}
-    )
+    Each gauge and each distinct station is queried once, in parallel.
+    Returns one dict per pair with gauge_id, station_id, usgs_data and noaa_data.
+    """
+    dynamodb = get_resource('dynamodb')
+    gauge_ids = list(dict.fromkeys(gauge_id for gauge_id, _ in pairs))
+    station_ids = list(dict.fromkeys(station_id for _, station_id in pairs))
     
-    noaa_response = noaa_table.scan(
-        FilterExpression='station_id = :station_id',
-        ExpressionAttributeValues={':station_id': 'KDCA'}
-    )
+    queries = [('gauge', gauge_id) for gauge_id in gauge_ids] + \
+              [('station', station_id) for station_id in station_ids]
     
-    return usgs_response['Items'], noaa_response['Items']
-
-def create_features(usgs_data, noaa_data):
-    """Create ML features from recent data"""
-    
-    # Sort by timestamp
-    usgs_sorted = sorted(usgs_data, key=lambda x: x['timestamp'])
-    noaa_sorted = sorted(noaa_data, key=lambda x: x['timestamp'])
-    
-    if not usgs_sorted or not noaa_sorted:
-        # Return default features if no data
-        return np.array([[5.0, 4.8, 4.5, 0.2, 0.5, 0.1, 0.3, 0.8, 0.5, 12, 180, 6]])
-    
-    # Get latest readings
-    latest_usgs = usgs_sorted[-1]
-    latest_noaa = noaa_sorted[-1]
-    
-    # Create feature vector (simplified)
-    features = [
-        float(latest_usgs.get('water_level', 5.0)),
-        float(latest_usgs.get('water_level', 5.0)) - 0.2,  # lag_1h (simplified)
-        float(latest_usgs.get('water_level', 5.0)) - 0.5,  # lag_6h (simplified)
-        0.2,  # water_level_change_1h (would calculate from historical)
-        0.5,  # water_level_change_6h (would calculate from historical)
-        float(latest_noaa.get('precipitation_1hr', 0.1)),
-        0.3,  # precip_cumulative_6h (would calculate)
-        0.8,  # precip_cumulative_24h (would calculate)
-        float(latest_noaa.get('precipitation_forecast_24hr', 0.5)),
-        datetime.now().hour,
-        datetime.now().timetuple().tm_yday,
-        datetime.now().month
-    ]
+    def run_query(query):
+        kind, key = query
+        if kind == 'gauge':
+            return get_recent_gauge_readings(key, lookback_hours, dynamodb=dynamodb)
+        return get_recent_weather(key, lookback_hours, dynamodb=dynamodb)
     
-    return np.array([features])
+    outcomes = run_all(run_query, queries, max_workers=16)
+    
+    results = {}
+    for query, outcome in zip(queries, outcomes):
+        if 'error' in outcome:
+            print(f"Error loading {query[0]} {query[1]}: {outcome['error']}")
+            results[query] = []
+        else:
+            results[query] = outcome['result']
+    
+    return [
+        {
+            'gauge_id': gauge_id,
+            'station_id': station_id,
+            'usgs_data': results[('gauge', gauge_id)],
+            'noaa_data': results[('station', station_id)]
+        }
+        for gauge_id, station_id in pairs
+    ]
 
-def predict_flood_probability(usgs_data, noaa_data):
-    """Predict flood probability using ML model or threshold"""
+def create_features(usgs_data, noaa_data, feature_names=None):
+    """Create ML features from recent data (one row, in model_features.json order)"""
+    # Imported here so demo mode does not need numpy
+    from feature_engine import build_feature_row
     
-    print(f"=== PREDICTION DEBUG START ===")
-    print(f"USGS data count: {len(usgs_data)}")
-    print(f"NOAA data count: {len(noaa_data)}")
+    return build_feature_row(usgs_data, noaa_data, feature_names or feature_columns or None)
+
+def describe_model(flood_model):
+    """Short model name for logs and responses"""
+    if flood_model == "threshold":
+        return 'threshold'
+    kind = 'compiled forest' if isinstance(flood_model['model'], dict) else 'pipeline'
+    return f"{kind} v{flood_model['version']}"
+
+def threshold_probabilities(water_levels, flood_stages):
+    """Vectorized threshold model based on proximity to flood stage"""
+    ratios = water_levels / flood_stages
+    return np.select([ratios > 0.9, ratios > 0.7], [0.8, 0.4], default=0.1)
+
+def predict_flood_probabilities(batch, context=None):
+    """Predict flood probability for every gauge in the batch (one model call)"""
     
-    flood_model, features = load_model()
-    print(f"Model type: {flood_model}")
+    flood_model, features = load_model(context)
+    if flood_model == "threshold":
+        print(f"Model type: threshold ({len(batch)} gauges)")
+    else:
+        print(f"Model type: {describe_model(flood_model)} ({len(features)} features, {len(batch)} gauges)")
     
     if flood_model == "threshold":
         # Simple threshold-based prediction as fallback
-        if usgs_data:
-            print(f"Processing {len(usgs_data)} USGS records")
+        with phase('feature_build'):
+            water_levels = np.full(len(batch), np.nan)
+            flood_stages = np.full(len(batch), 10.0)
             
-            # Debug: print all USGS data
-            for idx, record in enumerate(usgs_data):
-                print(f"USGS Record {idx}: {json.dumps(record, default=str)}")
-            
-            latest_usgs = sorted(usgs_data, key=lambda x: x['timestamp'])[-1]
-            print(f"Latest USGS record: {json.dumps(latest_usgs, default=str)}")
-            
-            water_level = float(latest_usgs.get('water_level', 5.0))
-            flood_stage = float(latest_usgs.get('flood_stage', 10.0))
+            missing = []
+            for row, entry in enumerate(batch):
+                usgs_data = entry['usgs_data']
+                if not usgs_data:
+                    missing.append(entry['gauge_id'])
+                    continue
+                
+                latest_usgs = max(usgs_data, key=lambda x: x['timestamp'])
+                water_levels[row] = float(latest_usgs.get('water_level', 5.0))
+                flood_stages[row] = float(latest_usgs.get('flood_stage', 10.0))
+                
+                # Latest reading only - the full series would scale log volume with the table
+                debug(lambda: f"Gauge {entry['gauge_id']}: {len(usgs_data)} readings, latest "
+                              f"{json.dumps(latest_usgs, default=str)}")
             
-            print(f"Threshold mode - Water level: {water_level} feet, Flood stage: {flood_stage} feet")
+            if missing:
+                print(f"No USGS data for {len(missing)} gauges - using default 10% probability")
+                debug(lambda: f"Gauges without data: {', '.join(missing)}")
+        
+        with phase('predict'):
+            probabilities = threshold_probabilities(water_levels, flood_stages)
             
-            # Simple probability based on proximity to flood stage
-            ratio = water_level / flood_stage
-            print(f"Ratio: {ratio:.2%} ({ratio})")
+            # Gauges without data keep the default 10% probability
+            probabilities[np.isnan(water_levels)] = 0.1
+    else:
+        # Use ML model - one feature row per gauge, scaled and scored in a single call
+        from feature_pipeline import build_inference_matrix, predict_proba
+        
+        with phase('feature_build'):
+            feature_matrix = build_inference_matrix(flood_model, batch)
+        with phase('predict'):
+            probabilities = predict_proba(flood_model, feature_matrix)
+        
+        if debug_enabled():
+            for entry, row in zip(batch, feature_matrix):
+                print(f"Gauge {entry['gauge_id']} features: "
+                      f"{dict(zip(features, (round(float(value), 4) for value in row)))}")
+    
+    debug(lambda: f"Calculated probabilities: {[round(float(p), 3) for p in probabilities]}")
+    return probabilities
+
+def sweep_scenarios(spec, context=None):
+    """
+    What-if sweep through the same model (or threshold path) as live scoring
+    
+    Returns the scenario_sweep summary; no data is read and nothing is published.
+    """
+    from feature_engine import scenario_features
+    from scenario_sweep import run_sweep
+    
+    # Reject a malformed spec before loading the model
+    if not isinstance(spec, dict):
+        raise ValueError(f"Sweep spec must be an object of axes, got {type(spec).__name__}")
+    flood_model, features = load_model(context)
+    model_name = describe_model(flood_model)
+    if flood_model == "threshold":
+        def score(inputs, query_time):
+            return threshold_probabilities(inputs['water_level'], inputs['flood_stage'])
+    else:
+        from feature_pipeline import predict_proba
+        
+        def score(inputs, query_time):
+            return predict_proba(flood_model, scenario_features(features, inputs, query_time))
+    
+    with phase('predict'):
+        body = run_sweep(spec, score)
+    print(f"Scenario sweep: {body['scenarios']} scenarios with {model_name} model in {body['elapsed_ms']} ms")
+    add_count('scenarios', body['scenarios'])
+    body.update({'scenario_sweep': True, 'model': model_name, 'timestamp': datetime.utcnow().isoformat()})
+    return body
+
+def predict_flood_probability(usgs_data, noaa_data):
+    """Predict flood probability using ML model or threshold"""
+    batch = [{'gauge_id': '01646500', 'station_id': 'KDCA',
+              'usgs_data': usgs_data, 'noaa_data': noaa_data}]
+    return float(predict_flood_probabilities(batch)[0])
+
+def alert_message(decision):
+    """One line of alert text for a gauge decision"""
+    gauge_id = decision['gauge_id']
+    probability = decision['probability']
+    if decision['reason'] == 'cleared':
+        return (f"CLEARED: gauge {gauge_id} is back to normal - {probability:.1%} flood probability "
+                f"(was {decision['previous_level']})")
+    prefix = "REMINDER - " if decision['reason'] == 'reminder' else ""
+    return f"{prefix}{decision['level']}: ML model predicts {probability:.1%} flood probability in next 6 hours at gauge {gauge_id}"
+
+def latest_trend(usgs_data):
+    """Trend and rate of rise (ft/hr) stored with the newest reading, computed at ingest"""
+    if not usgs_data:
+        return None, None
+    latest = max(usgs_data, key=lambda item: item['timestamp'])
+    rate = latest.get('rate_of_rise')
+    return latest.get('trend'), float(rate) if rate is not None else None
+
+def split_messages(lines, max_bytes=MAX_MESSAGE_BYTES):
+    """Group message lines into as few messages as fit under the SNS size limit"""
+    messages = []
+    current = []
+    size = 0
+    for line in lines:
+        line_size = len(line.encode('utf-8')) + 1
+        if current and size + line_size > max_bytes:
+            messages.append(current)
+            current = []
+            size = 0
+        current.append(line)
+        size += line_size
+    if current:
+        messages.append(current)
+    return messages
+
+def publish_alerts(decisions, topic_arns):
+    """
+    Send every notification from this run with one publish per topic
+    
+    Clear notices go to the topic of the alert being cleared. Returns the
+    gauge_ids whose notification was delivered to SNS.
+    """
+    by_topic = {}
+    for decision in decisions:
+        if decision['reason']:
+            topic_level = decision['previous_level'] if decision['reason'] == 'cleared' else decision['level']
+            by_topic.setdefault(topic_level, []).append(decision)
+    
+    notified = set()
+    for topic_level, group in by_topic.items():
+        lines = [alert_message(decision) for decision in group]
+        offset = 0
+        for message_lines in split_messages(lines):
+            gauges = group[offset:offset + len(message_lines)]
+            offset += len(message_lines)
             
-            if ratio > 0.9:
-                probability = 0.8  # High probability
-                print(f"Ratio > 0.9, setting probability to 0.8")
-            elif ratio > 0.7:
-                probability = 0.4  # Medium probability
-                print(f"Ratio > 0.7, setting probability to 0.4")
+            if len(gauges) == 1 and gauges[0]['reason'] == 'cleared':
+                subject = f'Potomac River Flood {topic_level} Cleared'
+            elif len(gauges) == 1:
+                subject = f'Potomac River Flood {topic_level}'
             else:
-                probability = 0.1  # Low probability
-                print(f"Ratio <= 0.7, setting probability to 0.1")
+                subject = f'Potomac River Flood {topic_level} ({len(gauges)} gauges)'
+            
+            try:
+                with phase('publish'):
+                    get_client('sns').publish(
+                        TopicArn=topic_arns[topic_level],
+                        Message='\n'.join(message_lines),
+                        Subject=subject
+                    )
+            except Exception as e:
+                # Left un-notified, so the next run tries again
+                print(f"Error publishing {topic_level} alert for {len(gauges)} gauges: {e}")
+                continue
             
-            print(f"Calculated probability: {probability:.1%} ({probability})")
-            print(f"=== PREDICTION DEBUG END ===")
-            return probability
+            add_count('alerts_published')
+            notified.update(decision['gauge_id'] for decision in gauges)
+    
+    return notified
+
+def score_gauges(pairs, context=None):
+    """
+    Query, score and alert for (gauge_id, station_id) pairs
+    
+    Returns the response body: the highest-risk gauge's fields at the top
+    level plus one entry per gauge.
+    """
+    with phase('query'):
+        batch = get_batch_data(pairs)
+    
+    usgs_records = sum(len(entry['usgs_data']) for entry in batch)
+    noaa_records = sum(len(entry['noaa_data']) for entry in batch)
+    print(f"Loaded {usgs_records} USGS and {noaa_records} NOAA records for {len(pairs)} gauges")
+    add_count('gauges', len(pairs))
+    add_count('usgs_records', usgs_records)
+    add_count('noaa_records', noaa_records)
+    
+    if debug_enabled():
+        for entry in batch:
+            print(f"Gauge {entry['gauge_id']}: {len(entry['usgs_data'])} USGS records, "
+                  f"station {entry['station_id']}: {len(entry['noaa_data'])} NOAA records")
+    
+    # Make prediction
+    probabilities = predict_flood_probabilities(batch, context)
+    
+    # SNS topics (cached, no STS call on warm runs)
+    alert_topics = get_topic_arns(context)
+    
+    # Notify only on escalation, clearing or the re-notify interval
+    gauge_probabilities = {entry['gauge_id']: float(p) for entry, p in zip(batch, probabilities)}
+    with phase('query'):
+        alert_states = load_alert_states(list(gauge_probabilities))
+    decisions = evaluate_alerts(gauge_probabilities, alert_states)
+    notified = publish_alerts(decisions, alert_topics)
+    with phase('write'):
+        save_alert_states(decisions, notified)
+    
+    suppressed = sum(1 for decision in decisions if decision['level'] != 'NORMAL' and not decision['reason'])
+    add_count('alerts_suppressed', suppressed)
+    
+    decisions_by_gauge = {decision['gauge_id']: decision for decision in decisions}
+    gauge_results = []
+    for entry in batch:
+        decision = decisions_by_gauge[entry['gauge_id']]
+        flood_probability = decision['probability']
+        alert_level = decision['level']
+        
+        if alert_level != 'NORMAL':
+            message = alert_message(dict(decision, reason='escalated'))
         else:
-            print("No USGS data available - returning default 10% probability")
-            print(f"=== PREDICTION DEBUG END ===")
-            return 0.1
-    else:
-        # Use ML model
-        print("Using ML model for prediction")
-        feature_vector = create_features(usgs_data, noaa_data)
-        result = flood_model.predict(feature_vector)[0]
-        print(f"ML model prediction: {result}")
-        print(f"=== PREDICTION DEBUG END ===")
-        return result
+            message = f"Normal conditions - {flood_probability:.1%} flood probability at gauge {entry['gauge_id']}"
+        trend, rate_of_rise = latest_trend(entry['usgs_data'])
+        
+        gauge_results.append({
+            'gauge_id': entry['gauge_id'],
+            'station_id': entry['station_id'],
+            'flood_probability': flood_probability,
+            'alert_level': alert_level,
+            'trend': trend,
+            'rate_of_rise': rate_of_rise,
+            'message': message,
+            'notification': decision['reason'] if entry['gauge_id'] in notified else None
+        })
+    
+    # Top-level fields describe the highest-risk gauge
+    worst = max(gauge_results, key=lambda result: result['flood_probability'])
+    
+    body = {
+        'flood_probability': worst['flood_probability'],
+        'alert_level': worst['alert_level'],
+        'message': worst['message'],
+        'gauges': gauge_results,
+        'alerts_suppressed': suppressed,
+        'timestamp': datetime.utcnow().isoformat()
+    }
+    
+    return body
 
+@instrumented('ml-flood-predictor')
 def lambda_handler(event, context):
     """ML-powered flood prediction"""
     
     try:
+        # What-if planning sweep - scored in bulk, never alerts
+        if event.get('scenario_sweep'):
+            try:
+                body = sweep_scenarios(event['scenario_sweep'], context)
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"Invalid scenario sweep: {str(e)}")
+                return {
+                    'statusCode': 400,
+                    'body': json.dumps({'error': f"Invalid scenario sweep: {str(e)}"})
+                }
+            return {
+                'statusCode': 200,
+                'body': json.dumps(body)
+            }
+        
         # Check if this is demo mode
         if event.get('demo_mode'):
             print("DEMO MODE ACTIVATED")
@@ -208,12 +567,14 @@ def lambda_handler(event, context):
             
             # Send alert if needed (for demo, we'll send it)
             if topic_arn and flood_probability > 0.2:
-                sns = boto3.client('sns')
-                sns.publish(
-                    TopicArn=topic_arn,
-                    Message=message,
-                    Subject=f'[DEMO] Potomac River Flood {alert_level}'
-                )
+                sns = get_client('sns')
+                with phase('publish'):
+                    sns.publish(
+                        TopicArn=topic_arn,
+                        Message=message,
+                        Subject=f'[DEMO] Potomac River Flood {alert_level}'
+                    )
+                add_count('alerts_published')
                 print(f"Demo alert sent to SNS: {alert_level}")
             
             return {
@@ -229,70 +590,37 @@ def lambda_handler(event, context):
                 })
             }
         
-        # Normal mode - get recent data
-        print("=== LAMBDA HANDLER DEBUG START ===")
-        print("Fetching recent data from DynamoDB...")
-        usgs_data, noaa_data = get_recent_data()
-        
-        print(f"Retrieved {len(usgs_data)} USGS records and {len(noaa_data)} NOAA records")
-        
-        # Debug: Show what data we got
-        if usgs_data:
-            print(f"USGS data sample (first record): {json.dumps(usgs_data[0], default=str)}")
-        else:
-            print("WARNING: No USGS data retrieved from DynamoDB")
+        if is_stream_event(event):
+            # Stream mode - score only the gauges this batch touched, once per collector run
+            touched = touched_gauges(event)
+            with phase('query'):
+                claimed = claim_gauges(touched)
+            print(f"Stream batch: {len(event['Records'])} records, {len(touched)} gauges touched, "
+                  f"{len(claimed)} to score")
+            add_count('gauges_touched', len(touched))
+            add_count('gauges_debounced', len(touched) - len(claimed))
             
-        if noaa_data:
-            print(f"NOAA data sample (first record): {json.dumps(noaa_data[0], default=str)}")
-        else:
-            print("WARNING: No NOAA data retrieved from DynamoDB")
-        
-        # Make prediction
-        print("Calling predict_flood_probability...")
-        flood_probability = predict_flood_probability(usgs_data, noaa_data)
-        print(f"Prediction result: {flood_probability}")
-        
-        # Get account ID for SNS topics
-        sts = boto3.client('sts')
-        account_id = sts.get_caller_identity()['Account']
-        
-        # Determine alert level
-        if flood_probability > 0.8:
-            alert_level = "EMERGENCY"
-            topic_arn = f"arn:aws:sns:us-east-1:{account_id}:flood-alerts-emergency"
-            message = f"EMERGENCY: ML model predicts {flood_probability:.1%} flood probability in next 6 hours"
-        elif flood_probability > 0.5:
-            alert_level = "WARNING"
-            topic_arn = f"arn:aws:sns:us-east-1:{account_id}:flood-alerts-warning"
-            message = f"WARNING: ML model predicts {flood_probability:.1%} flood probability in next 6 hours"
-        elif flood_probability > 0.2:
-            alert_level = "WATCH"
-            topic_arn = f"arn:aws:sns:us-east-1:{account_id}:flood-alerts-watch"
-            message = f"WATCH: ML model predicts {flood_probability:.1%} flood probability in next 6 hours"
+            if claimed:
+                body = score_gauges(get_pairs_for_gauges(claimed), context)
+            else:
+                body = {'message': 'No gauges to score', 'gauges': [],
+                        'timestamp': datetime.utcnow().isoformat()}
+            body.update({'trigger': 'stream', 'gauges_touched': len(touched),
+                         'gauges_debounced': len(touched) - len(claimed)})
         else:
-            alert_level = "NORMAL"
-            topic_arn = None
-            message = f"Normal conditions - {flood_probability:.1%} flood probability"
+            # Scheduled or manual run - score every configured gauge in one batch
+            body = score_gauges(get_gauge_station_pairs(event), context)
         
-        # Send alert if needed
-        if topic_arn and flood_probability > 0.2:
-            sns = boto3.client('sns')
-            sns.publish(
-                TopicArn=topic_arn,
-                Message=message,
-                Subject=f'Potomac River Flood {alert_level}'
-            )
+        # Cold start only: how long each init phase took
+        timings = report_init_timings()
+        if timings:
+            body['init_timings_ms'] = timings
         
         return {
             'statusCode': 200,
-            'body': json.dumps({
-                'flood_probability': float(flood_probability),
-                'alert_level': alert_level,
-                'message': message,
-                'timestamp': datetime.utcnow().isoformat()
-            })
+            'body': json.dumps(body)
         }
-        
+    
     except Exception as e:
         print(f"Error in ML prediction: {str(e)}")
         return {
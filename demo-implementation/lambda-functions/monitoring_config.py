@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Monitoring Configuration
+Gauge and weather station lists shared by the collectors, overridable
+per deployment through environment variables or the invocation event
+"""
+
+import os
+
+# Potomac River gauges
+DEFAULT_USGS_SITES = ['01646500', '01594440', '01638500']
+
+# Flood stages (feet) for known gauges
+FLOOD_STAGES = {
+    '01646500': 10.0,  # Chain Bridge
+    '01594440': 15.0,  # Patuxent River
+    '01638500': 18.0   # Point of Rocks
+}
+DEFAULT_FLOOD_STAGE = 10.0
+
+# DC area weather stations
+DEFAULT_NOAA_STATIONS = ['KDCA', 'KIAD', 'KADW']
+
+# Weather station paired with each gauge for predictions
+GAUGE_STATIONS = {
+    '01646500': 'KDCA',  # Chain Bridge - Reagan National
+    '01594440': 'KADW',  # Patuxent River - Joint Base Andrews
+    '01638500': 'KIAD'   # Point of Rocks - Dulles
+}
+DEFAULT_PAIRED_STATION = 'KDCA'
+
+def parse_id_list(value):
+    """Split a comma separated ID list (or pass a list through), dropping blanks"""
+    if isinstance(value, (list, tuple)):
+        items = value
+    else:
+        items = str(value).split(',')
+    return [str(item).strip() for item in items if str(item).strip()]
+
+def get_usgs_sites(event=None):
+    """Gauge sites to collect: event 'sites', then USGS_SITES, then defaults"""
+    if event and event.get('sites'):
+        return parse_id_list(event['sites'])
+    if os.environ.get('USGS_SITES'):
+        return parse_id_list(os.environ['USGS_SITES'])
+    return list(DEFAULT_USGS_SITES)
+
+def get_flood_stage(gauge_id):
+    """Flood stage for a gauge, with USGS_FLOOD_STAGES ('id:feet,...') overrides"""
+    overrides = {}
+    for entry in parse_id_list(os.environ.get('USGS_FLOOD_STAGES', '')):
+        site, _, stage = entry.partition(':')
+        overrides[site.strip()] = float(stage)
+    return overrides.get(gauge_id, FLOOD_STAGES.get(gauge_id, DEFAULT_FLOOD_STAGE))
+
+def get_noaa_stations(event=None):
+    """Weather stations to poll: event 'stations', then NOAA_STATIONS, then defaults"""
+    if event and event.get('stations'):
+        return parse_id_list(event['stations'])
+    if os.environ.get('NOAA_STATIONS'):
+        return parse_id_list(os.environ['NOAA_STATIONS'])
+    return list(DEFAULT_NOAA_STATIONS)
+
+def get_gauge_station_pairs(event=None):
+    """
+    (gauge_id, station_id) pairs to score: event 'gauges', then
+    GAUGE_STATION_PAIRS ('gauge:station,...'), then the known gauges
+    
+    Entries without a station use the gauge's default pairing.
+    """
+    if event and event.get('gauges'):
+        entries = parse_id_list(event['gauges'])
+    elif os.environ.get('GAUGE_STATION_PAIRS'):
+        entries = parse_id_list(os.environ['GAUGE_STATION_PAIRS'])
+    else:
+        entries = list(GAUGE_STATIONS)
+    
+    pairs = []
+    for entry in entries:
+        gauge_id, _, station_id = entry.partition(':')
+        gauge_id = gauge_id.strip()
+        station_id = station_id.strip() or GAUGE_STATIONS.get(gauge_id, DEFAULT_PAIRED_STATION)
+        pairs.append((gauge_id, station_id))
+    return pairs
+
+def get_pairs_for_gauges(gauge_ids):
+    """(gauge_id, station_id) pairs for specific gauges, using the configured pairing"""
+    configured = dict(get_gauge_station_pairs())
+    return [
+        (gauge_id, configured.get(gauge_id) or GAUGE_STATIONS.get(gauge_id, DEFAULT_PAIRED_STATION))
+        for gauge_id in gauge_ids
+    ]
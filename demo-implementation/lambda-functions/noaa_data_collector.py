@@ -5,29 +5,108 @@ Collects weather data from NOAA Weather API
 """
 
 import json
-import boto3
+import os
+import time
 import requests
+from botocore.exceptions import ClientError
 from datetime import datetime
 from decimal import Decimal
 
-def lambda_handler(event, context):
-    """Collect NOAA weather data for DC metro area"""
+from aws_runtime import get_http_session, get_resource
+from concurrent_fetch import (DEFAULT_MAX_WORKERS, conditional_headers, fetch_all, fresh_until, get_deadline,
+                              response_validators, run_all)
+from flood_data_access import NOAA_TABLE, batch_write_items, get_latest_timestamp
+from instrumentation import add_count, debug, instrumented, phase
+from monitoring_config import get_noaa_stations
+from noaa_forecast import get_forecast_totals
+
+# Overridable (NOAA_API_URL) so the collector can be pointed at a local stand-in
+NOAA_URL = os.environ.get('NOAA_API_URL', "https://api.weather.gov").rstrip('/')
+
+ALERTS_KEY = 'ALERTS_DC'
+
+# api.weather.gov rejects requests without a User-Agent
+HTTP_HEADERS = {'User-Agent': 'FloodMonitoringSystem/1.0'}
+
+# Warm-invocation copy of each station's last stored observation time, the
+# validators of the response it came from and the forecast total stored with it
+_observations = {}
+
+def load_observation_cache(stations, dynamodb, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    station -> {'timestamp', optional 'etag'/'last_modified'/'forecast_24hr', 'fresh_until'}
+    
+    After a cold start the last stored timestamp is read back from the
+    table; validators and the stored forecast total are only known once a
+    warm run has seen a response.
+    """
+    missing = [station for station in stations if station not in _observations]
+    if missing:
+        table = dynamodb.Table(NOAA_TABLE)
+        outcomes = run_all(lambda station: get_latest_timestamp(table, 'station_id', station), missing,
+                           max_workers=max_workers)
+        for station, outcome in zip(missing, outcomes):
+            if outcome.get('result'):
+                _observations[station] = {'timestamp': outcome['result'], 'fresh_until': 0.0}
+    return {station: _observations[station] for station in stations if station in _observations}
+
+def build_observation_item(station, data, ttl, forecast_24hr=None):
+    """Turn an observations/latest response into a WeatherObservations item"""
+    properties = data['properties']
     
-    # DC area weather stations
-    stations = ['KDCA', 'KIAD', 'KADW']
+    # Extract precipitation data
+    precip_1hr = properties.get('precipitationLastHour', {})
+    precip_value = precip_1hr.get('value') if precip_1hr else None
     
-    dynamodb = boto3.resource('dynamodb')
-    table = dynamodb.Table('WeatherObservations')
+    # Convert mm to inches (USGS uses feet, easier to work in inches)
+    precip_inches = 0.0
+    if precip_value:
+        precip_inches = float(precip_value) * 0.0393701  # mm to inches
     
-    records_processed = 0
+    # 24h gridpoint forecast total in inches (0.0 when it could not be loaded)
+    forecast_precip_24hr = forecast_24hr if forecast_24hr is not None else 0.0
+    
+    return {
+        'station_id': station,
+        'timestamp': properties['timestamp'],
+        'precipitation_1hr': Decimal(str(precip_inches)),
+        'precipitation_forecast_24hr': Decimal(str(forecast_precip_24hr)),
+        'temperature': Decimal(str(properties.get('temperature', {}).get('value', 0) or 0)),
+        'location_name': f"Weather Station {station}",
+        'ttl': ttl
+    }
+
+def parse_observations(results, ttl, forecasts=None, cache=None, now=None):
+    """
+    Observation items from the fetched station responses, plus per-station errors
+    
+    Responses that are 304 Not Modified, or whose properties.timestamp is the
+    one already stored, produce no item. Returns (items, errors, updates)
+    where updates holds the new cache entry of every station that answered.
+    A changed forecast for an unchanged observation is left to
+    forecast_refreshes.
+    """
+    forecasts = forecasts or {}
+    cache = cache or {}
+    now = time.time() if now is None else now
+    updates = {}
+    items = []
     errors = []
     
-    for station in stations:
+    for result in results:
+        station = result['key']
+        if station == ALERTS_KEY:
+            continue
+        
         try:
-            # Get current observations
-            obs_url = f"https://api.weather.gov/stations/{station}/observations/latest"
-            response = requests.get(obs_url, timeout=30, headers={'User-Agent': 'FloodMonitoringSystem/1.0'})
+            if 'error' in result:
+                raise result['error']
             
+            response = result['response']
+            cached = cache.get(station)
+            if response.status_code == 304 and cached:
+                updates[station] = dict(cached, fresh_until=fresh_until(response, now))
+                continue
             if response.status_code == 200:
                 data = response.json()
                 
@@ -38,41 +117,21 @@ def lambda_handler(event, context):
                     errors.append(error_msg)
                     continue
                 
-                properties = data['properties']
-                
-                # Extract precipitation data
-                precip_1hr = properties.get('precipitationLastHour', {})
-                precip_value = precip_1hr.get('value') if precip_1hr else None
-                
-                # Convert mm to inches (USGS uses feet, easier to work in inches)
-                precip_inches = 0.0
-                if precip_value:
-                    precip_inches = float(precip_value) * 0.0393701  # mm to inches
-                
-                # Get forecast data (simplified - would need gridpoint lookup)
-                forecast_precip_24hr = 0.0  # Would fetch from forecast API
-                
-                # Calculate TTL (2 days from now)
-                import time
-                ttl = int(time.time()) + (2 * 24 * 60 * 60)  # 2 days in seconds
-                
-                # Store observation
-                table.put_item(Item={
-                    'station_id': station,
-                    'timestamp': properties['timestamp'],
-                    'precipitation_1hr': Decimal(str(precip_inches)),
-                    'precipitation_forecast_24hr': Decimal(str(forecast_precip_24hr)),
-                    'temperature': Decimal(str(properties.get('temperature', {}).get('value', 0) or 0)),
-                    'location_name': f"Weather Station {station}",
-                    'ttl': ttl
-                })
+                updates[station] = dict(response_validators(response), timestamp=data['properties']['timestamp'],
+                                        fresh_until=fresh_until(response, now))
+                if cached and cached['timestamp'] == updates[station]['timestamp']:
+                    if 'forecast_24hr' in cached:
+                        updates[station]['forecast_24hr'] = cached['forecast_24hr']
+                    continue
                 
-                records_processed += 1
+                items.append(build_observation_item(station, data, ttl, forecasts.get(station)))
+                updates[station]['forecast_24hr'] = float(items[-1]['precipitation_forecast_24hr'])
+                debug(lambda: f"Station {station}: {json.dumps(items[-1], default=str)}")
             else:
                 error_msg = f"Station {station}: HTTP {response.status_code}"
                 print(error_msg)
                 errors.append(error_msg)
-                
+        
         except requests.exceptions.Timeout:
             error_msg = f"Station {station}: Request timeout"
             print(error_msg)
@@ -89,37 +148,171 @@ def lambda_handler(event, context):
             errors.append(error_msg)
             continue
     
+    return items, errors, updates
+
+def forecast_refreshes(forecasts, cache, updates, written):
+    """
+    station -> (stored timestamp, forecast total) for observations that are
+    not being rewritten but were stored with a different forecast total
+    
+    Covers fresh, 304 and same-timestamp stations alike; after a cold start
+    the stored total is unknown, so each station is refreshed once.
+    """
+    refreshes = {}
+    for station, total in forecasts.items():
+        entry = updates.get(station) or cache.get(station)
+        if total is None or station in written or not entry:
+            continue
+        if entry.get('forecast_24hr') != total:
+            refreshes[station] = (entry['timestamp'], total)
+    return refreshes
+
+def refresh_forecast(table, station, timestamp, total):
+    """Set precipitation_forecast_24hr on a stored observation; False if the row is gone"""
+    try:
+        table.update_item(
+            Key={'station_id': station, 'timestamp': timestamp},
+            UpdateExpression='SET precipitation_forecast_24hr = :forecast',
+            ConditionExpression='attribute_exists(station_id)',
+            ExpressionAttributeValues={':forecast': Decimal(str(total))}
+        )
+        return True
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+@instrumented('noaa-data-collector')
+def lambda_handler(event, context):
+    """Collect NOAA weather data for DC metro area"""
+    
+    # DC area weather stations (configurable with NOAA_STATIONS)
+    stations = get_noaa_stations(event)
+    max_workers = int(os.environ.get('NOAA_MAX_WORKERS', DEFAULT_MAX_WORKERS))
+    request_timeout = float(os.environ.get('NOAA_REQUEST_TIMEOUT', 10))
+    
+    dynamodb = get_resource('dynamodb')
+    table = dynamodb.Table('WeatherObservations')
+    
+    records_processed = 0
+    
+    # Calculate TTL (2 days from now)
+    ttl = int(time.time()) + (2 * 24 * 60 * 60)  # 2 days in seconds
+    
+    # Stations whose last response is still fresh are not requested at all;
+    # the rest are asked conditionally with the validators from last time
+    now = time.time()
+    cache = load_observation_cache(stations, dynamodb, max_workers)
+    due = [station for station in stations if now >= cache.get(station, {}).get('fresh_until', 0)]
+    
+    # Fetch every due station plus the flood alerts endpoint at once; wall time
+    # is set by the slowest request rather than the sum of all of them
+    specs = [
+        {'key': station, 'url': f"{NOAA_URL}/stations/{station}/observations/latest",
+         'headers': conditional_headers(cache.get(station))}
+        for station in due
+    ]
+    specs.append({
+        'key': ALERTS_KEY,
+        'url': f"{NOAA_URL}/alerts",
+        'params': {'area': 'DC', 'event': 'Flood'}
+    })
+    
+    session = get_http_session('noaa', max_workers, headers=HTTP_HEADERS)
+    with phase('fetch'):
+        results = fetch_all(session, specs, max_workers=max_workers, timeout=request_timeout,
+                            deadline=get_deadline(context))
+    
+    # Gridpoint forecasts are cached and revalidated, so this is usually no requests at all
+    with phase('forecast'):
+        forecasts, forecast_stats, forecast_errors = get_forecast_totals(
+            session, NOAA_URL, stations, dynamodb, timeout=request_timeout,
+            deadline=get_deadline(context), max_workers=max_workers
+        )
+    
+    with phase('parse'):
+        items, errors, updates = parse_observations(results, ttl, forecasts, cache, now)
+    errors.extend(forecast_errors)
+    fetches_skipped = len(stations) - len(due)
+    not_modified = sum(1 for result in results[:-1]
+                       if 'response' in result and result['response'].status_code == 304)
+    refreshes = forecast_refreshes(forecasts, cache, updates, {item['station_id'] for item in items})
+    writes_skipped = fetches_skipped + len(updates) - len(items) - len(refreshes)
+    
+    # Store observations in one batched write
+    try:
+        with phase('write'):
+            records_processed = batch_write_items(table, items, ('station_id', 'timestamp'))
+        # Only remember observations once they are stored
+        _observations.update(updates)
+    except Exception as e:
+        error_msg = f"Error storing observations: {str(e)}"
+        print(error_msg)
+        errors.append(error_msg)
+    
+    # An unchanged observation still gets the new forecast total, so the
+    # predictor's forecast feature does not wait for the next observation
+    forecasts_refreshed = 0
+    if refreshes:
+        with phase('write'):
+            outcomes = run_all(lambda station: refresh_forecast(table, station, *refreshes[station]),
+                               list(refreshes), max_workers=max_workers)
+        for station, outcome in zip(refreshes, outcomes):
+            if 'error' in outcome:
+                error_msg = f"Station {station}: Forecast update failed - {str(outcome['error'])}"
+                print(error_msg)
+                errors.append(error_msg)
+            elif outcome['result']:
+                forecasts_refreshed += 1
+                _observations[station] = dict(updates.get(station) or cache[station],
+                                              forecast_24hr=refreshes[station][1])
+    
     # Also check for active flood warnings
     try:
-        alerts_url = "https://api.weather.gov/alerts"
-        params = {'area': 'DC', 'event': 'Flood'}
-        response = requests.get(alerts_url, params=params, timeout=30)
+        alerts_result = results[-1]
+        if 'error' in alerts_result:
+            raise alerts_result['error']
         
+        response = alerts_result['response']
         if response.status_code == 200:
             alerts_data = response.json()
             active_warnings = len(alerts_data.get('features', []))
             
-            # Calculate TTL (2 days from now)
-            import time
-            ttl = int(time.time()) + (2 * 24 * 60 * 60)  # 2 days in seconds
-            
             # Store alert status
-            table.put_item(Item={
-                'station_id': 'ALERTS_DC',
-                'timestamp': datetime.utcnow().isoformat() + 'Z',
-                'active_flood_warnings': active_warnings,
-                'location_name': 'DC Area Flood Alerts',
-                'ttl': ttl
-            })
-            
+            with phase('write'):
+                table.put_item(Item={
+                    'station_id': ALERTS_KEY,
+                    'timestamp': datetime.utcnow().isoformat() + 'Z',
+                    'active_flood_warnings': active_warnings,
+                    'location_name': 'DC Area Flood Alerts',
+                    'ttl': ttl
+                })
+            add_count('active_flood_warnings', active_warnings)
+    
     except Exception as e:
         print(f"Error checking flood alerts: {str(e)}")
     
+    add_count('stations', len(stations))
+    add_count('records_processed', records_processed)
+    add_count('errors', len(errors))
+    add_count('fetches_skipped', fetches_skipped)
+    add_count('not_modified', not_modified)
+    add_count('writes_skipped', writes_skipped)
+    add_count('forecasts_refreshed', forecasts_refreshed)
+    for name, count in forecast_stats.items():
+        add_count(name, count)
+    
     return {
         'statusCode': 200,
         'body': json.dumps({
             'message': 'NOAA data processed successfully',
             'records_processed': records_processed,
+            'stations_requested': len(stations),
+            'fetches_skipped': fetches_skipped,
+            'not_modified': not_modified,
+            'writes_skipped': writes_skipped,
+            'forecasts_refreshed': forecasts_refreshed,
+            'forecast': forecast_stats,
             'errors': errors if errors else None
         })
-    }
\ No newline at end of file
+    }
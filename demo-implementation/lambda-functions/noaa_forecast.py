@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+NOAA Gridpoint Precipitation Forecast
+24 hour precipitation totals per weather station from the weather.gov
+gridpoint quantitative precipitation forecast (QPF)
+
+Each station is resolved to its forecast gridpoint once (stations/{id} for
+the coordinates, then points/{lat},{lon}) and the mapping is kept in the
+state store for GRIDPOINT_CACHE_DAYS. Forecast series are cached per
+gridpoint with their ETag / Last-Modified validators: while the response's
+Cache-Control lifetime lasts no request is made at all, and after that a
+conditional GET normally comes back 304 Not Modified. Stations sharing a
+gridpoint share one request.
+"""
+
+import os
+import re
+import time
+from decimal import Decimal
+
+from concurrent_fetch import (DEFAULT_MAX_WORKERS, DEFAULT_TIMEOUT, conditional_headers, fresh_until,
+                              get_with_deadline, response_validators, run_all)
+from flood_data_access import parse_timestamp
+from instrumentation import debug
+from state_store import get_states, put_states
+
+# Gridpoints only move when NWS re-grids a forecast office
+DEFAULT_GRIDPOINT_CACHE_DAYS = 30
+
+FORECAST_HOURS = 24
+MM_TO_INCHES = 0.0393701
+
+# ISO 8601 durations as used in validTime (PT6H, P1D, P1DT12H)
+DURATION_PATTERN = re.compile(r'P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?)?$')
+
+# Warm-invocation copies of the state store records
+_gridpoints = {}
+_forecasts = {}
+
+def get_gridpoint_cache_seconds():
+    """How long a station's gridpoint stays valid (GRIDPOINT_CACHE_DAYS)"""
+    return float(os.environ.get('GRIDPOINT_CACHE_DAYS', DEFAULT_GRIDPOINT_CACHE_DAYS)) * 86400
+
+def gridpoint_state_id(station):
+    """State store key for a station's gridpoint"""
+    return f"gridpoint#{station}"
+
+def forecast_state_id(grid_id):
+    """State store key for a gridpoint's cached forecast"""
+    return f"forecast#{grid_id}"
+
+def parse_valid_time(valid_time):
+    """(start, end) epoch seconds of an interval such as 2024-05-01T12:00:00+00:00/PT6H"""
+    start_text, duration = valid_time.split('/')
+    match = DURATION_PATTERN.match(duration)
+    if not match:
+        raise ValueError(f"Unsupported duration {duration}")
+    days, hours, minutes = (int(group or 0) for group in match.groups())
+    start = parse_timestamp(start_text).timestamp()
+    return start, start + days * 86400 + hours * 3600 + minutes * 60
+
+def parse_qpf(data):
+    """[start, end, mm] intervals from a gridpoint response's quantitativePrecipitation"""
+    qpf = data.get('properties', {}).get('quantitativePrecipitation') or {}
+    scale = 25.4 if qpf.get('uom', '').endswith(':in') else 1.0
+    series = []
+    for entry in qpf.get('values', []):
+        if entry.get('value') is None:
+            continue
+        start, end = parse_valid_time(entry['validTime'])
+        series.append([start, end, float(entry['value']) * scale])
+    return series
+
+def precipitation_total(series, start, hours=FORECAST_HOURS):
+    """Inches forecast between start and start + hours, prorating intervals the window cuts"""
+    end = start + hours * 3600
+    total = 0.0
+    for interval_start, interval_end, mm in series:
+        overlap = min(interval_end, end) - max(interval_start, start)
+        if overlap > 0:
+            total += mm * overlap / (interval_end - interval_start)
+    return round(total * MM_TO_INCHES, 4)
+
+def resolve_gridpoint(session, base_url, station, timeout=DEFAULT_TIMEOUT, deadline=None):
+    """Gridpoint record for a station (coordinates from stations/{id}, grid from points/)"""
+    response = get_with_deadline(session, {'url': f"{base_url}/stations/{station}"}, timeout, deadline)
+    response.raise_for_status()
+    longitude, latitude = response.json()['geometry']['coordinates'][:2]
+    
+    # points/ only accepts four decimal places
+    response = get_with_deadline(session, {'url': f"{base_url}/points/{latitude:.4f},{longitude:.4f}"},
+                                 timeout, deadline)
+    response.raise_for_status()
+    properties = response.json()['properties']
+    return {
+        'state_id': gridpoint_state_id(station),
+        'grid_id': f"{properties['gridId']}/{properties['gridX']},{properties['gridY']}",
+        'resolved_at': int(time.time())
+    }
+
+def load_gridpoints(stations, dynamodb, now):
+    """station -> grid_id for every station resolved within GRIDPOINT_CACHE_DAYS"""
+    missing = [station for station in stations if station not in _gridpoints]
+    if missing:
+        states = get_states([gridpoint_state_id(station) for station in missing], dynamodb)
+        for station in missing:
+            record = states.get(gridpoint_state_id(station))
+            if record:
+                _gridpoints[station] = {'grid_id': record['grid_id'], 'resolved_at': float(record['resolved_at'])}
+    
+    max_age = get_gridpoint_cache_seconds()
+    return {
+        station: _gridpoints[station]['grid_id'] for station in stations
+        if station in _gridpoints and now - _gridpoints[station]['resolved_at'] < max_age
+    }
+
+def forecast_from_record(record):
+    """Cached forecast entry from its state store record"""
+    entry = {
+        'series': [[float(start), float(end), float(mm)] for start, end, mm in record.get('series', [])],
+        'fresh_until': float(record.get('fresh_until', 0))
+    }
+    entry.update({name: record[name] for name in ('etag', 'last_modified') if record.get(name)})
+    return entry
+
+def forecast_to_record(grid_id, entry, now):
+    """State store record for a forecast entry, without intervals that have already ended"""
+    record = {
+        'state_id': forecast_state_id(grid_id),
+        'grid_id': grid_id,
+        'series': [[int(start), int(end), Decimal(str(round(mm, 3)))]
+                   for start, end, mm in entry['series'] if end > now],
+        'fresh_until': Decimal(str(round(entry['fresh_until'], 3))),
+        'fetched_at': int(now)
+    }
+    record.update({name: entry[name] for name in ('etag', 'last_modified') if entry.get(name)})
+    return record
+
+def load_forecasts(grid_ids, dynamodb):
+    """grid_id -> cached forecast entry (warm copy first, then the state store)"""
+    missing = [grid_id for grid_id in grid_ids if grid_id not in _forecasts]
+    if missing:
+        states = get_states([forecast_state_id(grid_id) for grid_id in missing], dynamodb)
+        for grid_id in missing:
+            record = states.get(forecast_state_id(grid_id))
+            if record:
+                _forecasts[grid_id] = forecast_from_record(record)
+    return {grid_id: _forecasts[grid_id] for grid_id in grid_ids if grid_id in _forecasts}
+
+def fetch_forecast(session, base_url, grid_id, cached, now, timeout=DEFAULT_TIMEOUT, deadline=None):
+    """
+    Forecast entry for one gridpoint, plus how it was obtained
+    
+    Returns (entry, status) where status is 'cached' (still fresh, no
+    request), 'not_modified' (conditional GET answered 304) or 'fetched'.
+    """
+    if cached and now < cached['fresh_until']:
+        return cached, 'cached'
+    
+    spec = {'url': f"{base_url}/gridpoints/{grid_id}", 'headers': conditional_headers(cached)}
+    response = get_with_deadline(session, spec, timeout, deadline)
+    if response.status_code == 304 and cached:
+        return dict(cached, fresh_until=fresh_until(response, now)), 'not_modified'
+    response.raise_for_status()
+    
+    entry = response_validators(response)
+    entry.update(series=parse_qpf(response.json()), fresh_until=fresh_until(response, now))
+    return entry, 'fetched'
+
+def get_forecast_totals(session, base_url, stations, dynamodb, timeout=DEFAULT_TIMEOUT, deadline=None,
+                        max_workers=DEFAULT_MAX_WORKERS, now=None):
+    """
+    24 hour forecast precipitation (inches) per station
+    
+    Returns (totals, stats, errors). Stations whose gridpoint or forecast
+    could not be loaded are left out of totals; a failed revalidation falls
+    back to the cached series.
+    """
+    now = time.time() if now is None else now
+    stats = {'gridpoints_resolved': 0, 'forecasts_fetched': 0, 'forecasts_not_modified': 0,
+             'forecasts_cached': 0}
+    errors = []
+    
+    gridpoints = load_gridpoints(stations, dynamodb, now)
+    unresolved = [station for station in stations if station not in gridpoints]
+    if unresolved:
+        outcomes = run_all(lambda station: resolve_gridpoint(session, base_url, station, timeout, deadline),
+                           unresolved, max_workers=max_workers, deadline=deadline)
+        records = []
+        for station, outcome in zip(unresolved, outcomes):
+            if 'error' in outcome:
+                error_msg = f"Station {station}: Gridpoint lookup failed - {str(outcome['error'])}"
+                print(error_msg)
+                errors.append(error_msg)
+                continue
+            record = outcome['result']
+            _gridpoints[station] = {'grid_id': record['grid_id'], 'resolved_at': record['resolved_at']}
+            gridpoints[station] = record['grid_id']
+            records.append(record)
+        put_states(records, dynamodb)
+        stats['gridpoints_resolved'] = len(records)
+    
+    grid_ids = sorted(set(gridpoints.values()))
+    cached = load_forecasts(grid_ids, dynamodb)
+    outcomes = run_all(
+        lambda grid_id: fetch_forecast(session, base_url, grid_id, cached.get(grid_id), now, timeout, deadline),
+        grid_ids, max_workers=max_workers, deadline=deadline
+    )
+    
+    series = {}
+    records = []
+    for grid_id, outcome in zip(grid_ids, outcomes):
+        if 'error' in outcome:
+            error_msg = f"Gridpoint {grid_id}: Forecast request failed - {str(outcome['error'])}"
+            print(error_msg)
+            errors.append(error_msg)
+            if grid_id in cached:
+                series[grid_id] = cached[grid_id]['series']
+            continue
+        entry, status = outcome['result']
+        stats[f'forecasts_{status}'] += 1
+        _forecasts[grid_id] = entry
+        series[grid_id] = entry['series']
+        if status == 'fetched':
+            records.append(forecast_to_record(grid_id, entry, now))
+    
+    # Only new series are written; a 304 just extends the warm copy's lifetime
+    put_states(records, dynamodb)
+    
+    totals = {
+        station: precipitation_total(series[grid_id], now)
+        for station, grid_id in gridpoints.items() if grid_id in series
+    }
+    debug(lambda: f"Forecast totals: {totals} ({stats})")
+    return totals, stats, errors
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Packed Gauge Readings
+Encoder/decoder for the bucketed storage mode: one DynamoDB item per gauge
+per time bucket, holding delta-encoded arrays instead of one item per reading
+
+Each column is stored as a Binary attribute of zigzag varints of the
+difference from the previous value. Timestamps are epoch seconds (15 minute
+steps pack into two bytes), water levels hundredths of a foot and rates of
+rise ten-thousandths of a foot per hour, so a steady gauge costs a few
+bytes per reading. Trends are one byte each. Timestamps come back in UTC.
+"""
+
+from datetime import datetime, timezone
+from decimal import Decimal
+
+FORMAT_VERSION = 1
+
+# USGS gauge heights have two decimals, so hundredths are lossless
+LEVEL_SCALE = 100
+RATE_SCALE = 10000
+
+TREND_CODES = ('stable', 'rising', 'falling')
+
+def encode_deltas(values):
+    """Integers as zigzag varints of the difference from the previous value"""
+    out = bytearray()
+    previous = 0
+    for value in values:
+        delta = value - previous
+        previous = value
+        zigzag = delta * 2 if delta >= 0 else -delta * 2 - 1
+        while zigzag >= 0x80:
+            out.append((zigzag & 0x7F) | 0x80)
+            zigzag >>= 7
+        out.append(zigzag)
+    return bytes(out)
+
+def decode_deltas(data):
+    """Inverse of encode_deltas"""
+    values = []
+    previous = 0
+    zigzag = 0
+    shift = 0
+    for byte in data:
+        zigzag |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        previous += (zigzag >> 1) if not zigzag & 1 else -((zigzag + 1) >> 1)
+        values.append(previous)
+        zigzag = 0
+        shift = 0
+    return values
+
+def binary_value(value):
+    """Raw bytes of a Binary attribute (boto3 returns Binary objects on reads)"""
+    return bytes(getattr(value, 'value', value) or b'')
+
+def bucket_start(epoch, bucket_hours):
+    """Epoch seconds of the UTC bucket holding epoch"""
+    size = int(bucket_hours * 3600)
+    return int(epoch) // size * size
+
+def bucket_key(epoch):
+    """Sort key for the bucket starting at epoch"""
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat()
+
+def bucket_keys(start_time, end_time, bucket_hours):
+    """Sort keys of every bucket overlapping start_time..end_time (aware datetimes)"""
+    size = int(bucket_hours * 3600)
+    first = bucket_start(start_time.timestamp(), bucket_hours)
+    last = bucket_start(end_time.timestamp(), bucket_hours)
+    return [bucket_key(epoch) for epoch in range(first, last + 1, size)]
+
+def pack_readings(readings):
+    """
+    Packed columns for (epoch, water_level, rate_of_rise, trend) tuples
+    
+    Readings must be sorted by epoch without duplicates; rate_of_rise and
+    trend may be None (stored as 0 and stable).
+    """
+    return {
+        'count': len(readings),
+        'times': encode_deltas([int(epoch) for epoch, _, _, _ in readings]),
+        'levels': encode_deltas([int(round(float(level) * LEVEL_SCALE)) for _, level, _, _ in readings]),
+        'rates': encode_deltas([int(round(float(rate or 0) * RATE_SCALE)) for _, _, rate, _ in readings]),
+        'trends': bytes(TREND_CODES.index(trend) if trend in TREND_CODES else 0
+                        for _, _, _, trend in readings)
+    }
+
+def unpack_readings(item):
+    """(epoch, water_level, rate_of_rise, trend) tuples from a bucket item, oldest first"""
+    times = decode_deltas(binary_value(item.get('times')))
+    levels = decode_deltas(binary_value(item.get('levels')))
+    rates = decode_deltas(binary_value(item.get('rates')))
+    trends = binary_value(item.get('trends'))
+    return [
+        (epoch, Decimal(level) / LEVEL_SCALE, Decimal(rate) / RATE_SCALE, TREND_CODES[code])
+        for epoch, level, rate, code in zip(times, levels, rates, trends)
+    ]
+
+def merge_readings(existing, new):
+    """Sorted union of two reading lists; new readings replace existing ones at the same epoch"""
+    merged = {reading[0]: reading for reading in existing}
+    merged.update((reading[0], reading) for reading in new)
+    return [merged[epoch] for epoch in sorted(merged)]
+
+def build_bucket_item(gauge_id, key, readings, attributes=None):
+    """DynamoDB item for one gauge bucket (attributes adds flood_stage, ttl, ...)"""
+    item = dict(attributes or {})
+    item.update(pack_readings(readings))
+    item.update({
+        'gauge_id': gauge_id,
+        'timestamp': key,
+        'first_time': bucket_key(readings[0][0]),
+        'last_time': bucket_key(readings[-1][0]),
+        'format': FORMAT_VERSION
+    })
+    return item
+
+def bucket_to_items(item):
+    """Expand a bucket item into per-reading dicts shaped like item-mode readings"""
+    shared = {name: item[name] for name in ('flood_stage', 'location_name', 'ttl') if name in item}
+    return [
+        dict(shared, gauge_id=item['gauge_id'], timestamp=bucket_key(epoch), water_level=level,
+             rate_of_rise=rate, trend=trend)
+        for epoch, level, rate, trend in unpack_readings(item)
+    ]
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Reading Archiver Lambda Function
+Copies gauge readings and weather observations into the S3 cold archive
+before the DynamoDB TTL deletes them
+
+Each run archives, per gauge and station, everything between the newest
+archived timestamp (kept in the archive index) and ARCHIVE_AFTER_HOURS ago,
+so readings are only archived once the collectors will no longer change
+them. Run it more often than the table TTL (every 6 hours by default).
+"""
+
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from aws_runtime import get_client, get_resource
+from cold_archive import (KEY_NAMES, compact_month, get_archive_bucket, load_index, save_index,
+                          write_parts)
+from concurrent_fetch import get_deadline, run_all
+from flood_data_access import (GAUGE_BUCKET_TABLE, NOAA_TABLE, USGS_TABLE, get_storage_mode,
+                               parse_timestamp, query_time_window, read_gauge_buckets)
+from instrumentation import add_count, debug, instrumented, phase
+from monitoring_config import get_noaa_stations, get_usgs_sites
+
+# Readings newer than this may still be rewritten (bucket merges, late data)
+DEFAULT_ARCHIVE_AFTER_HOURS = 24
+
+# How far back the first run for an ID looks (the longest table retention)
+DEFAULT_INITIAL_LOOKBACK_HOURS = 14 * 24
+
+# A month with more parts than this is rewritten as a single part
+DEFAULT_COMPACT_PARTS = 8
+
+DEFAULT_MAX_WORKERS = 8
+
+# Attributes that only matter inside DynamoDB
+SKIPPED_ATTRIBUTES = ('timestamp', 'ttl')
+
+def read_source_window(source, key_value, start_time, end_time, dynamodb):
+    """DynamoDB items for one ID between start_time and end_time"""
+    if source == 'usgs' and get_storage_mode() == 'bucketed':
+        return read_gauge_buckets(dynamodb.Table(GAUGE_BUCKET_TABLE), key_value, start_time, end_time)
+    table_name = USGS_TABLE if source == 'usgs' else NOAA_TABLE
+    return query_time_window(dynamodb.Table(table_name), KEY_NAMES[source], key_value,
+                             start_time, end_time)
+
+def to_archive_rows(source, items):
+    """(epoch, {attribute: value}) rows without the key, timestamp and ttl attributes"""
+    skipped = SKIPPED_ATTRIBUTES + (KEY_NAMES[source],)
+    rows = []
+    for item in items:
+        epoch = int(parse_timestamp(item['timestamp']).timestamp())
+        rows.append((epoch, {name: value for name, value in item.items() if name not in skipped}))
+    return rows
+
+def archive_id(source, key_value, cutoff, dynamodb, bucket, s3):
+    """Archive one gauge or station up to cutoff; returns rows and bytes written"""
+    lookback = float(os.environ.get('ARCHIVE_INITIAL_LOOKBACK_HOURS', DEFAULT_INITIAL_LOOKBACK_HOURS))
+    compact_parts = int(os.environ.get('ARCHIVE_COMPACT_PARTS', DEFAULT_COMPACT_PARTS))
+    
+    with phase('query'):
+        index = load_index(source, key_value, bucket, s3)
+        if index['max_time'] is not None:
+            start_time = datetime.fromtimestamp(index['max_time'] + 1, timezone.utc)
+        else:
+            start_time = cutoff - timedelta(hours=lookback)
+        if start_time > cutoff:
+            return {'rows': 0, 'bytes': 0}
+        rows = to_archive_rows(source, read_source_window(source, key_value, start_time, cutoff, dynamodb))
+    if not rows:
+        return {'rows': 0, 'bytes': 0}
+    
+    with phase('write'):
+        written = write_parts(index, rows, bucket, s3)
+        replaced = []
+        for month in sorted({part['month'] for part in index['parts']}):
+            if sum(1 for part in index['parts'] if part['month'] == month) > compact_parts:
+                replaced.extend(compact_month(index, month, bucket, s3))
+        save_index(index, bucket, s3)
+        # Old parts go only after the index stops pointing at them
+        for key in replaced:
+            s3.delete_object(Bucket=bucket, Key=key)
+    
+    debug(lambda: f"{source} {key_value}: archived {len(rows)} rows ({written} bytes), "
+                  f"{len(replaced)} parts compacted")
+    return {'rows': len(rows), 'bytes': written}
+
+@instrumented('reading-archiver')
+def lambda_handler(event, context):
+    """Archive readings that are about to expire from DynamoDB"""
+    event = event or {}
+    try:
+        bucket = get_archive_bucket()
+    except ValueError as e:
+        return {'statusCode': 500, 'body': json.dumps({'error': str(e)})}
+    
+    after_hours = float(os.environ.get('ARCHIVE_AFTER_HOURS', DEFAULT_ARCHIVE_AFTER_HOURS))
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=after_hours)
+    dynamodb = get_resource('dynamodb')
+    s3 = get_client('s3')
+    
+    tasks = [('usgs', site) for site in get_usgs_sites(event)] + \
+            [('noaa', station) for station in get_noaa_stations(event)]
+    max_workers = int(os.environ.get('ARCHIVE_MAX_WORKERS', DEFAULT_MAX_WORKERS))
+    started = time.perf_counter()
+    outcomes = run_all(lambda task: archive_id(task[0], task[1], cutoff, dynamodb, bucket, s3),
+                       tasks, max_workers=max_workers, deadline=get_deadline(context))
+    
+    rows_archived = 0
+    bytes_written = 0
+    errors = []
+    for (source, key_value), outcome in zip(tasks, outcomes):
+        if 'error' in outcome:
+            error_msg = f"Error archiving {source} {key_value}: {outcome['error']}"
+            print(error_msg)
+            errors.append(error_msg)
+            continue
+        rows_archived += outcome['result']['rows']
+        bytes_written += outcome['result']['bytes']
+    
+    add_count('rows_archived', rows_archived)
+    add_count('bytes_archived', bytes_written)
+    print(f"Archived {rows_archived} rows ({bytes_written} bytes) for {len(tasks)} IDs up to "
+          f"{cutoff.isoformat()} in {time.perf_counter() - started:.1f}s")
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'message': f'Archived {rows_archived} readings',
+            'rows_archived': rows_archived,
+            'bytes_written': bytes_written,
+            'archived_through': cutoff.isoformat(),
+            'errors': errors,
+            'timestamp': datetime.utcnow().isoformat()
+        })
+    }
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Scenario Sweep
+What-if flood probabilities over grids of water level, flood stage, rate of
+rise, precipitation and forecast values, for planning rather than alerting
+
+Every combination of the axis values is one scenario. Scenarios are built
+from flat grid indices SWEEP_CHUNK_ROWS at a time, so memory stays bounded
+at millions of combinations, and each chunk is scored in one model call.
+Nothing is read from DynamoDB and no alerts are sent.
+
+An axis is a number, a list of numbers, {"start", "stop", "step"} (stop
+included) or {"start", "stop", "num"}; axes left out keep their default.
+"""
+
+import os
+import time
+import numpy as np
+from datetime import datetime, timezone
+
+from alert_state import ALERT_LEVELS, ALERT_THRESHOLDS
+from feature_engine import DEFAULT_FLOOD_STAGE, DEFAULT_TEMPERATURE, DEFAULT_WATER_LEVEL
+
+# Surface axis order and the value an axis takes when it is not swept
+AXIS_DEFAULTS = {
+    'water_level': DEFAULT_WATER_LEVEL,
+    'flood_stage': DEFAULT_FLOOD_STAGE,
+    'rate_of_rise': 0.0,
+    'precipitation_1hr': 0.0,
+    'precipitation_forecast_24hr': 0.0,
+    'temperature': DEFAULT_TEMPERATURE
+}
+
+DEFAULT_MAX_SCENARIOS = 10_000_000
+DEFAULT_CHUNK_ROWS = 262_144
+
+# Larger sweeps are reduced to two axes in the response (about 7 bytes of JSON a point)
+DEFAULT_MAX_SURFACE_POINTS = 250_000
+
+# Sweep spec keys that are options rather than axes
+OPTION_KEYS = ('surface_axes', 'at')
+
+def parse_axis(name, spec):
+    """Sorted, de-duplicated values for one axis"""
+    if isinstance(spec, dict):
+        start = float(spec['start'])
+        stop = float(spec['stop'])
+        if 'num' in spec:
+            values = np.linspace(start, stop, int(spec['num']))
+        else:
+            step = float(spec.get('step', 0))
+            if step <= 0:
+                raise ValueError(f"Axis {name}: step must be positive")
+            # Half a step of slack so stop itself survives float rounding
+            values = np.arange(start, stop + step / 2, step)
+    else:
+        values = np.atleast_1d(np.asarray(spec, dtype=float))
+    
+    values = np.unique(np.round(values, 6))
+    if not len(values):
+        raise ValueError(f"Axis {name} has no values")
+    if not np.isfinite(values).all():
+        raise ValueError(f"Axis {name} has non-finite values")
+    return values
+
+def parse_grid(spec, max_scenarios=None):
+    """(axes, fixed): swept axis values in AXIS_DEFAULTS order, and the single-valued rest"""
+    if not isinstance(spec, dict):
+        raise ValueError(f"Sweep spec must be an object of axes, got {type(spec).__name__}")
+    grid = {name: value for name, value in spec.items() if name not in OPTION_KEYS}
+    unknown = set(grid) - set(AXIS_DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown sweep axes: {', '.join(sorted(unknown))}")
+    
+    axes = {}
+    fixed = {}
+    for name, default in AXIS_DEFAULTS.items():
+        values = parse_axis(name, grid[name]) if name in grid else np.array([default])
+        if len(values) > 1:
+            axes[name] = values
+        else:
+            fixed[name] = float(values[0])
+    
+    max_scenarios = max_scenarios or int(os.environ.get('SWEEP_MAX_SCENARIOS', DEFAULT_MAX_SCENARIOS))
+    scenarios = int(np.prod([len(values) for values in axes.values()], dtype=np.int64))
+    if scenarios > max_scenarios:
+        raise ValueError(f"Sweep has {scenarios} scenarios, more than the {max_scenarios} allowed")
+    return axes, fixed
+
+def scenario_inputs(axes, fixed, flat):
+    """Input arrays for the scenarios at flat grid indices"""
+    count = len(flat)
+    inputs = {name: np.full(count, value) for name, value in fixed.items()}
+    if axes:
+        positions = np.unravel_index(flat, [len(values) for values in axes.values()])
+        for (name, values), position in zip(axes.items(), positions):
+            inputs[name] = values[position]
+    return inputs
+
+def score_grid(axes, fixed, score, query_time, chunk_rows=None):
+    """Probability for every scenario, shaped like the swept axes (float32)"""
+    chunk_rows = chunk_rows or int(os.environ.get('SWEEP_CHUNK_ROWS', DEFAULT_CHUNK_ROWS))
+    shape = tuple(len(values) for values in axes.values())
+    total = int(np.prod(shape, dtype=np.int64))
+    
+    probabilities = np.empty(total, dtype=np.float32)
+    for start in range(0, total, chunk_rows):
+        flat = np.arange(start, min(start + chunk_rows, total))
+        probabilities[start:start + len(flat)] = score(scenario_inputs(axes, fixed, flat), query_time)
+    return probabilities.reshape(shape)
+
+def alert_ranks(probabilities):
+    """Alert level index (0 = NORMAL) for each probability, as in alert_state.level_for"""
+    ranks = np.zeros(probabilities.shape, dtype=np.int8)
+    for level in ALERT_LEVELS[1:]:
+        ranks += probabilities > ALERT_THRESHOLDS[level]
+    return ranks
+
+def reduce_surface(probabilities, names, keep):
+    """Worst case (max) probability over every axis not in keep"""
+    dropped = tuple(position for position, name in enumerate(names) if name not in keep)
+    return probabilities.max(axis=dropped) if dropped else probabilities
+
+def level_boundaries(surface, names, axes):
+    """
+    Lowest water level reaching each alert level, across the other surface axes
+    
+    Returns {level: list} with None where the level is never reached, or
+    None when water_level is not one of the surface axes.
+    """
+    if 'water_level' not in names:
+        return None
+    position = names.index('water_level')
+    levels = axes['water_level']
+    ranks = np.moveaxis(alert_ranks(surface), position, 0)
+    
+    boundaries = {}
+    for rank, level in enumerate(ALERT_LEVELS[1:], start=1):
+        reached = ranks >= rank
+        first = levels[reached.argmax(axis=0)]
+        boundaries[level] = np.where(reached.any(axis=0), first, np.nan)
+    return {level: to_json(values) for level, values in boundaries.items()}
+
+def to_json(values, decimals=4):
+    """Nested lists of rounded floats, None for NaN"""
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 0:
+        return None if np.isnan(values) else round(float(values), decimals)
+    return [to_json(value, decimals) for value in values]
+
+def run_sweep(spec, score, query_time=None):
+    """
+    Score every scenario of a sweep spec and summarize it
+    
+    score(inputs, query_time) returns flood probabilities for a dict of
+    equal-length input arrays. The response holds the probability surface
+    (reduced by max to two axes when larger than SWEEP_MAX_SURFACE_POINTS),
+    the alert-level boundaries along water_level and per-level counts.
+    """
+    started = time.perf_counter()
+    axes, fixed = parse_grid(spec)
+    names = list(axes)
+    if query_time is None:
+        at = spec.get('at')
+        if at is not None and not isinstance(at, str):
+            raise ValueError(f"at must be an ISO 8601 time, got {at!r}")
+        moment = datetime.fromisoformat(at.replace('Z', '+00:00')) if at else datetime.now(timezone.utc)
+        query_time = moment.timestamp()
+    
+    probabilities = score_grid(axes, fixed, score, query_time)
+    ranks = alert_ranks(probabilities)
+    scenarios = int(probabilities.size)
+    
+    max_points = int(os.environ.get('SWEEP_MAX_SURFACE_POINTS', DEFAULT_MAX_SURFACE_POINTS))
+    keep = spec.get('surface_axes') or names[:2]
+    if scenarios <= max_points and not spec.get('surface_axes'):
+        keep = names
+    unknown = [name for name in keep if name not in axes]
+    if unknown:
+        raise ValueError(f"Surface axes must be swept axes: {', '.join(unknown)}")
+    surface_names = [name for name in names if name in keep]
+    surface = reduce_surface(probabilities, names, surface_names)
+    if surface.size > max_points:
+        raise ValueError(f"Surface over {', '.join(surface_names)} has {surface.size} points, "
+                         f"more than the {max_points} allowed")
+    elapsed = time.perf_counter() - started
+    
+    return {
+        'scenarios': scenarios,
+        'axes': {name: to_json(values, 6) for name, values in axes.items()},
+        'fixed': fixed,
+        'query_time': datetime.fromtimestamp(query_time, timezone.utc).isoformat(),
+        'surface': {
+            'axes': surface_names,
+            'reduction': 'max' if len(surface_names) < len(names) else None,
+            'probabilities': to_json(surface)
+        },
+        'boundaries': level_boundaries(surface, surface_names, axes),
+        'level_counts': {level: int((ranks == rank).sum()) for rank, level in enumerate(ALERT_LEVELS)},
+        'probability_range': [round(float(probabilities.min()), 4), round(float(probabilities.max()), 4)],
+        'elapsed_ms': round(elapsed * 1000, 1),
+        'scenarios_per_second': round(scenarios / elapsed) if elapsed > 0 else None
+    }
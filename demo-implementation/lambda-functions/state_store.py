@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Monitoring State Store
+Small key/value records (ingestion checkpoints and similar) kept in the
+FloodMonitoringState DynamoDB table, keyed by state_id
+"""
+
+import os
+
+from aws_runtime import get_resource
+from flood_data_access import batch_get_items, batch_write_items
+
+DEFAULT_STATE_TABLE = 'FloodMonitoringState'
+
+
+def get_state_table(dynamodb=None):
+    """Get the state table (name from STATE_TABLE)"""
+    dynamodb = dynamodb or get_resource('dynamodb')
+    return dynamodb.Table(os.environ.get('STATE_TABLE', DEFAULT_STATE_TABLE))
+
+
+def get_states(state_ids, dynamodb=None, max_retries=8):
+    """
+    Fetch several state records with BatchGetItem (100 keys per request)
+
+    Returns a dict of state_id -> item; missing records are simply absent.
+    """
+    keys = [{'state_id': state_id} for state_id in dict.fromkeys(state_ids)]
+    items = batch_get_items(get_state_table(dynamodb), keys, max_retries=max_retries)
+    return {item['state_id']: item for item in items}
+
+
+def put_states(items, dynamodb=None):
+    """Write several state records in one batched call"""
+    if not items:
+        return 0
+    return batch_write_items(get_state_table(dynamodb), items, ('state_id',))
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+DynamoDB Stream Events
+Turns FloodGaugeReadings (or FloodGaugeBuckets) stream batches into the set
+of gauges to score, debounced so one collector run causes at most one
+prediction per gauge
+
+A collector run writes a gauge's readings within a few seconds, which can
+arrive as several stream batches (or on several shards). Each gauge is
+claimed with a conditional write to FloodMonitoringState (predict#<gauge>),
+so only the first batch inside STREAM_DEBOUNCE_SECONDS scores it - across
+concurrent predictor instances too. A warm instance also remembers what it
+claimed and skips those gauges without a round trip.
+"""
+
+import os
+import time
+
+from botocore.exceptions import ClientError
+
+from concurrent_fetch import run_all
+from flood_data_access import GAUGE_BUCKET_TABLE, USGS_TABLE
+from state_store import get_state_table
+
+# Shorter than the 15 minute collection interval, longer than one run's writes
+DEFAULT_DEBOUNCE_SECONDS = 300
+
+STREAM_EVENT_NAMES = ('INSERT', 'MODIFY')
+
+# gauge_id -> epoch seconds of this instance's last claim (kept while warm)
+recently_claimed = {}
+
+def is_stream_event(event):
+    """True for a DynamoDB Streams batch"""
+    records = event.get('Records') if isinstance(event, dict) else None
+    return bool(records) and records[0].get('eventSource') == 'aws:dynamodb'
+
+def touched_gauges(event, table_name=None):
+    """
+    Gauge IDs with new or changed readings in the batch, in first-seen order
+    
+    Records from either gauge table count unless table_name picks one.
+    """
+    table_names = (table_name,) if table_name else (USGS_TABLE, GAUGE_BUCKET_TABLE)
+    gauges = {}
+    for record in event.get('Records', []):
+        if record.get('eventName') not in STREAM_EVENT_NAMES:
+            continue
+        # arn:aws:dynamodb:<region>:<account>:table/<name>/stream/<label>
+        source_arn = record.get('eventSourceARN', '')
+        if not any(f':table/{name}/' in source_arn for name in table_names):
+            continue
+        gauge_id = record.get('dynamodb', {}).get('Keys', {}).get('gauge_id', {}).get('S')
+        if gauge_id:
+            gauges[gauge_id] = None
+    return list(gauges)
+
+def debounce_state_id(gauge_id):
+    """State store key for a gauge's last stream-triggered prediction"""
+    return f'predict#{gauge_id}'
+
+def claim_gauge(table, gauge_id, now, window):
+    """Conditionally stamp the gauge; False if another batch scored it within the window"""
+    try:
+        table.update_item(
+            Key={'state_id': debounce_state_id(gauge_id)},
+            UpdateExpression='SET scored_at = :now',
+            ConditionExpression='attribute_not_exists(scored_at) OR scored_at <= :cutoff',
+            ExpressionAttributeValues={':now': now, ':cutoff': now - window}
+        )
+        return True
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+def claim_gauges(gauge_ids, window=None, now=None, dynamodb=None):
+    """
+    Gauges this batch should score
+    
+    A claim that fails for any reason other than the debounce condition
+    counts as claimed - scoring twice beats missing a rise.
+    """
+    if window is None:
+        window = int(os.environ.get('STREAM_DEBOUNCE_SECONDS', DEFAULT_DEBOUNCE_SECONDS))
+    now = int(time.time()) if now is None else now
+    if window <= 0:
+        return list(gauge_ids)
+    
+    candidates = [gauge_id for gauge_id in gauge_ids if now - recently_claimed.get(gauge_id, 0) > window]
+    table = get_state_table(dynamodb)
+    outcomes = run_all(lambda gauge_id: claim_gauge(table, gauge_id, now, window), candidates,
+                       max_workers=16)
+    
+    claimed = []
+    for gauge_id, outcome in zip(candidates, outcomes):
+        if 'error' in outcome:
+            print(f"Could not record debounce for gauge {gauge_id}: {outcome['error']}")
+        elif not outcome['result']:
+            continue
+        recently_claimed[gauge_id] = now
+        claimed.append(gauge_id)
+    return claimed
+
+def build_stream_event(readings, table_name=USGS_TABLE, event_name='INSERT',
+                       region='us-east-1', account_id='123456789012'):
+    """
+    Synthetic stream batch for (gauge_id, timestamp) pairs
+    
+    Matches what a KEYS_ONLY stream delivers, for local runs and the
+    Lambda console test events.
+    """
+    stream_arn = f'arn:aws:dynamodb:{region}:{account_id}:table/{table_name}/stream/2024-01-01T00:00:00.000'
+    return {
+        'Records': [
+            {
+                'eventID': f'{index:032x}',
+                'eventName': event_name,
+                'eventVersion': '1.1',
+                'eventSource': 'aws:dynamodb',
+                'awsRegion': region,
+                'dynamodb': {
+                    'Keys': {'gauge_id': {'S': gauge_id}, 'timestamp': {'S': timestamp}},
+                    'SequenceNumber': str(100000000000000000000 + index),
+                    'SizeBytes': 64,
+                    'StreamViewType': 'KEYS_ONLY'
+                },
+                'eventSourceARN': stream_arn
+            }
+            for index, (gauge_id, timestamp) in enumerate(readings)
+        ]
+    }
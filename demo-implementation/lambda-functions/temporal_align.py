@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Temporal Alignment
+Sorted as-of joins between time series (gauge readings, weather observations)
+using binary search instead of per-row nearest-timestamp scans
+
+Each left time is matched to one right row: the latest at or before it
+('backward'), the earliest at or after it ('forward') or the closest
+('nearest'), optionally within a tolerance and only within the same group
+(e.g. station) when group keys are given.
+"""
+
+import numpy as np
+from datetime import timezone
+
+from flood_data_access import parse_timestamp
+
+DIRECTIONS = ('backward', 'forward', 'nearest')
+
+def to_epoch_array(timestamps):
+    """Float epoch seconds from datetime64 arrays/Series, datetimes or ISO-8601 strings"""
+    values = np.asarray(timestamps)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype('datetime64[ns]').astype(np.int64) / 1e9
+    if np.issubdtype(values.dtype, np.number):
+        return values.astype(float)
+    
+    seconds = np.empty(len(values))
+    for idx, value in enumerate(values):
+        if hasattr(value, 'timestamp'):
+            # Naive datetimes are UTC, like everything stored by the collectors
+            if getattr(value, 'tzinfo', None) is None:
+                value = value.replace(tzinfo=timezone.utc)
+            seconds[idx] = value.timestamp()
+        else:
+            seconds[idx] = parse_timestamp(value).timestamp()
+    return seconds
+
+def to_seconds(tolerance):
+    """Tolerance in seconds from a number, timedelta or pandas Timedelta (None passes through)"""
+    if tolerance is None:
+        return None
+    if hasattr(tolerance, 'total_seconds'):
+        return tolerance.total_seconds()
+    return float(tolerance)
+
+def asof_indices(left_times, right_times, direction='backward', tolerance=None,
+                 allow_exact_matches=True):
+    """
+    Index of the matched right row for every left time (-1 where none)
+    
+    right_times must be sorted ascending; left_times can be in any order.
+    """
+    if direction not in DIRECTIONS:
+        raise ValueError(f"direction must be one of {DIRECTIONS}, got {direction!r}")
+    
+    left = np.asarray(left_times, dtype=float)
+    right = np.asarray(right_times, dtype=float)
+    size = len(right)
+    if size == 0:
+        return np.full(len(left), -1, dtype=np.int64)
+    
+    back = np.searchsorted(right, left, side='right' if allow_exact_matches else 'left') - 1
+    ahead = np.searchsorted(right, left, side='left' if allow_exact_matches else 'right')
+    ahead = np.where(ahead < size, ahead, -1)
+    
+    if direction == 'backward':
+        idx = back
+    elif direction == 'forward':
+        idx = ahead
+    else:
+        back_gap = np.where(back >= 0, left - right[np.maximum(back, 0)], np.inf)
+        ahead_gap = np.where(ahead >= 0, right[np.maximum(ahead, 0)] - left, np.inf)
+        # Ties go to the earlier reading
+        idx = np.where(back_gap <= ahead_gap, back, ahead)
+    
+    tolerance = to_seconds(tolerance)
+    if tolerance is not None:
+        matched = idx >= 0
+        gap = np.abs(left - right[np.where(matched, idx, 0)])
+        idx = np.where(matched & (gap <= tolerance), idx, -1)
+    
+    return idx.astype(np.int64)
+
+def grouped_asof_indices(left_times, right_times, left_groups, right_groups, direction='backward',
+                         tolerance=None, allow_exact_matches=True):
+    """
+    Like asof_indices, but a left row only matches right rows with the same group key
+    
+    Neither side needs to be sorted. Returned indices point into the right
+    arrays as given.
+    """
+    left_times = np.asarray(left_times, dtype=float)
+    right_times = np.asarray(right_times, dtype=float)
+    left_groups = np.asarray(left_groups)
+    right_groups = np.asarray(right_groups)
+    
+    result = np.full(len(left_times), -1, dtype=np.int64)
+    if len(right_times) == 0 or len(left_times) == 0:
+        return result
+    
+    # Sort the right side by group, then time, so each group is one sorted slice
+    right_order = np.lexsort((right_times, right_groups))
+    sorted_groups = right_groups[right_order]
+    sorted_times = right_times[right_order]
+    keys, starts = np.unique(sorted_groups, return_index=True)
+    ends = np.append(starts[1:], len(sorted_groups))
+    slices = {key: (start, end) for key, start, end in zip(keys.tolist(), starts, ends)}
+    
+    left_order = np.argsort(left_groups, kind='stable')
+    left_keys, left_starts = np.unique(left_groups[left_order], return_index=True)
+    left_ends = np.append(left_starts[1:], len(left_order))
+    
+    for key, left_start, left_end in zip(left_keys.tolist(), left_starts, left_ends):
+        if key not in slices:
+            continue
+        start, end = slices[key]
+        rows = left_order[left_start:left_end]
+        idx = asof_indices(left_times[rows], sorted_times[start:end], direction, tolerance,
+                           allow_exact_matches)
+        result[rows] = np.where(idx >= 0, right_order[start + np.maximum(idx, 0)], -1)
+    
+    return result
+
+def take(values, idx):
+    """values[idx] with NaN (or None for non-numeric data) where idx is -1"""
+    values = np.asarray(values)
+    matched = idx >= 0
+    if np.issubdtype(values.dtype, np.number):
+        result = np.full(len(idx), np.nan)
+    else:
+        result = np.full(len(idx), None, dtype=object)
+    result[matched] = values[idx[matched]]
+    return result
+
+def asof_join(left_times, right_times, right_columns, direction='backward', tolerance=None,
+              left_groups=None, right_groups=None, allow_exact_matches=True):
+    """
+    Right column values matched to every left time
+    
+    right_columns is a dict of name -> array aligned with right_times.
+    Returns a dict of name -> array aligned with left_times, plus
+    'matched_time' (NaN where nothing matched).
+    """
+    right_times = to_epoch_array(right_times)
+    left_times = to_epoch_array(left_times)
+    
+    if left_groups is not None or right_groups is not None:
+        if left_groups is None or right_groups is None:
+            raise ValueError("left_groups and right_groups must be given together")
+        idx = grouped_asof_indices(left_times, right_times, left_groups, right_groups, direction,
+                                   tolerance, allow_exact_matches)
+    else:
+        order = np.argsort(right_times, kind='stable')
+        idx = asof_indices(left_times, right_times[order], direction, tolerance, allow_exact_matches)
+        idx = np.where(idx >= 0, order[np.maximum(idx, 0)], -1)
+    
+    joined = {name: take(values, idx) for name, values in right_columns.items()}
+    joined['matched_time'] = take(right_times, idx)
+    return joined
+
+def asof_merge(left, right, on='timestamp', by=None, left_by=None, right_by=None,
+               direction='backward', tolerance=None, columns=None, allow_exact_matches=True):
+    """
+    DataFrame as-of join (left rows kept in their original order)
+    
+    by (or left_by/right_by) restricts matches to rows with the same key,
+    e.g. each gauge reading joined to its paired station's observations.
+    columns selects which right columns to bring across (default: all but
+    the join and group columns). tolerance is in seconds or a Timedelta.
+    """
+    left_by = left_by or by
+    right_by = right_by or by
+    if columns is None:
+        columns = [name for name in right.columns if name not in (on, right_by)]
+    
+    joined = asof_join(
+        left[on].values, right[on].values, {name: right[name].values for name in columns},
+        direction=direction, tolerance=tolerance,
+        left_groups=left[left_by].values if left_by else None,
+        right_groups=right[right_by].values if right_by else None,
+        allow_exact_matches=allow_exact_matches
+    )
+    del joined['matched_time']
+    
+    merged = left.copy()
+    for name, values in joined.items():
+        merged[name if name not in merged.columns else f"{name}_right"] = values
+    return merged
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Incremental Gauge Trend
+Rate of rise (feet/hour) and rising/falling/stable trend per gauge, kept as
+a three-number rolling state and updated in O(1) per new reading
+
+The rate is an exponentially weighted average of the reading-to-reading
+slope. Its weight follows the gap between readings (time constant
+TREND_TIME_CONSTANT_MINUTES), so a missed reading or an irregular USGS
+interval does not skew it. The state lives in each gauge's ingestion
+checkpoint, so every collector run continues where the last one stopped.
+"""
+
+import math
+import os
+from decimal import Decimal
+
+from flood_data_access import parse_timestamp
+
+# About an hour of 15 minute readings dominates the average
+DEFAULT_TIME_CONSTANT_MINUTES = 60
+
+# Feet per hour; gauge noise is a few hundredths of a foot per reading
+DEFAULT_TREND_THRESHOLD = 0.05
+
+# Readings replayed to seed a gauge that has no trend state yet
+SEED_LOOKBACK_HOURS = 3
+
+def get_time_constant():
+    """EWMA time constant in seconds (TREND_TIME_CONSTANT_MINUTES)"""
+    return float(os.environ.get('TREND_TIME_CONSTANT_MINUTES', DEFAULT_TIME_CONSTANT_MINUTES)) * 60
+
+def get_trend_threshold():
+    """Rate (ft/hr) beyond which a gauge counts as rising or falling (TREND_THRESHOLD)"""
+    return float(os.environ.get('TREND_THRESHOLD', DEFAULT_TREND_THRESHOLD))
+
+def update_trend(state, epoch, level, time_constant=None):
+    """
+    Fold one reading into the state (a dict with time, level, rate) in place
+
+    Readings at or before the state's time are ignored, so replays and
+    already-stored readings do not count twice. Returns the state, or a new
+    one when state is None.
+    """
+    if state is None:
+        return {'time': epoch, 'level': level, 'rate': 0.0}
+
+    elapsed = epoch - state['time']
+    if elapsed <= 0:
+        return state
+
+    slope = (level - state['level']) * 3600.0 / elapsed
+    weight = 1.0 - math.exp(-elapsed / (time_constant or get_time_constant()))
+    state['rate'] += weight * (slope - state['rate'])
+    state['time'] = epoch
+    state['level'] = level
+    return state
+
+def classify(rate, threshold=None):
+    """'rising', 'falling' or 'stable' for a rate in feet per hour"""
+    threshold = get_trend_threshold() if threshold is None else threshold
+    if rate > threshold:
+        return 'rising'
+    if rate < -threshold:
+        return 'falling'
+    return 'stable'
+
+def seed_trend(items):
+    """Trend state replayed from stored readings (None when there are none)"""
+    state = None
+    readings = sorted(
+        (parse_timestamp(item['timestamp']).timestamp(), float(item['water_level']))
+        for item in items if item.get('water_level') is not None
+    )
+    time_constant = get_time_constant()
+    for epoch, level in readings:
+        state = update_trend(state, epoch, level, time_constant)
+    return state
+
+def trend_from_record(record):
+    """Trend state from its checkpoint attribute (None if absent)"""
+    if not record:
+        return None
+    return {'time': float(record['time']), 'level': float(record['level']), 'rate': float(record['rate'])}
+
+def trend_to_record(state):
+    """Checkpoint attribute for a trend state (DynamoDB needs Decimals)"""
+    return {
+        'time': Decimal(str(round(state['time'], 3))),
+        'level': Decimal(str(state['level'])),
+        'rate': Decimal(str(round(state['rate'], 6)))
+    }
@@ -5,99 +5,336 @@ Collects stream gauge data from USGS Water Services API
 """
 
 import json
-import boto3
+import os
+import time
 import requests
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 
-def lambda_handler(event, context):
-    """Collect USGS stream gauge data for Potomac River basin"""
+# Streaming JSON parser (optional - falls back to response.json())
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+from aws_runtime import get_http_session, get_resource
+from concurrent_fetch import get_deadline, get_with_deadline, run_all
+from flood_data_access import (GAUGE_BUCKET_TABLE, USGS_TABLE, batch_write_items,
+                               filter_new_items, get_latest_bucket_timestamp,
+                               get_latest_timestamp, get_recent_gauge_readings,
+                               get_storage_mode, parse_timestamp, write_gauge_buckets)
+from instrumentation import add_count, add_timing, debug, instrumented, phase
+from monitoring_config import get_flood_stage, get_usgs_sites
+from state_store import get_states, put_states
+from trend_state import (SEED_LOOKBACK_HOURS, classify, get_time_constant, seed_trend,
+                         trend_from_record, trend_to_record, update_trend)
+
+# Overridable (USGS_API_URL) so the collector can be pointed at a local stand-in
+USGS_URL = os.environ.get('USGS_API_URL', "https://waterservices.usgs.gov/nwis/iv/")
+
+# USGS accepts at most 100 sites per request; also keep the URL well short
+# of proxy/server length limits
+MAX_SITES_PER_REQUEST = 100
+MAX_SITES_PARAM_LENGTH = 1500
+
+# Chunks fetched in parallel (override with USGS_MAX_WORKERS)
+DEFAULT_MAX_WORKERS = 8
+
+# Readings buffered per chunk before each batched write
+WRITE_BUFFER_SIZE = 250
+
+# Window for a gauge with no checkpoint yet (matches the old fixed PT4H)
+DEFAULT_PERIOD_HOURS = 4
+
+# Longest catch-up after an outage (override with USGS_MAX_CATCHUP_HOURS).
+# Anything older would already be past the table's 2-day TTL.
+DEFAULT_MAX_CATCHUP_HOURS = 48
+
+def checkpoint_id(gauge_id):
+    """State store key for a gauge's ingestion checkpoint"""
+    return f'usgs#{gauge_id}'
+
+def load_checkpoints(gauge_ids, dynamodb):
+    """
+    Get the newest ingested dateTime and the trend state per gauge
     
-    # Potomac River gauges
-    usgs_url = "https://waterservices.usgs.gov/nwis/iv/"
-    params = {
-        'format': 'json',
-        'sites': '01646500,01594440,01638500',  # 3 Potomac gauges
-        'parameterCd': '00065',  # Gauge height
-        'period': 'PT4H'  # Last 4 hours
-    }
+    Returns (checkpoints, trends); both hold None for a gauge never ingested.
+    """
+    states = get_states([checkpoint_id(gauge_id) for gauge_id in gauge_ids], dynamodb)
+    checkpoints = {}
+    trends = {}
+    for gauge_id in gauge_ids:
+        state = states.get(checkpoint_id(gauge_id), {})
+        checkpoints[gauge_id] = state.get('last_timestamp')
+        trends[gauge_id] = trend_from_record(state.get('trend_state'))
+    return checkpoints, trends
+
+def get_start_time(checkpoints, now):
+    """Earliest startDT that catches every gauge up, bounded by the catch-up window"""
+    max_catchup = float(os.environ.get('USGS_MAX_CATCHUP_HOURS', DEFAULT_MAX_CATCHUP_HOURS))
+    earliest_allowed = now - timedelta(hours=max_catchup)
     
-    try:
-        response = requests.get(usgs_url, params=params, timeout=30)
-        response.raise_for_status()
+    starts = []
+    for last_timestamp in checkpoints.values():
+        if last_timestamp:
+            start = parse_timestamp(last_timestamp)
+        else:
+            start = now - timedelta(hours=DEFAULT_PERIOD_HOURS)
+        starts.append(max(start, earliest_allowed))
+    
+    return min(starts) if starts else now - timedelta(hours=DEFAULT_PERIOD_HOURS)
+
+def build_checkpoints(newest, now, trends=None):
+    """Checkpoint records from {gauge_id: (datetime, dateTime string)}, with trend state"""
+    trends = trends or {}
+    records = []
+    for gauge_id, (_, timestamp) in newest.items():
+        record = {
+            'state_id': checkpoint_id(gauge_id),
+            'last_timestamp': timestamp,
+            'updated_at': now.isoformat()
+        }
+        if trends.get(gauge_id):
+            record['trend_state'] = trend_to_record(trends[gauge_id])
+        records.append(record)
+    return records
+
+def chunk_sites(sites, max_sites=MAX_SITES_PER_REQUEST, max_length=MAX_SITES_PARAM_LENGTH):
+    """Split the site list into request-sized chunks"""
+    chunks = []
+    current = []
+    length = 0
+    
+    for site in sites:
+        added = len(site) + (1 if current else 0)  # comma separator
+        if current and (len(current) >= max_sites or length + added > max_length):
+            chunks.append(current)
+            current = []
+            length = 0
+            added = len(site)
+        current.append(site)
+        length += added
+    
+    if current:
+        chunks.append(current)
+    
+    return chunks
+
+def iter_readings(response):
+    """
+    Yield (gauge_id, location_name, reading) from a USGS IV response
+    
+    With ijson the body is parsed as it streams in, holding one site's
+    time series at a time instead of the whole JSON document.
+    """
+    if ijson is not None:
+        response.raw.decode_content = True
+        sites = ijson.items(response.raw, 'value.timeSeries.item')
+    else:
         data = response.json()
         
         # Validate response structure
         if 'value' not in data or 'timeSeries' not in data['value']:
             print("Warning: Unexpected USGS API response structure")
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'message': 'USGS API returned unexpected format - no data processed',
-                    'records_processed': 0
-                })
-            }
+            return
+        sites = data['value']['timeSeries']
+    
+    for site in sites:
+        try:
+            gauge_id = site['sourceInfo']['siteCode'][0]['value']
+            location_name = site['sourceInfo']['siteName']
+            values = site['values'][0]['value']
+        except (KeyError, IndexError) as site_error:
+            print(f"Warning: Skipping malformed USGS site entry: {site_error}")
+            continue
         
-        # Store in DynamoDB
-        dynamodb = boto3.resource('dynamodb')
-        table = dynamodb.Table('FloodGaugeReadings')
+        for reading in values:
+            yield gauge_id, location_name, reading
+
+def ingest_chunk(session, dynamodb, sites, checkpoints, now, ttl, deadline, trends=None):
+    """
+    Fetch, stream-parse and store one chunk of sites
+    
+    trends holds each gauge's rolling trend state; it is updated in place
+    as readings stream in and saved with the checkpoints.
+    """
+    trends = {} if trends is None else trends
+    time_constant = get_time_constant()
+    bucketed = get_storage_mode() == 'bucketed'
+    table = dynamodb.Table(GAUGE_BUCKET_TABLE if bucketed else USGS_TABLE)
+    start_time = get_start_time({site: checkpoints.get(site) for site in sites}, now)
+    spec = {
+        'url': USGS_URL,
+        'params': {
+            'format': 'json',
+            'sites': ','.join(sites),
+            'parameterCd': '00065',  # Gauge height
+            'startDT': start_time.strftime('%Y-%m-%dT%H:%MZ')
+        },
+        'stream': True
+    }
+    
+    stats = {'records_processed': 0, 'records_skipped': 0}
+    latest = {}
+    newest = {}
+    buffer = []
+    # Buckets this chunk has already read or written (bucketed mode)
+    buckets = {}
+    
+    # Time spent writing/querying inside the streaming loop, so the rest of
+    # the loop can be reported as parse time
+    nested_ms = [0.0]
+    
+    def timed(name, function, *args):
+        started = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            add_timing(name, elapsed)
+            nested_ms[0] += elapsed
+    
+    def flush():
+        # Only keep readings newer than each gauge's checkpoint (or newest
+        # stored reading) - startDT is shared by every site in the chunk
+        new_items = filter_new_items(buffer, 'gauge_id', latest)
+        stats['records_skipped'] += len(buffer) - len(new_items)
+        if bucketed:
+            stats['records_processed'] += write_gauge_buckets(table, new_items, cache=buckets)
+        else:
+            stats['records_processed'] += batch_write_items(table, new_items, ('gauge_id', 'timestamp'))
+        
+        for item in new_items:
+            item_time = parse_timestamp(item['timestamp'])
+            current = newest.get(item['gauge_id'])
+            if current is None or item_time > current[0]:
+                newest[item['gauge_id']] = (item_time, item['timestamp'])
+        buffer.clear()
+    
+    with phase('fetch'):
+        response = get_with_deadline(session, spec, timeout=30, deadline=deadline)
+    try:
+        response.raise_for_status()
+        loop_started = time.perf_counter()
+        
+        for gauge_id, location_name, reading in iter_readings(response):
+            if not reading['value'] or reading['value'] == '-999999':
+                continue
+            
+            if gauge_id not in latest:
+                latest[gauge_id] = checkpoints.get(gauge_id)
+                if latest[gauge_id] is None and bucketed:
+                    latest[gauge_id] = timed('query', get_latest_bucket_timestamp, table, gauge_id)
+                elif latest[gauge_id] is None:
+                    latest[gauge_id] = timed('query', get_latest_timestamp, table, 'gauge_id', gauge_id)
+                if trends.get(gauge_id) is None and latest[gauge_id] is not None:
+                    # First run with trends for a gauge that already has data
+                    trends[gauge_id] = seed_trend(timed(
+                        'query', get_recent_gauge_readings, gauge_id, SEED_LOOKBACK_HOURS,
+                        parse_timestamp(latest[gauge_id]), dynamodb))
+            
+            # O(1) trend update; readings at or before the state's time leave it as is
+            level = float(reading['value'])
+            trends[gauge_id] = update_trend(trends.get(gauge_id), parse_timestamp(reading['dateTime']).timestamp(),
+                                            level, time_constant)
+            rate = trends[gauge_id]['rate']
+            
+            buffer.append({
+                'gauge_id': gauge_id,
+                'timestamp': reading['dateTime'],
+                'water_level': Decimal(str(reading['value'])),
+                'flood_stage': Decimal(str(get_flood_stage(gauge_id))),
+                'location_name': location_name,
+                'trend': classify(rate),
+                'rate_of_rise': Decimal(str(round(rate, 4))),
+                'ttl': ttl
+            })
+            
+            if len(buffer) >= WRITE_BUFFER_SIZE:
+                timed('write', flush)
+                # Out of time - keep what is stored, the checkpoint picks up the rest
+                if deadline is not None and time.monotonic() > deadline:
+                    print(f"Deadline reached while ingesting {len(sites)} sites - stopping early")
+                    break
+        
+        if buffer:
+            timed('write', flush)
+        add_timing('parse', (time.perf_counter() - loop_started) * 1000 - nested_ms[0])
+    finally:
+        response.close()
+    
+    # Advance checkpoints only once the readings are stored
+    with phase('write'):
+        put_states(build_checkpoints(newest, now, trends), dynamodb)
+    debug(lambda: f"Chunk {sites[0]}..{sites[-1]}: {stats['records_processed']} stored, "
+                  f"{stats['records_skipped']} skipped, {len(newest)} checkpoints advanced")
+    return stats
+
+@instrumented('usgs-data-collector')
+def lambda_handler(event, context):
+    """Collect USGS stream gauge data for Potomac River basin"""
+    
+    # Gauge sites (configurable with USGS_SITES)
+    sites = get_usgs_sites(event)
+    max_workers = int(os.environ.get('USGS_MAX_WORKERS', DEFAULT_MAX_WORKERS))
+    
+    dynamodb = get_resource('dynamodb')
+    now = datetime.now(timezone.utc)
+    
+    try:
+        # Fetch only what arrived since each gauge's checkpoint
+        with phase('query'):
+            checkpoints, trends = load_checkpoints(sites, dynamodb)
+        
+        # Calculate TTL (2 days from now)
+        ttl = int(time.time()) + (2 * 24 * 60 * 60)  # 2 days in seconds
+        
+        # Site chunks are fetched and stored in parallel
+        chunks = chunk_sites(sites)
+        session = get_http_session('usgs', max_workers)
+        deadline = get_deadline(context)
+        outcomes = run_all(
+            lambda chunk: ingest_chunk(session, dynamodb, chunk, checkpoints, now, ttl, deadline, trends),
+            chunks, max_workers=max_workers, deadline=deadline
+        )
         
         records_processed = 0
+        records_skipped = 0
         errors = []
         
-        for site in data['value']['timeSeries']:
-            try:
-                gauge_id = site['sourceInfo']['siteCode'][0]['value']
-                location_name = site['sourceInfo']['siteName']
-                
-                # Set flood stages for each gauge
-                flood_stages = {
-                    '01646500': 10.0,  # Chain Bridge
-                    '01594440': 15.0,  # Patuxent River
-                    '01638500': 18.0   # Point of Rocks
-                }
-                flood_stage = flood_stages.get(gauge_id, 10.0)
-                
-                for reading in site['values'][0]['value']:
-                    if reading['value'] and reading['value'] != '-999999':
-                        water_level = Decimal(str(reading['value']))
-                        
-                        # Calculate trend (simplified)
-                        trend = 'stable'  # Would calculate from previous readings
-                        
-                        # Calculate TTL (2 days from now)
-                        import time
-                        ttl = int(time.time()) + (2 * 24 * 60 * 60)  # 2 days in seconds
-                        
-                        # Store reading
-                        table.put_item(Item={
-                            'gauge_id': gauge_id,
-                            'timestamp': reading['dateTime'],
-                            'water_level': water_level,
-                            'flood_stage': Decimal(str(flood_stage)),
-                            'location_name': location_name,
-                            'trend': trend,
-                            'ttl': ttl
-                        })
-                        
-                        records_processed += 1
-            except Exception as site_error:
-                error_msg = f"Error processing gauge {gauge_id}: {str(site_error)}"
+        for chunk, outcome in zip(chunks, outcomes):
+            if 'error' in outcome:
+                error_msg = f"Error processing gauges {chunk[0]}..{chunk[-1]} ({len(chunk)} sites): {outcome['error']}"
                 print(error_msg)
                 errors.append(error_msg)
-                continue  # Continue processing other gauges
+                continue  # Continue processing other chunks
+            
+            records_processed += outcome['result']['records_processed']
+            records_skipped += outcome['result']['records_skipped']
+        
+        add_count('sites', len(sites))
+        add_count('chunks', len(chunks))
+        add_count('records_processed', records_processed)
+        add_count('records_skipped', records_skipped)
+        add_count('errors', len(errors))
+        
+        # No chunk succeeded - report the underlying failure below
+        if len(errors) == len(chunks) and chunks:
+            raise outcomes[0]['error']
         
         return {
             'statusCode': 200,
             'body': json.dumps({
                 'message': 'USGS data processed successfully',
                 'records_processed': records_processed,
+                'records_skipped': records_skipped,
+                'sites_requested': len(sites),
                 'errors': errors if errors else None
             })
         }
-        
-    except requests.exceptions.Timeout:
-        print("Error: USGS API request timed out after 30 seconds")
+    
+    except (requests.exceptions.Timeout, TimeoutError):
+        print("Error: USGS API request timed out")
         return {
             'statusCode': 504,
             'body': json.dumps({
@@ -108,7 +345,7 @@ def lambda_handler(event, context):
     except requests.exceptions.HTTPError as http_err:
         print(f"Error: USGS API HTTP error: {http_err}")
         return {
-            'statusCode': response.status_code if 'response' in locals() else 500,
+            'statusCode': http_err.response.status_code if http_err.response is not None else 500,
             'body': json.dumps({
                 'error': 'USGS API HTTP error',
                 'message': str(http_err),
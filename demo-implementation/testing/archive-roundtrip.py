@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Cold Archive Round Trip
+Fills the DynamoDB tables with several days of synthetic readings, runs the
+reading archiver once per simulated day and checks what comes back out of
+the S3 archive
+
+DynamoDB and S3 are served in-process by moto, so nothing touches AWS.
+Reports archive size against the raw items, confirms every archived value
+matches DynamoDB, and shows how many bytes a one-day range read fetches
+compared with the whole archive.
+
+Usage:
+    python archive-roundtrip.py
+    python archive-roundtrip.py --days 20 --gauges 5 --stations 3
+
+Requires: pip install moto
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+TESTING_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(TESTING_DIR, '..', 'lambda-functions')
+
+REGION = 'us-east-1'
+ARCHIVE_BUCKET = 'flood-data-archive-roundtrip'
+
+def configure_environment():
+    """Local credentials and archive settings, before the handler is imported"""
+    os.environ.update({
+        'AWS_DEFAULT_REGION': REGION,
+        'AWS_REGION': REGION,
+        'AWS_ACCESS_KEY_ID': 'roundtrip',
+        'AWS_SECRET_ACCESS_KEY': 'roundtrip',
+        'ARCHIVE_BUCKET': ARCHIVE_BUCKET
+    })
+    sys.path.insert(0, LAMBDA_DIR)
+
+def create_tables(dynamodb):
+    """The two reading tables as defined in the CloudFormation template"""
+    for name, key in (('FloodGaugeReadings', 'gauge_id'), ('WeatherObservations', 'station_id')):
+        dynamodb.create_table(
+            TableName=name,
+            KeySchema=[{'AttributeName': key, 'KeyType': 'HASH'},
+                       {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}],
+            AttributeDefinitions=[{'AttributeName': key, 'AttributeType': 'S'},
+                                  {'AttributeName': 'timestamp', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+
+def fill_tables(dynamodb, sites, stations, start, days, ttl):
+    """15-minute gauge readings (site-local times) and hourly observations (UTC)"""
+    local = timezone(timedelta(hours=-5))
+    gauges = dynamodb.Table('FloodGaugeReadings')
+    weather = dynamodb.Table('WeatherObservations')
+    items = 0
+    with gauges.batch_writer() as batch:
+        for site_index, site in enumerate(sites):
+            for step in range(days * 96):
+                moment = start + timedelta(minutes=15 * step)
+                level = 4 + site_index + ((step % 192) - 96) ** 2 / 4000
+                batch.put_item(Item={
+                    'gauge_id': site,
+                    'timestamp': moment.astimezone(local).isoformat(timespec='milliseconds'),
+                    'water_level': Decimal(f'{level:.2f}'),
+                    'flood_stage': Decimal('10.0'),
+                    'location_name': f'POTOMAC RIVER SITE {site}',
+                    'trend': 'rising' if step % 192 > 96 else 'falling',
+                    'rate_of_rise': Decimal(f'{((step % 192) - 96) / 2000:.4f}'),
+                    'ttl': ttl
+                })
+                items += 1
+    with weather.batch_writer() as batch:
+        for station in stations:
+            for step in range(days * 24):
+                moment = start + timedelta(hours=step)
+                batch.put_item(Item={
+                    'station_id': station,
+                    'timestamp': moment.isoformat(),
+                    'precipitation_1hr': Decimal(str(round((step % 7) * 0.0393701, 6))),
+                    'precipitation_forecast_24hr': Decimal('0.0'),
+                    'temperature': Decimal(str(round(10 + (step % 24) / 3, 1))),
+                    'location_name': f'Weather Station {station}',
+                    'ttl': ttl
+                })
+                items += 1
+    return items
+
+def table_bytes(dynamodb):
+    """Rough stored size of every item (attribute names plus values, as DynamoDB bills)"""
+    total = 0
+    for name in ('FloodGaugeReadings', 'WeatherObservations'):
+        params = {}
+        while True:
+            response = dynamodb.Table(name).scan(**params)
+            for item in response['Items']:
+                total += sum(len(key) + len(str(value)) for key, value in item.items())
+            if 'LastEvaluatedKey' not in response:
+                break
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    return total
+
+def count_s3_reads(s3):
+    """Count GetObject calls and the bytes they return"""
+    counts = {'gets': 0, 'bytes': 0}
+    
+    def after_call(http_response, parsed, **kwargs):
+        counts['gets'] += 1
+        counts['bytes'] += int(parsed.get('ContentLength') or 0)
+    
+    s3.meta.events.register('after-call.s3.GetObject', after_call)
+    return counts
+
+def check_values(cold_archive, dynamodb, source, key_value, start, end):
+    """Archived columns for one ID against the DynamoDB items; returns mismatches"""
+    from flood_data_access import parse_timestamp, query_time_window
+    
+    table = 'FloodGaugeReadings' if source == 'usgs' else 'WeatherObservations'
+    key_name = cold_archive.KEY_NAMES[source]
+    items = query_time_window(dynamodb.Table(table), key_name, key_value, start, end)
+    archived = cold_archive.read_archive(source, key_value, start, end)
+    
+    mismatches = []
+    if len(items) != len(archived['timestamp']):
+        mismatches.append(f"{source} {key_value}: {len(items)} items, {len(archived['timestamp'])} archived")
+        return mismatches
+    for row, item in enumerate(items):
+        if int(parse_timestamp(item['timestamp']).timestamp()) != archived['timestamp'][row]:
+            mismatches.append(f"{source} {key_value}: timestamp differs at row {row}")
+            break
+        for name, value in item.items():
+            if name in ('timestamp', 'ttl', key_name):
+                continue
+            stored = archived[name][row]
+            expected = float(value) if isinstance(value, Decimal) else value
+            if stored != expected:
+                mismatches.append(f"{source} {key_value}: {name} {stored!r} != {expected!r} at row {row}")
+                break
+    return mismatches
+
+def run_roundtrip(days, gauge_count, station_count):
+    """Fill, archive day by day, verify and measure; returns the report dict"""
+    import boto3
+    from moto import mock_aws
+    
+    with mock_aws():
+        dynamodb = boto3.resource('dynamodb')
+        create_tables(dynamodb)
+        boto3.client('s3').create_bucket(Bucket=ARCHIVE_BUCKET)
+        
+        import cold_archive
+        import reading_archiver
+        from aws_runtime import get_client
+        from monitoring_config import DEFAULT_NOAA_STATIONS, DEFAULT_USGS_SITES
+        
+        sites = (DEFAULT_USGS_SITES + [f'0165{index:04d}' for index in range(gauge_count)])[:gauge_count]
+        stations = (DEFAULT_NOAA_STATIONS + [f'K{index:03d}' for index in range(station_count)])[:station_count]
+        now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        start = now - timedelta(days=days)
+        ttl = int(now.timestamp()) + 14 * 86400
+        items = fill_tables(dynamodb, sites, stations, start, days, ttl)
+        raw_bytes = table_bytes(dynamodb)
+        
+        # One archiver run per simulated day, oldest first
+        event = {'sites': sites, 'stations': stations}
+        os.environ['ARCHIVE_INITIAL_LOOKBACK_HOURS'] = str(days * 24 + 24)
+        rows_archived = 0
+        for day in range(days - 1, -1, -1):
+            os.environ['ARCHIVE_AFTER_HOURS'] = str(day * 24)
+            with contextlib.redirect_stdout(io.StringIO()):
+                response = reading_archiver.lambda_handler(event, None)
+            body = json.loads(response['body'])
+            if body['errors']:
+                raise RuntimeError(body['errors'])
+            rows_archived += body['rows_archived']
+        
+        s3 = get_client('s3')
+        objects = s3.list_objects_v2(Bucket=ARCHIVE_BUCKET)['Contents']
+        part_bytes = sum(obj['Size'] for obj in objects if obj['Key'].endswith('.fca'))
+        parts = sum(1 for obj in objects if obj['Key'].endswith('.fca'))
+        
+        mismatches = []
+        for site in sites:
+            mismatches += check_values(cold_archive, dynamodb, 'usgs', site, start, now)
+        for station in stations:
+            mismatches += check_values(cold_archive, dynamodb, 'noaa', station, start, now)
+        
+        # One day from the middle of one gauge's history
+        reads = count_s3_reads(s3)
+        day_start = start + timedelta(days=days // 2)
+        day = cold_archive.read_archive('usgs', sites[0], day_start, day_start + timedelta(hours=23, minutes=59))
+        gauge_bytes = sum(obj['Size'] for obj in objects
+                          if f"gauge_id={sites[0]}/" in obj['Key'] and obj['Key'].endswith('.fca'))
+        
+        return {
+            'items': items,
+            'rows_archived': rows_archived,
+            'raw_item_bytes': raw_bytes,
+            'archive_bytes': part_bytes,
+            'archive_parts': parts,
+            'mismatches': mismatches,
+            'range_rows': len(day['timestamp']),
+            'range_gets': reads['gets'],
+            'range_bytes': reads['bytes'],
+            'gauge_archive_bytes': gauge_bytes
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description='Round-trip readings through the S3 cold archive')
+    parser.add_argument('--days', type=int, default=12, help='Days of synthetic readings')
+    parser.add_argument('--gauges', type=int, default=3, help='Gauges to archive')
+    parser.add_argument('--stations', type=int, default=3, help='Weather stations to archive')
+    args = parser.parse_args()
+    
+    configure_environment()
+    print("=" * 70)
+    print("COLD ARCHIVE ROUND TRIP (moto)")
+    print("=" * 70)
+    report = run_roundtrip(args.days, args.gauges, args.stations)
+    
+    print(f"📥 {report['items']} DynamoDB items, {report['rows_archived']} rows archived "
+          f"in {report['archive_parts']} parts")
+    print(f"📦 {report['raw_item_bytes'] / 1024:.0f} KB of items -> {report['archive_bytes'] / 1024:.1f} KB archived "
+          f"({report['raw_item_bytes'] / max(report['archive_bytes'], 1):.0f}x smaller)")
+    print(f"🔎 One-day range read: {report['range_rows']} rows, {report['range_gets']} GETs, "
+          f"{report['range_bytes']} bytes (gauge archive is {report['gauge_archive_bytes']} bytes)")
+    if report['mismatches']:
+        print("❌ Archived values differ from DynamoDB:")
+        for mismatch in report['mismatches'][:10]:
+            print(f"   {mismatch}")
+        sys.exit(1)
+    print("✅ Every archived value matches DynamoDB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,581 @@
+#!/usr/bin/env python3
+"""
+Lambda Benchmark Suite - Record/Replay
+Runs the collector and predictor lambda_handlers at increasing gauge and
+station counts without touching live APIs or AWS
+
+USGS/NOAA responses are replayed from recordings by a local HTTP stand-in,
+and DynamoDB/S3/SNS are served in-process by moto. Reports latency
+percentiles, throughput, API call counts and peak memory, and saves JSON
+results tagged with the git commit so runs can be compared across commits.
+
+Usage:
+    python benchmark-lambdas.py --record              # capture live API responses once
+    python benchmark-lambdas.py                       # replay at the default scales
+    python benchmark-lambdas.py --gauges 1,10,100 --iterations 10
+    python benchmark-lambdas.py --compare benchmark-results/<old commit>.json
+    python benchmark-lambdas.py --storage-mode bucketed --compare benchmark-results/<items run>.json
+
+Requires: pip install moto numpy (scikit-learn for --model pipeline/forest)
+"""
+
+import argparse
+import contextlib
+import copy
+import http.server
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+TESTING_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(TESTING_DIR, '..', 'lambda-functions')
+RECORDINGS_DIR = os.path.join(TESTING_DIR, 'recordings')
+RESULTS_DIR = os.path.join(TESTING_DIR, 'benchmark-results')
+
+LIVE_USGS_URL = "https://waterservices.usgs.gov/nwis/iv/"
+LIVE_NOAA_URL = "https://api.weather.gov"
+RECORDED_SITES = ['01646500', '01594440', '01638500']
+RECORDED_STATIONS = ['KDCA', 'KIAD', 'KADW']
+
+ACCOUNT_ID = '123456789012'
+REGION = 'us-east-1'
+
+# Minimal responses in the live APIs' shapes, used until --record has run
+TEMPLATE_USGS = {
+    'value': {'timeSeries': [{
+        'sourceInfo': {'siteName': 'POTOMAC RIVER NEAR WASH, DC LITTLE FALLS PUMP STA',
+                       'siteCode': [{'value': '01646500'}]},
+        'values': [{'value': [{'value': str(4.0 + 0.05 * step), 'qualifiers': ['P'],
+                               'dateTime': '2024-01-29T10:00:00.000-05:00'} for step in range(16)]}]
+    }]}
+}
+TEMPLATE_OBSERVATION = {
+    'properties': {
+        'timestamp': '2024-01-29T15:00:00+00:00',
+        'temperature': {'unitCode': 'wmoUnit:degC', 'value': 8.3},
+        'precipitationLastHour': {'unitCode': 'wmoUnit:mm', 'value': 1.2}
+    }
+}
+TEMPLATE_ALERTS = {'type': 'FeatureCollection', 'features': []}
+TEMPLATE_STATION = {'geometry': {'type': 'Point', 'coordinates': [-77.03417, 38.84833]}}
+TEMPLATE_POINT = {'properties': {'gridId': 'LWX', 'gridX': 97, 'gridY': 69}}
+TEMPLATE_GRIDPOINT = {
+    'properties': {
+        'quantitativePrecipitation': {
+            'uom': 'wmoUnit:mm',
+            'values': [{'validTime': f'2024-01-29T{hour:02d}:00:00+00:00/PT6H', 'value': value}
+                       for hour, value in ((0, 0.0), (6, 1.524), (12, 3.81), (18, 0.762))]
+        }
+    }
+}
+
+# Replayed gridpoint forecasts carry an ETag and stay fresh this long
+GRIDPOINT_MAX_AGE = 3600
+
+def record_responses():
+    """Capture one live response per endpoint into recordings/"""
+    import requests
+    
+    os.makedirs(RECORDINGS_DIR, exist_ok=True)
+    headers = {'User-Agent': 'FloodMonitoringSystem/1.0'}
+    
+    response = requests.get(LIVE_USGS_URL, params={
+        'format': 'json', 'sites': ','.join(RECORDED_SITES), 'parameterCd': '00065', 'period': 'PT4H'
+    }, timeout=30)
+    response.raise_for_status()
+    save_recording('usgs_iv.json', response.json())
+    
+    for station in RECORDED_STATIONS:
+        response = requests.get(f"{LIVE_NOAA_URL}/stations/{station}/observations/latest",
+                                headers=headers, timeout=30)
+        response.raise_for_status()
+        save_recording(f'noaa_latest_{station}.json', response.json())
+    
+    response = requests.get(f"{LIVE_NOAA_URL}/alerts", params={'area': 'DC', 'event': 'Flood'},
+                            headers=headers, timeout=30)
+    response.raise_for_status()
+    save_recording('noaa_alerts.json', response.json())
+    
+    # One station's gridpoint chain stands in for every station's forecast
+    response = requests.get(f"{LIVE_NOAA_URL}/stations/{RECORDED_STATIONS[0]}", headers=headers, timeout=30)
+    response.raise_for_status()
+    station = response.json()
+    save_recording('noaa_station.json', station)
+    longitude, latitude = station['geometry']['coordinates'][:2]
+    response = requests.get(f"{LIVE_NOAA_URL}/points/{latitude:.4f},{longitude:.4f}", headers=headers, timeout=30)
+    response.raise_for_status()
+    point = response.json()
+    save_recording('noaa_point.json', point)
+    properties = point['properties']
+    grid = f"{properties['gridId']}/{properties['gridX']},{properties['gridY']}"
+    response = requests.get(f"{LIVE_NOAA_URL}/gridpoints/{grid}", headers=headers, timeout=30)
+    response.raise_for_status()
+    save_recording('noaa_gridpoint.json', response.json())
+    print(f"📼 Recorded responses to {RECORDINGS_DIR}")
+
+def save_recording(name, data):
+    with open(os.path.join(RECORDINGS_DIR, name), 'w') as f:
+        json.dump(data, f, indent=1)
+
+def load_recordings():
+    """Recorded responses, falling back to the built-in templates"""
+    def load(name, default):
+        path = os.path.join(RECORDINGS_DIR, name)
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                return json.load(f), True
+        return default, False
+    
+    usgs, recorded = load('usgs_iv.json', TEMPLATE_USGS)
+    observations = []
+    for station in RECORDED_STATIONS:
+        observation, station_recorded = load(f'noaa_latest_{station}.json', TEMPLATE_OBSERVATION)
+        recorded = recorded and station_recorded
+        observations.append(observation)
+    alerts, alerts_recorded = load('noaa_alerts.json', TEMPLATE_ALERTS)
+    station, _ = load('noaa_station.json', TEMPLATE_STATION)
+    point, _ = load('noaa_point.json', TEMPLATE_POINT)
+    gridpoint, _ = load('noaa_gridpoint.json', TEMPLATE_GRIDPOINT)
+    
+    # Replay needs at least one site with readings
+    series = [site for site in usgs['value']['timeSeries'] if site['values'][0]['value']]
+    return {
+        'usgs_series': series or TEMPLATE_USGS['value']['timeSeries'],
+        'observations': observations,
+        'alerts': alerts,
+        'station': station,
+        'point': point,
+        'gridpoint': gridpoint,
+        'recorded': recorded and alerts_recorded and bool(series)
+    }
+
+def usgs_response(recordings, sites, start, now):
+    """IV response for any site list, cycling the recorded values onto a 15-minute grid"""
+    time_series = []
+    first = start.replace(second=0, microsecond=0)
+    first += timedelta(minutes=(-first.minute) % 15)
+    for index, site in enumerate(sites):
+        template = recordings['usgs_series'][index % len(recordings['usgs_series'])]
+        values = template['values'][0]['value']
+        readings = []
+        moment = first
+        step = 0
+        while moment <= now:
+            reading = dict(values[step % len(values)])
+            reading['dateTime'] = moment.isoformat(timespec='milliseconds')
+            readings.append(reading)
+            moment += timedelta(minutes=15)
+            step += 1
+        
+        site_series = copy.deepcopy(template)
+        site_series['sourceInfo']['siteCode'][0]['value'] = site
+        site_series['values'][0]['value'] = readings
+        time_series.append(site_series)
+    return {'value': {'timeSeries': time_series}}
+
+def gridpoint_response(recordings, now):
+    """Gridpoint forecast with its QPF intervals moved to start at the current hour"""
+    body = copy.deepcopy(recordings['gridpoint'])
+    values = body['properties']['quantitativePrecipitation']['values']
+    if values:
+        first = datetime.fromisoformat(values[0]['validTime'].split('/')[0])
+        shift = now.replace(minute=0, second=0, microsecond=0) - first
+        for value in values:
+            start, duration = value['validTime'].split('/')
+            value['validTime'] = f"{(datetime.fromisoformat(start) + shift).isoformat()}/{duration}"
+    return body
+
+def start_replay_server(recordings):
+    """Local HTTP stand-in for the USGS IV and weather.gov endpoints"""
+    counts = {'usgs': 0, 'noaa_observation': 0, 'noaa_alerts': 0, 'noaa_forecast': 0}
+    # Forecasts keep one ETag per server run, so revalidations answer 304
+    etag = f'"{int(time.time())}"'
+    lock = threading.Lock()
+    
+    class ReplayHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            now = datetime.now(timezone.utc)
+            status = 200
+            headers = {}
+            
+            if url.path.startswith('/nwis/iv'):
+                kind = 'usgs'
+                start = datetime.fromisoformat(query['startDT'][0].replace('Z', '+00:00')) \
+                    if 'startDT' in query else now - timedelta(hours=4)
+                body = usgs_response(recordings, query['sites'][0].split(','), start, now)
+            elif url.path == '/alerts':
+                kind = 'noaa_alerts'
+                body = recordings['alerts']
+            elif url.path.startswith('/gridpoints/'):
+                kind = 'noaa_forecast'
+                headers = {'ETag': etag, 'Cache-Control': f'max-age={GRIDPOINT_MAX_AGE}'}
+                if self.headers.get('If-None-Match') == etag:
+                    status = 304
+                    body = None
+                else:
+                    body = gridpoint_response(recordings, now)
+            elif url.path.startswith('/points/'):
+                kind = 'noaa_forecast'
+                body = recordings['point']
+            elif not url.path.endswith('/observations/latest'):
+                kind = 'noaa_forecast'
+                body = recordings['station']
+            else:
+                kind = 'noaa_observation'
+                station = url.path.split('/')[2]
+                index = sum(map(ord, station)) % len(recordings['observations'])
+                body = copy.deepcopy(recordings['observations'][index])
+                body['properties']['timestamp'] = now.replace(minute=0, second=0, microsecond=0).isoformat()
+                # Observations change hourly, like the live endpoint
+                headers = {'ETag': f'"{station}-{body["properties"]["timestamp"]}"'}
+                if self.headers.get('If-None-Match') == headers['ETag']:
+                    status = 304
+                    body = None
+            
+            with lock:
+                counts[kind] += 1
+            payload = b'' if body is None else json.dumps(body).encode()
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        
+        def log_message(self, *args):
+            pass
+    
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ReplayHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, counts
+
+def configure_environment(base_url):
+    """Point the handlers at the stand-ins before they are imported"""
+    os.environ.update({
+        'USGS_API_URL': f"{base_url}/nwis/iv/",
+        'NOAA_API_URL': base_url,
+        'AWS_DEFAULT_REGION': REGION,
+        'AWS_REGION': REGION,
+        'AWS_ACCESS_KEY_ID': 'benchmark',
+        'AWS_SECRET_ACCESS_KEY': 'benchmark',
+        'AWS_ACCOUNT_ID': ACCOUNT_ID
+    })
+    sys.path.insert(0, LAMBDA_DIR)
+
+def count_aws_calls():
+    """Count AWS API calls per service.operation made through the default boto3 session"""
+    import boto3
+    
+    counts = {}
+    lock = threading.Lock()
+    
+    def before_call(model, **kwargs):
+        with lock:
+            key = f"{model.service_model.service_name}.{model.name}"
+            counts[key] = counts.get(key, 0) + 1
+    
+    boto3.setup_default_session(region_name=REGION)
+    boto3.DEFAULT_SESSION.events.register('before-call', before_call)
+    return counts
+
+def create_tables():
+    """DynamoDB tables as defined in the CloudFormation template"""
+    import boto3
+    
+    dynamodb = boto3.resource('dynamodb')
+    for name, key, sort_key in (('FloodGaugeReadings', 'gauge_id', 'timestamp'),
+                                ('FloodGaugeBuckets', 'gauge_id', 'timestamp'),
+                                ('WeatherObservations', 'station_id', 'timestamp'),
+                                ('FloodMonitoringState', 'state_id', None)):
+        schema = [{'AttributeName': key, 'KeyType': 'HASH'}]
+        attributes = [{'AttributeName': key, 'AttributeType': 'S'}]
+        if sort_key:
+            schema.append({'AttributeName': sort_key, 'KeyType': 'RANGE'})
+            attributes.append({'AttributeName': sort_key, 'AttributeType': 'S'})
+        dynamodb.create_table(TableName=name, KeySchema=schema, AttributeDefinitions=attributes,
+                              BillingMode='PAY_PER_REQUEST')
+
+def reset_tables():
+    """Drop and recreate the tables so every iteration does the same work"""
+    import boto3
+    
+    client = boto3.client('dynamodb')
+    for name in client.list_tables()['TableNames']:
+        client.delete_table(TableName=name)
+    create_tables()
+
+def create_alerting_resources(model_kind):
+    """SNS topics and the model bucket (with a pipeline artifact, compiled too for --model forest)"""
+    import boto3
+    
+    sns = boto3.client('sns')
+    for level in ('emergency', 'warning', 'watch'):
+        sns.create_topic(Name=f'flood-alerts-{level}')
+    
+    bucket = f'flood-prediction-models-{ACCOUNT_ID}'
+    s3 = boto3.client('s3')
+    s3.create_bucket(Bucket=bucket)
+    if model_kind == 'threshold':
+        return
+    
+    import numpy as np
+    import feature_pipeline
+    from sklearn.ensemble import RandomForestClassifier
+    
+    rng = np.random.default_rng(42)
+    X = rng.normal(5.0, 2.0, (2000, len(feature_pipeline.PIPELINE_FEATURES)))
+    y = (X[:, 0] > 7.0).astype(int)
+    model = RandomForestClassifier(n_estimators=100, max_depth=10, random_state=42)
+    artifact = feature_pipeline.fit_pipeline(X, y, feature_pipeline.PIPELINE_FEATURES, model)
+    
+    path = os.path.join(RESULTS_DIR, 'benchmark_pipeline.joblib')
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    feature_pipeline.save_artifact(artifact, path)
+    s3.upload_file(path, bucket, feature_pipeline.ARTIFACT_KEY)
+    os.remove(path)
+    if model_kind == 'forest':
+        import forest_model
+        path = os.path.join(RESULTS_DIR, 'benchmark_forest.bin')
+        forest_model.export_forest(artifact, path)
+        s3.upload_file(path, bucket, feature_pipeline.FOREST_KEY)
+        os.remove(path)
+
+def gauge_ids(count):
+    """The real monitored gauges first, then synthetic site numbers"""
+    ids = list(RECORDED_SITES[:count])
+    ids += [f"09{index:06d}" for index in range(count - len(ids))]
+    return ids
+
+def station_ids(count):
+    """The real monitored stations first, then synthetic station codes"""
+    ids = list(RECORDED_STATIONS[:count])
+    ids += [f"KX{index:02d}" for index in range(count - len(ids))]
+    return ids
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+def run_case(name, handler, event, scale, units, iterations, http_counts, aws_counts, before=None,
+             verbose=False):
+    """
+    Invoke one handler repeatedly and summarize latency, throughput, calls and memory
+    
+    The first invocation is reported separately (it pays for connections,
+    model loading and other warm-up); percentiles cover the rest. Peak
+    memory is measured on one extra invocation under tracemalloc.
+    """
+    context = SimpleNamespace(
+        function_name=name,
+        invoked_function_arn=f"arn:aws:lambda:{REGION}:{ACCOUNT_ID}:function:{name}",
+        get_remaining_time_in_millis=lambda: 900000
+    )
+    
+    calls = {'http': 0, 'aws': {}}
+    
+    def invoke():
+        if before:
+            before()
+        output = sys.stdout if verbose else io.StringIO()
+        http_before = sum(http_counts.values())
+        aws_before = dict(aws_counts)
+        with contextlib.redirect_stdout(output):
+            started = time.perf_counter()
+            response = handler(event, context)
+            elapsed = time.perf_counter() - started
+        if response.get('statusCode') != 200:
+            raise RuntimeError(f"{name} returned {response.get('statusCode')}: {response.get('body')}")
+        
+        # Only calls made by the handler itself (not table resets) are counted
+        calls['http'] += sum(http_counts.values()) - http_before
+        for key, count in aws_counts.items():
+            if count != aws_before.get(key, 0):
+                calls['aws'][key] = calls['aws'].get(key, 0) + count - aws_before.get(key, 0)
+        return elapsed
+    
+    first = invoke()
+    calls['http'] = 0
+    calls['aws'] = {}
+    
+    latencies = sorted(invoke() for _ in range(iterations))
+    http_calls = calls['http'] / iterations
+    aws_calls = {key: round(count / iterations, 1) for key, count in sorted(calls['aws'].items())}
+    
+    tracemalloc.start()
+    invoke()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    mean = sum(latencies) / len(latencies)
+    return {
+        'handler': name,
+        'scale': scale,
+        'first_ms': round(first * 1000, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+        'p90_ms': round(percentile(latencies, 0.90) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'mean_ms': round(mean * 1000, 1),
+        'throughput': round(units / mean, 1),
+        'throughput_unit': 'gauges/s' if 'gauge' in scale else 'stations/s',
+        'http_calls': round(http_calls, 1),
+        'aws_calls': sum(aws_calls.values()),
+        'aws_calls_by_operation': aws_calls,
+        'peak_memory_mb': round(peak / 1024 / 1024, 2)
+    }
+
+def run_benchmarks(gauge_counts, station_counts, iterations, model_kind, verbose=False):
+    """Run every handler at every scale inside one moto session"""
+    from moto import mock_aws
+    
+    recordings = load_recordings()
+    server, http_counts = start_replay_server(recordings)
+    configure_environment(f"http://127.0.0.1:{server.server_port}")
+    
+    results = []
+    with mock_aws():
+        # moto replaces the default session on entry, so hook the new one
+        aws_counts = count_aws_calls()
+        create_tables()
+        create_alerting_resources(model_kind)
+        
+        import usgs_data_collector
+        import noaa_data_collector
+        import ml_flood_predictor
+        
+        for count in gauge_counts:
+            event = {'sites': gauge_ids(count)}
+            results.append(run_case('usgs_data_collector', usgs_data_collector.lambda_handler, event,
+                                    f'{count} gauges', count, iterations, http_counts, aws_counts,
+                                    before=reset_tables, verbose=verbose))
+            print_result(results[-1])
+        
+        for count in station_counts:
+            event = {'stations': station_ids(count)}
+            results.append(run_case('noaa_data_collector', noaa_data_collector.lambda_handler, event,
+                                    f'{count} stations', count, iterations, http_counts, aws_counts,
+                                    verbose=verbose))
+            print_result(results[-1])
+        
+        for count in gauge_counts:
+            gauges = gauge_ids(count)
+            stations = station_ids(min(count, max(station_counts)))
+            pairs = [f"{gauge}:{stations[index % len(stations)]}" for index, gauge in enumerate(gauges)]
+            
+            # Seed a full lookback window for every gauge and station being scored
+            # (the collector's warm cache would skip observations it already stored)
+            reset_tables()
+            noaa_data_collector._observations.clear()
+            with contextlib.redirect_stdout(io.StringIO()):
+                usgs_data_collector.lambda_handler({'sites': gauges}, None)
+                noaa_data_collector.lambda_handler({'stations': stations}, None)
+            
+            results.append(run_case('ml_flood_predictor', ml_flood_predictor.lambda_handler,
+                                    {'gauges': pairs}, f'{count} gauges', count, iterations,
+                                    http_counts, aws_counts, verbose=verbose))
+            print_result(results[-1])
+    
+    server.shutdown()
+    return results, recordings['recorded']
+
+def print_result(result):
+    print(f"   {result['handler']:<22} {result['scale']:>12}  p50 {result['p50_ms']:>8.1f} ms  "
+          f"p90 {result['p90_ms']:>8.1f} ms  p99 {result['p99_ms']:>8.1f} ms  "
+          f"{result['throughput']:>8.1f} {result['throughput_unit']:<10}  "
+          f"http {result['http_calls']:>5.1f}  aws {result['aws_calls']:>6.1f}  "
+          f"peak {result['peak_memory_mb']:>7.2f} MB")
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=TESTING_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return 'unknown'
+
+def compare_results(results, baseline_path):
+    """Print p50 and peak memory changes against an earlier results file"""
+    with open(baseline_path, 'r') as f:
+        baseline = json.load(f)
+    previous = {(result['handler'], result['scale']): result for result in baseline['results']}
+    
+    print(f"\n📊 Compared with {baseline.get('commit', baseline_path)}:")
+    for result in results:
+        old = previous.get((result['handler'], result['scale']))
+        if not old:
+            continue
+        change = (result['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100 if old['p50_ms'] else 0.0
+        print(f"   {result['handler']:<22} {result['scale']:>12}  p50 {old['p50_ms']:>8.1f} -> "
+              f"{result['p50_ms']:>8.1f} ms ({change:+.1f}%)  peak {old['peak_memory_mb']:.2f} -> "
+              f"{result['peak_memory_mb']:.2f} MB  aws calls {old['aws_calls']} -> {result['aws_calls']}")
+
+def parse_counts(value):
+    return [int(item) for item in value.split(',') if item.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Lambda handlers against local stand-ins')
+    parser.add_argument('--record', action='store_true', help='Capture live API responses first')
+    parser.add_argument('--gauges', default='1,10,50,100', help='Gauge counts to run')
+    parser.add_argument('--stations', default='1,5,20', help='Station counts to run')
+    parser.add_argument('--iterations', type=int, default=5, help='Timed invocations per case')
+    parser.add_argument('--model', choices=['threshold', 'pipeline', 'forest'], default='pipeline',
+                        help='Predictor model (pipeline: a 100-tree forest artifact, forest: also compiled)')
+    parser.add_argument('--storage-mode', choices=['items', 'bucketed'], default='items',
+                        help='Gauge reading storage the collector and predictor use')
+    parser.add_argument('--output', default=None, help='Results file (default benchmark-results/<commit>.json)')
+    parser.add_argument('--compare', default=None, help='Earlier results file to compare against')
+    parser.add_argument('--verbose', action='store_true', help='Show handler output')
+    args = parser.parse_args()
+    
+    if args.record:
+        record_responses()
+    os.environ['STORAGE_MODE'] = args.storage_mode
+    
+    print("=" * 70)
+    print("LAMBDA BENCHMARK (local replay)")
+    print("=" * 70)
+    results, recorded = run_benchmarks(parse_counts(args.gauges), parse_counts(args.stations),
+                                       args.iterations, args.model, args.verbose)
+    if not recorded:
+        print("\n⚠️ No recordings found - replayed built-in response templates (run with --record)")
+    
+    commit = git_commit()
+    report = {
+        'commit': commit,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'iterations': args.iterations,
+        'model': args.model,
+        'storage_mode': args.storage_mode,
+        'recorded_responses': recorded,
+        'results': results
+    }
+    
+    output = args.output or os.path.join(RESULTS_DIR, f'{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Results saved to {output}")
+    
+    if args.compare:
+        compare_results(results, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Compiled Forest Parity and Benchmark
+Trains a forest the way the notebook does, compiles it with forest_model and
+checks that the NumPy evaluator returns exactly sklearn's predict_proba,
+then times both for batch sizes from 1 to 1M rows
+
+Parity is checked bit for bit on random rows and on rows sitting exactly
+on (and one float32 step either side of) every split threshold. The report
+also compares file sizes, load times and the import cost each path adds to
+a cold start.
+
+Usage:
+    python forest-benchmark.py
+    python forest-benchmark.py --trees 200 --max-depth 16 --sizes 1,100,10000
+    python forest-benchmark.py --parity-only
+
+Requires: pip install scikit-learn joblib
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+TESTING_DIR = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(TESTING_DIR, '..', 'lambda-functions')
+sys.path.insert(0, LAMBDA_DIR)
+
+from feature_pipeline import (PIPELINE_FEATURES, fit_pipeline, load_artifact, predict_proba, save_artifact,
+                              transform)
+from forest_model import export_forest, forest_proba, load_forest
+
+DEFAULT_SIZES = '1,10,100,1000,10000,100000,1000000'
+DEFAULT_TRAIN_ROWS = 20000
+
+def training_data(rows, seed=42):
+    """Feature rows with a non-linear flood label, sized like PIPELINE_FEATURES"""
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(rows, len(PIPELINE_FEATURES))) * rng.uniform(0.5, 5.0, len(PIPELINE_FEATURES))
+    signal = X[:, 0] + 0.5 * X[:, 1] * X[:, 2] + rng.normal(scale=2.0, size=rows)
+    return X, (signal > np.quantile(signal, 0.85)).astype(int)
+
+def train_artifact(X, y, trees, max_depth):
+    """Pipeline artifact with the notebook's RandomForestClassifier settings"""
+    from sklearn.ensemble import RandomForestClassifier
+    
+    model = RandomForestClassifier(n_estimators=trees, max_depth=max_depth, random_state=42,
+                                   class_weight='balanced')
+    return fit_pipeline(X, y, PIPELINE_FEATURES, model)
+
+def threshold_rows(artifact):
+    """Scaled rows placed exactly on each split threshold and one float32 step either side"""
+    tree_rows = []
+    for estimator in artifact['model'].estimators_:
+        tree = estimator.tree_
+        splits = tree.feature >= 0
+        for feature, threshold in zip(tree.feature[splits], tree.threshold[splits]):
+            center = np.float32(threshold)
+            for value in (np.nextafter(center, np.float32(-np.inf)), center,
+                          np.nextafter(center, np.float32(np.inf))):
+                row = np.zeros(len(artifact['feature_names']))
+                row[feature] = value
+                tree_rows.append(row)
+    return np.array(tree_rows)
+
+def check_parity(artifact, compiled, rows, seed=7):
+    """List of mismatch descriptions (empty when every probability is identical)"""
+    rng = np.random.default_rng(seed)
+    mismatches = []
+    
+    n_features = len(artifact['feature_names'])
+    X = rng.normal(size=(rows, n_features)) * rng.uniform(0.5, 8.0, n_features)
+    expected = predict_proba(artifact, X)
+    actual = predict_proba(compiled, X)
+    if not np.array_equal(expected, actual):
+        diff = np.flatnonzero(expected != actual)
+        mismatches.append(f"{len(diff)} of {rows} random rows differ (max {np.abs(expected - actual).max():.3g})")
+    
+    # Model space directly, so the rows hit the thresholds exactly
+    edges = threshold_rows(artifact)
+    expected = artifact['model'].predict_proba(edges)[:, list(artifact['model'].classes_).index(1)]
+    actual = forest_proba(compiled['model'], edges)
+    if not np.array_equal(expected, actual):
+        mismatches.append(f"{int((expected != actual).sum())} of {len(edges)} threshold rows differ")
+    
+    if not np.array_equal(transform(artifact, X), transform(compiled, X)):
+        mismatches.append("scaler differs")
+    return mismatches, rows + len(edges)
+
+def best_time(function, repeats):
+    """Fastest of several runs, in seconds"""
+    best = float('inf')
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def import_seconds(statement):
+    """Wall time of a fresh interpreter running one import statement"""
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', statement], check=True)
+    return time.perf_counter() - started
+
+def run_benchmark(artifact, compiled, sizes, seed=11):
+    """Per batch size timings for sklearn (via joblib artifact) and the compiled forest"""
+    rng = np.random.default_rng(seed)
+    results = []
+    for size in sizes:
+        X = rng.normal(size=(size, len(artifact['feature_names']))) * 3
+        repeats = max(1, min(20, 200_000 // size))
+        sklearn_time = best_time(lambda: predict_proba(artifact, X), repeats)
+        compiled_time = best_time(lambda: predict_proba(compiled, X), repeats)
+        results.append({'rows': size, 'sklearn_ms': sklearn_time * 1000, 'compiled_ms': compiled_time * 1000,
+                        'speedup': sklearn_time / compiled_time if compiled_time else None})
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Check and time the compiled forest against sklearn')
+    parser.add_argument('--trees', type=int, default=100, help='Trees in the forest')
+    parser.add_argument('--max-depth', type=int, default=10, help='Tree depth (0 = unlimited)')
+    parser.add_argument('--train-rows', type=int, default=DEFAULT_TRAIN_ROWS, help='Training rows')
+    parser.add_argument('--parity-rows', type=int, default=200_000, help='Random rows for the parity check')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='Batch sizes to time')
+    parser.add_argument('--parity-only', action='store_true', help='Skip the timings')
+    args = parser.parse_args()
+    
+    print("=" * 70)
+    print("COMPILED FOREST vs SKLEARN")
+    print("=" * 70)
+    X, y = training_data(args.train_rows)
+    artifact = train_artifact(X, y, args.trees, args.max_depth or None)
+    
+    with tempfile.TemporaryDirectory() as work_dir:
+        joblib_path = os.path.join(work_dir, 'flood_pipeline.joblib')
+        forest_path = os.path.join(work_dir, 'flood_forest.bin')
+        save_artifact(artifact, joblib_path)
+        export_forest(artifact, forest_path)
+        joblib_load = best_time(lambda: load_artifact(joblib_path), 5)
+        forest_load = best_time(lambda: load_forest(forest_path), 5)
+        compiled = load_forest(forest_path)
+        print(f"🌲 {args.trees} trees, max depth {compiled['model']['max_depth']}, "
+              f"{len(compiled['model']['feature'])} nodes")
+        print(f"📦 joblib artifact {os.path.getsize(joblib_path) / 1024:.0f} KB, "
+              f"loads in {joblib_load * 1000:.1f} ms; compiled file {os.path.getsize(forest_path) / 1024:.0f} KB, "
+              f"maps in {forest_load * 1000:.2f} ms")
+        
+        mismatches, checked = check_parity(artifact, compiled, args.parity_rows)
+        if mismatches:
+            print("❌ Compiled forest differs from sklearn:")
+            for mismatch in mismatches:
+                print(f"   {mismatch}")
+            sys.exit(1)
+        print(f"✅ {checked} rows match sklearn predict_proba exactly")
+        if args.parity_only:
+            return
+        
+        numpy_import = import_seconds('import numpy')
+        sklearn_import = import_seconds('import numpy, joblib, sklearn.ensemble')
+        print(f"⏱️ Fresh interpreter: numpy {numpy_import * 1000:.0f} ms, "
+              f"numpy + joblib + sklearn.ensemble {sklearn_import * 1000:.0f} ms")
+        
+        print(f"\n{'rows':>9} {'sklearn ms':>12} {'compiled ms':>12} {'speedup':>8}")
+        for result in run_benchmark(artifact, compiled, [int(size) for size in args.sizes.split(',')]):
+            print(f"{result['rows']:>9} {result['sklearn_ms']:>12.3f} {result['compiled_ms']:>12.3f} "
+                  f"{result['speedup']:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+Historical Backfill
+Downloads USGS instantaneous gauge heights and NOAA station observations for
+long date ranges into a local partitioned Arrow dataset for training
+
+Date ranges are split into startDT/endDT chunks fetched by parallel workers
+under a shared request-rate limit. Finished chunks are recorded in a
+checkpoint file, so an interrupted run resumes where it stopped. Files are
+uncompressed Arrow IPC, which the training code memory-maps.
+
+Usage:
+    python backfill_history.py --start 2020-01-01 --output ./history
+    python backfill_history.py --start 2024-01-01 --sources usgs --sites 01646500 --rate 2
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-functions'))
+
+from concurrent_fetch import create_session, run_all
+from flood_data_access import parse_timestamp
+from monitoring_config import (DEFAULT_NOAA_STATIONS, DEFAULT_USGS_SITES, get_flood_stage,
+                               parse_id_list)
+from snapshot_export import utc_timestamp
+from usgs_data_collector import USGS_URL, chunk_sites, iter_readings
+
+# pyarrow is only needed by this tool and the notebook, not by the Lambdas
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pafs
+except ImportError:
+    pa = None
+
+NOAA_URL = "https://api.weather.gov"
+
+DEFAULT_OUTPUT = 'history'
+CHECKPOINT_FILE = '_backfill_checkpoint.json'
+
+# USGS serves a month of 15-minute values per site comfortably in one
+# response; NOAA pages observations, so smaller windows keep pages few
+USGS_CHUNK_DAYS = 30
+NOAA_CHUNK_DAYS = 7
+NOAA_PAGE_LIMIT = 500
+
+DEFAULT_WORKERS = 4
+DEFAULT_RATE = 5.0  # requests per second across all workers
+DEFAULT_RETRIES = 4
+REQUEST_TIMEOUT = 60
+
+MM_TO_INCHES = 0.0393701
+
+# source -> partition key attribute
+KEY_NAMES = {'usgs': 'gauge_id', 'noaa': 'station_id'}
+
+# Columns of every chunk file per source and their Arrow types, so chunks
+# from different runs always share one schema
+HISTORY_COLUMNS = {
+    'usgs': {
+        'water_level': 'float64',
+        'flood_stage': 'float64',
+        'location_name': 'string'
+    },
+    'noaa': {
+        'precipitation_1hr': 'float64',
+        'temperature': 'float64'
+    }
+}
+
+def require_pyarrow():
+    """Fail with an install hint when pyarrow is missing"""
+    if pa is None:
+        raise ImportError("pyarrow is required for the history dataset: pip install pyarrow")
+
+def history_schema(source):
+    """Schema of every chunk file for a source (partition columns live in the path)"""
+    return pa.schema([('timestamp', pa.timestamp('us', tz='UTC'))] +
+                     [(name, pa.type_for_alias(type_name))
+                      for name, type_name in HISTORY_COLUMNS[source].items()])
+
+def make_rate_limiter(rate):
+    """
+    Return an acquire() that blocks so calls stay under rate per second
+    
+    Shared by every worker thread; slots are handed out in order, so bursts
+    are spread evenly instead of all firing at once.
+    """
+    lock = threading.Lock()
+    interval = 1.0 / rate if rate and rate > 0 else 0.0
+    next_slot = [time.monotonic()]
+    
+    def acquire():
+        if not interval:
+            return
+        with lock:
+            now = time.monotonic()
+            slot = max(next_slot[0], now)
+            next_slot[0] = slot + interval
+        if slot > now:
+            time.sleep(slot - now)
+    
+    return acquire
+
+def plan_chunks(start, end, chunk_days):
+    """Split [start, end) into consecutive windows of at most chunk_days"""
+    chunks = []
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days), end)
+        chunks.append((chunk_start, chunk_end))
+        chunk_start = chunk_end
+    return chunks
+
+def task_key(source, ids, start, end):
+    """Checkpoint key for one chunk"""
+    return f"{source}|{','.join(ids)}|{start:%Y%m%dT%H%M}|{end:%Y%m%dT%H%M}"
+
+def plan_tasks(sources, sites, stations, start, end, usgs_chunk_days=USGS_CHUNK_DAYS,
+               noaa_chunk_days=NOAA_CHUNK_DAYS):
+    """Every (source, ids, window) chunk needed to cover the range"""
+    tasks = []
+    if 'usgs' in sources:
+        for site_group in chunk_sites(sites):
+            for chunk_start, chunk_end in plan_chunks(start, end, usgs_chunk_days):
+                tasks.append({'source': 'usgs', 'ids': site_group, 'start': chunk_start,
+                              'end': chunk_end})
+    if 'noaa' in sources:
+        for station in stations:
+            for chunk_start, chunk_end in plan_chunks(start, end, noaa_chunk_days):
+                tasks.append({'source': 'noaa', 'ids': [station], 'start': chunk_start,
+                              'end': chunk_end})
+    for task in tasks:
+        task['key'] = task_key(task['source'], task['ids'], task['start'], task['end'])
+    return tasks
+
+def get_with_retries(session, url, params, acquire, retries=DEFAULT_RETRIES, stream=False):
+    """Rate-limited GET, retrying throttling (429) and server errors with backoff"""
+    for attempt in range(retries + 1):
+        acquire()
+        try:
+            response = session.get(url, params=params, timeout=REQUEST_TIMEOUT, stream=stream)
+        except Exception:
+            if attempt == retries:
+                raise
+        else:
+            if response.status_code != 429 and response.status_code < 500:
+                response.raise_for_status()
+                return response
+            if attempt == retries:
+                response.raise_for_status()
+            response.close()
+        time.sleep(min(2 ** attempt, 30))
+
+def fetch_usgs_chunk(session, base_url, sites, start, end, acquire, retries=DEFAULT_RETRIES):
+    """Gauge readings for a group of sites over one window, as columns per gauge"""
+    params = {
+        'format': 'json',
+        'sites': ','.join(sites),
+        'parameterCd': '00065',  # Gauge height
+        'startDT': start.strftime('%Y-%m-%dT%H:%MZ'),
+        'endDT': end.strftime('%Y-%m-%dT%H:%MZ')
+    }
+    response = get_with_retries(session, base_url, params, acquire, retries, stream=True)
+    
+    columns = {}
+    try:
+        for gauge_id, location_name, reading in iter_readings(response):
+            if not reading['value'] or reading['value'] == '-999999':
+                continue
+            timestamp = parse_timestamp(reading['dateTime'])
+            # endDT is inclusive; the next chunk owns that instant
+            if timestamp >= end:
+                continue
+            gauge = columns.setdefault(gauge_id, {
+                'timestamp': [], 'water_level': [], 'flood_stage': [], 'location_name': []
+            })
+            gauge['timestamp'].append(timestamp)
+            gauge['water_level'].append(float(reading['value']))
+            gauge['flood_stage'].append(get_flood_stage(gauge_id))
+            gauge['location_name'].append(location_name)
+    finally:
+        response.close()
+    
+    return columns
+
+def quantity(properties, name, scale=1.0):
+    """Numeric value of a weather.gov quantity property (None when missing)"""
+    value = (properties.get(name) or {}).get('value')
+    return None if value is None else float(value) * scale
+
+def fetch_noaa_chunk(session, base_url, station, start, end, acquire, retries=DEFAULT_RETRIES):
+    """Station observations over one window (following pagination), as columns"""
+    url = f"{base_url}/stations/{station}/observations"
+    params = {
+        'start': start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'end': end.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'limit': NOAA_PAGE_LIMIT
+    }
+    
+    columns = {'timestamp': [], 'precipitation_1hr': [], 'temperature': []}
+    seen = set()
+    while url:
+        response = get_with_retries(session, url, params, acquire, retries)
+        data = response.json()
+        added = 0
+        
+        for feature in data.get('features', []):
+            properties = feature.get('properties', {})
+            if not properties.get('timestamp'):
+                continue
+            timestamp = parse_timestamp(properties['timestamp'])
+            if timestamp in seen or not start <= timestamp < end:
+                continue
+            seen.add(timestamp)
+            added += 1
+            columns['timestamp'].append(timestamp)
+            columns['precipitation_1hr'].append(
+                quantity(properties, 'precipitationLastHour', MM_TO_INCHES) or 0.0
+            )
+            columns['temperature'].append(quantity(properties, 'temperature'))
+        
+        # The next page URL carries its own cursor; stop once a page adds nothing
+        next_url = (data.get('pagination') or {}).get('next')
+        url, params = (next_url, None) if added and next_url != url else (None, None)
+    
+    return {station: columns} if columns['timestamp'] else {}
+
+def chunk_path(output_dir, source, key_value, start, end):
+    """Dataset file for one id and window"""
+    key_name = KEY_NAMES[source]
+    return os.path.join(output_dir, source, f'{key_name}={key_value}', f'year={start.year}',
+                        f'part-{start:%Y%m%d%H%M}-{end:%Y%m%d%H%M}.arrow')
+
+def write_chunk(path, columns, source):
+    """Write one chunk as an uncompressed Arrow IPC file (memory-mappable), atomically"""
+    rows = len(columns['timestamp'])
+    schema = history_schema(source)
+    table = pa.table({field.name: pa.array(columns.get(field.name, [None] * rows), type=field.type)
+                      for field in schema}, schema=schema).sort_by('timestamp')
+    
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with pa.OSFile(path + '.partial', 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(path + '.partial', path)
+    return table.num_rows
+
+def load_checkpoint(output_dir):
+    """Finished chunk keys -> rows written"""
+    path = os.path.join(output_dir, CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_checkpoint(output_dir, checkpoint):
+    """Write the checkpoint atomically so an interrupted run never corrupts it"""
+    path = os.path.join(output_dir, CHECKPOINT_FILE)
+    with open(path + '.partial', 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(path + '.partial', path)
+
+def run_backfill(start, end, output_dir=DEFAULT_OUTPUT, sources=('usgs', 'noaa'), sites=None,
+                 stations=None, workers=DEFAULT_WORKERS, rate=DEFAULT_RATE, usgs_url=USGS_URL,
+                 noaa_url=NOAA_URL, usgs_chunk_days=USGS_CHUNK_DAYS, noaa_chunk_days=NOAA_CHUNK_DAYS,
+                 retries=DEFAULT_RETRIES):
+    """
+    Download every chunk not already in the checkpoint
+    
+    Returns a summary with chunk counts, rows written, errors and timing.
+    Failed chunks are left out of the checkpoint and retried on the next run.
+    """
+    require_pyarrow()
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.perf_counter()
+    
+    tasks = plan_tasks(sources, sites or list(DEFAULT_USGS_SITES),
+                       stations or list(DEFAULT_NOAA_STATIONS), start, end, usgs_chunk_days,
+                       noaa_chunk_days)
+    checkpoint = load_checkpoint(output_dir)
+    pending = [task for task in tasks if task['key'] not in checkpoint]
+    
+    session = create_session(workers, headers={'User-Agent': 'FloodMonitoringSystem/1.0'})
+    acquire = make_rate_limiter(rate)
+    lock = threading.Lock()
+    
+    def run_task(task):
+        if task['source'] == 'usgs':
+            columns = fetch_usgs_chunk(session, usgs_url, task['ids'], task['start'], task['end'],
+                                       acquire, retries)
+        else:
+            columns = fetch_noaa_chunk(session, noaa_url, task['ids'][0], task['start'],
+                                       task['end'], acquire, retries)
+        
+        rows = 0
+        for key_value, key_columns in columns.items():
+            rows += write_chunk(chunk_path(output_dir, task['source'], key_value, task['start'],
+                                           task['end']), key_columns, task['source'])
+        
+        with lock:
+            checkpoint[task['key']] = rows
+            save_checkpoint(output_dir, checkpoint)
+        print(f"   {task['key']}: {rows} rows")
+        return rows
+    
+    outcomes = run_all(run_task, pending, max_workers=workers)
+    
+    errors = []
+    for task, outcome in zip(pending, outcomes):
+        if 'error' in outcome:
+            errors.append(f"{task['key']}: {outcome['error']}")
+    
+    return {
+        'chunks_total': len(tasks),
+        'chunks_skipped': len(tasks) - len(pending),
+        'chunks_fetched': len(pending) - len(errors),
+        'rows_written': sum(outcome.get('result', 0) for outcome in outcomes),
+        'errors': errors,
+        'seconds': round(time.perf_counter() - started, 2)
+    }
+
+def read_history(output_dir, source, ids=None, start=None, end=None, columns=None):
+    """
+    Read a source back as a DataFrame, sorted by timestamp
+    
+    Files are memory-mapped and ids/start/end are pushed down as filters,
+    so only matching chunks are touched. Chunks are read with the declared
+    history schema rather than whichever file is found first.
+    """
+    require_pyarrow()
+    import pandas as pd
+    
+    key_name = KEY_NAMES[source]
+    source_dir = os.path.join(output_dir, source)
+    if not os.path.isdir(source_dir):
+        return pd.DataFrame()
+    
+    # IDs stay strings - gauge numbers have leading zeros
+    partition_schema = pa.schema([(key_name, pa.string()), ('year', pa.int32())])
+    dataset = ds.dataset(source_dir, format='ipc',
+                         schema=pa.unify_schemas([history_schema(source), partition_schema]),
+                         partitioning=ds.partitioning(partition_schema, flavor='hive'),
+                         filesystem=pafs.LocalFileSystem(use_mmap=True),
+                         exclude_invalid_files=True)
+    condition = None
+    for clause in (
+        ds.field(key_name).isin(list(ids)) if ids else None,
+        ds.field('timestamp') >= utc_timestamp(start) if start is not None else None,
+        ds.field('timestamp') <= utc_timestamp(end) if end is not None else None
+    ):
+        if clause is not None:
+            condition = clause if condition is None else condition & clause
+    
+    frame = dataset.to_table(columns=columns, filter=condition).to_pandas()
+    if 'year' in frame:
+        frame = frame.drop(columns=['year'])
+    
+    # Runs with different chunk sizes can overlap at the edges
+    if key_name in frame and 'timestamp' in frame:
+        frame = frame.drop_duplicates(subset=[key_name, 'timestamp'])
+    return frame.sort_values('timestamp').reset_index(drop=True)
+
+def parse_date(value):
+    """YYYY-MM-DD (or full ISO-8601) as an aware UTC datetime"""
+    if len(value) == 10:
+        value += 'T00:00:00Z'
+    return parse_timestamp(value)
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill USGS/NOAA history into a local Arrow dataset')
+    parser.add_argument('--start', required=True, help='First day to fetch (YYYY-MM-DD)')
+    parser.add_argument('--end', default=None, help='Day to stop before (default: now)')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='Dataset directory')
+    parser.add_argument('--sources', default='usgs,noaa', help='Sources to fetch (usgs,noaa)')
+    parser.add_argument('--sites', default=None, help='USGS sites (default: monitored gauges)')
+    parser.add_argument('--stations', default=None, help='NOAA stations (default: monitored stations)')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Parallel requests')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE, help='Max requests per second')
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES, help='Retries per request')
+    parser.add_argument('--usgs-chunk-days', type=int, default=USGS_CHUNK_DAYS)
+    parser.add_argument('--noaa-chunk-days', type=int, default=NOAA_CHUNK_DAYS)
+    parser.add_argument('--usgs-url', default=USGS_URL, help='USGS IV service URL')
+    parser.add_argument('--noaa-url', default=NOAA_URL, help='weather.gov API base URL')
+    args = parser.parse_args()
+    
+    sources = parse_id_list(args.sources)
+    unknown = [source for source in sources if source not in KEY_NAMES]
+    if unknown:
+        parser.error(f"Unknown sources: {', '.join(unknown)}")
+    
+    start = parse_date(args.start)
+    end = parse_date(args.end) if args.end else datetime.now(timezone.utc)
+    
+    print(f"📥 Backfilling {', '.join(sources)} from {start:%Y-%m-%d} to {end:%Y-%m-%d} into {args.output}/")
+    summary = run_backfill(
+        start, end, args.output, sources,
+        sites=parse_id_list(args.sites) if args.sites else None,
+        stations=parse_id_list(args.stations) if args.stations else None,
+        workers=args.workers, rate=args.rate, usgs_url=args.usgs_url, noaa_url=args.noaa_url.rstrip('/'),
+        usgs_chunk_days=args.usgs_chunk_days, noaa_chunk_days=args.noaa_chunk_days,
+        retries=args.retries
+    )
+    
+    print(f"✅ {summary['chunks_fetched']} chunks fetched, {summary['chunks_skipped']} already done, "
+          f"{summary['rows_written']} rows in {summary['seconds']}s")
+    for error in summary['errors']:
+        print(f"❌ {error}")
+    if summary['errors']:
+        print("💡 Run the same command again to retry the failed chunks")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Runtime Layer Builder
+Packages the modules shared by every Lambda (pooled AWS clients, HTTP fetching,
+data access, state, configuration, instrumentation) plus requests/ijson into
+a Lambda layer zip
+
+Layers are unpacked under /opt, and /opt/python is on the Lambda import path,
+so everything goes in a python/ folder inside the zip. Handlers then only
+ship their own module.
+
+Usage:
+    python build_runtime_layer.py                       # writes flood-runtime-layer.zip
+    python build_runtime_layer.py --output layer.zip --no-deps
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import zipfile
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-functions')
+
+DEFAULT_OUTPUT = 'flood-runtime-layer.zip'
+
+# Modules imported by more than one handler
+LAYER_MODULES = [
+    'aws_runtime.py',
+    'concurrent_fetch.py',
+    'flood_data_access.py',
+    'instrumentation.py',
+    'monitoring_config.py',
+    'packed_readings.py',
+    'state_store.py'
+]
+
+# Third-party packages the shared modules use (boto3 is already in the runtime)
+LAYER_REQUIREMENTS = ['requests', 'ijson']
+
+def build_layer(output=DEFAULT_OUTPUT, include_deps=True, python_version='3.9'):
+    """Build the layer zip and return its path"""
+    with tempfile.TemporaryDirectory() as build_dir:
+        python_dir = os.path.join(build_dir, 'python')
+        os.makedirs(python_dir)
+        
+        for module in LAYER_MODULES:
+            shutil.copy(os.path.join(LAMBDA_DIR, module), python_dir)
+        
+        if include_deps:
+            # Linux wheels for the Lambda runtime, whatever machine builds the layer
+            subprocess.run([
+                sys.executable, '-m', 'pip', 'install', *LAYER_REQUIREMENTS,
+                '--target', python_dir, '--platform', 'manylinux2014_x86_64',
+                '--python-version', python_version, '--only-binary=:all:', '--quiet'
+            ], check=True)
+        
+        with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for root, dirs, files in os.walk(build_dir):
+                dirs[:] = [name for name in dirs if name != '__pycache__']
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    archive.write(path, os.path.relpath(path, build_dir))
+    
+    return output
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the shared flood-monitoring Lambda layer')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='Layer zip to write')
+    parser.add_argument('--python-version', default='3.9', help='Lambda runtime Python version')
+    parser.add_argument('--no-deps', action='store_true', help='Only package the shared modules')
+    args = parser.parse_args()
+    
+    path = build_layer(args.output, not args.no_deps, args.python_version)
+    print(f"📦 Wrote {path} ({os.path.getsize(path) / 1024:.0f} KB): {', '.join(LAYER_MODULES)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,603 @@
+#!/usr/bin/env python3
+"""
+Model Retraining
+Rebuilds the flood feature pipeline artifact from the training snapshot,
+backfilled history and cold archive without the notebook, and publishes it
+only when it scores better than the model the predictor is using
+
+Hyperparameter candidates are scored with time-ordered cross-validation:
+each fold tests one slice of time and trains only on readings that end at
+least the label horizon before it, so no future label leaks into training.
+Every (candidate, fold) fit runs in its own worker process against a
+memory-mapped copy of the feature matrix. Feature matrices are cached per
+gauge and feature list in --cache-dir under a hash of the readings they
+came from, so a nightly run only rebuilds gauges with new data.
+
+The newest fold is also the holdout for publishing: the model currently in
+S3 is scored on it next to the winning candidate, and the candidate (refit
+on every reading) replaces it only if it wins by --min-improvement. The
+models bucket is versioned, so an earlier artifact can be restored.
+
+Usage:
+    python retrain_model.py --snapshot ../ml-notebooks/training-snapshot --dry-run
+    python retrain_model.py --history ../ml-notebooks/history --jobs 8 --folds 5
+    python retrain_model.py --synthetic 20000 --dry-run
+"""
+
+import argparse
+import glob
+import hashlib
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-functions'))
+
+from feature_pipeline import (ARTIFACT_KEY, FEATURES_KEY, FOREST_KEY, MODEL_FEATURES_KEY, MODEL_KEY,
+                              PIPELINE_FEATURES, build_feature_frame, fit_pipeline, load_artifact, predict_proba,
+                              save_artifact, wrap_legacy_model)
+from forest_model import export_forest, load_forest
+from monitoring_config import (DEFAULT_FLOOD_STAGE, DEFAULT_NOAA_STATIONS, DEFAULT_PAIRED_STATION,
+                               DEFAULT_USGS_SITES, GAUGE_STATIONS, parse_id_list)
+from temporal_align import to_epoch_array
+
+DEFAULT_SNAPSHOT = 'training-snapshot'
+DEFAULT_HISTORY = 'history'
+DEFAULT_CACHE = 'retrain-cache'
+
+# Same target as the notebook: level above 80% of flood stage 6 hours later
+DEFAULT_HORIZON_HOURS = 6.0
+DEFAULT_RISK_RATIO = 0.8
+
+# A label needs a reading within this long after the horizon
+LABEL_TOLERANCE_SECONDS = 3600
+
+DEFAULT_FOLDS = 4
+DEFAULT_METRIC = 'average_precision'
+METRICS = ('average_precision', 'roc_auc', 'neg_log_loss')
+DEFAULT_MIN_IMPROVEMENT = 0.005
+RANDOM_STATE = 42
+
+# Forest settings searched by default (n_jobs stays 1 - the search is parallel instead)
+DEFAULT_GRID = {
+    'n_estimators': [100, 200],
+    'max_depth': [6, 10, 16],
+    'min_samples_leaf': [1, 5],
+    'max_features': ['sqrt', 0.5]
+}
+
+# Bump when the cached matrix layout or labelling changes
+CACHE_VERSION = 1
+
+# Per-process copies of the memory-mapped matrix and folds (set by init_worker)
+_worker = {}
+
+def load_source(source, snapshot_dir, history_dir, archive_bucket, ids):
+    """Readings for one source from the snapshot, history and archive (snapshot rows win)"""
+    import pandas as pd
+    
+    key = 'gauge_id' if source == 'usgs' else 'station_id'
+    frames = []
+    if snapshot_dir and os.path.isdir(snapshot_dir):
+        import snapshot_export
+        frames.append(snapshot_export.read_snapshot(snapshot_dir, source, ids=ids))
+    if history_dir and os.path.isdir(history_dir):
+        import backfill_history
+        frames.append(backfill_history.read_history(history_dir, source, ids=ids))
+    if archive_bucket:
+        import cold_archive
+        for key_value in ids:
+            columns = cold_archive.read_archive(source, key_value, bucket=archive_bucket)
+            if columns['timestamp']:
+                archived = pd.DataFrame(columns)
+                archived['timestamp'] = pd.to_datetime(archived['timestamp'], unit='s', utc=True)
+                frames.append(archived)
+    
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return pd.DataFrame()
+    frame = pd.concat(frames, ignore_index=True).dropna(subset=['timestamp'])
+    frame['timestamp'] = pd.to_datetime(frame['timestamp'], utc=True)
+    return frame.drop_duplicates(subset=[key, 'timestamp']).sort_values('timestamp', kind='stable')
+
+def synthetic_sources(samples, sites):
+    """Gauge and weather frames shaped like the notebook's synthetic series, one storm pattern per gauge"""
+    import pandas as pd
+    
+    rng = np.random.default_rng(RANDOM_STATE)
+    end = pd.Timestamp.now(tz='UTC').floor('15min')
+    times = pd.date_range(end=end, periods=samples, freq='15min')
+    gauges = []
+    weather = []
+    for site in sites:
+        stage = 10.0
+        levels = 5.0 + np.cumsum(rng.normal(0, 0.05, samples))
+        rain = rng.exponential(0.05, samples)
+        for start in rng.choice(samples - 70, size=max(samples // 400, 2), replace=False):
+            # Rain first, the river responds over the following hours
+            rain[start:start + 8] += rng.uniform(0.2, 0.8)
+            levels[start + 8:start + 68] += rng.uniform(2.0, 6.0) * np.sin(np.linspace(0, np.pi, 60))
+        gauges.append(pd.DataFrame({'gauge_id': site, 'timestamp': times,
+                                    'water_level': np.clip(levels, 0.5, None), 'flood_stage': stage}))
+        hourly = times[::4]
+        weather.append(pd.DataFrame({
+            'station_id': GAUGE_STATIONS.get(site, DEFAULT_PAIRED_STATION),
+            'timestamp': hourly,
+            'precipitation_1hr': np.add.reduceat(rain, np.arange(0, samples, 4)),
+            'precipitation_forecast_24hr': rng.exponential(0.5, len(hourly)),
+            'temperature': rng.normal(15.0, 10.0, len(hourly))
+        }))
+    return pd.concat(gauges, ignore_index=True), pd.concat(weather, ignore_index=True).drop_duplicates(
+        subset=['station_id', 'timestamp'])
+
+def epoch_seconds(timestamps):
+    """Integer epoch seconds for a tz-aware timestamp Series"""
+    return to_epoch_array(timestamps.dt.tz_convert('UTC').dt.tz_localize(None)).astype(np.int64)
+
+def label_rows(frame, horizon_hours, risk_ratio):
+    """
+    (rows, labels): readings with a known future and whether the gauge is
+    at risk horizon_hours later
+    
+    At risk means the first reading at or after the horizon is above
+    risk_ratio x flood stage; readings with no reading within
+    LABEL_TOLERANCE_SECONDS of the horizon are dropped.
+    """
+    times = epoch_seconds(frame['timestamp'])
+    levels = frame['water_level'].to_numpy(dtype=float)
+    if 'flood_stage' in frame:
+        stages = frame['flood_stage'].to_numpy(dtype=float)
+        stages = np.where(np.isnan(stages), DEFAULT_FLOOD_STAGE, stages)
+    else:
+        stages = np.full(len(frame), DEFAULT_FLOOD_STAGE)
+    at_risk = levels > stages * risk_ratio
+    
+    target = times + int(horizon_hours * 3600)
+    future = np.searchsorted(times, target, side='left')
+    known = future < len(times)
+    known[known] = times[future[known]] - target[known] <= LABEL_TOLERANCE_SECONDS
+    rows = np.flatnonzero(known)
+    return rows, at_risk[future[rows]].astype(np.int8)
+
+def settings_digest(settings):
+    """Short hash of the settings (feature list, label target) a matrix is built with"""
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+def frame_digest(frames):
+    """Content hash of the input readings"""
+    import pandas as pd
+    
+    digest = hashlib.sha256()
+    for frame in frames:
+        if frame is None or not len(frame):
+            digest.update(b'-')
+            continue
+        digest.update(','.join(frame.columns).encode('utf-8'))
+        digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:24]
+
+def gauge_matrix(gauge_id, gauge_df, weather_df, feature_names, horizon_hours, risk_ratio, cache_dir):
+    """
+    (X, y, times) for one gauge, from the cache when its inputs are unchanged
+    
+    Returns the arrays and whether they came from the cache. Files are named
+    gauge-settings-readings, and a new file only replaces older ones with the
+    same settings, so the candidate and current model feature lists keep
+    one cache entry each.
+    """
+    gauge_df = gauge_df[['timestamp'] + [name for name in ('water_level', 'flood_stage') if name in gauge_df]]
+    if weather_df is not None:
+        weather_df = weather_df[[name for name in weather_df.columns if name != 'station_id']]
+    settings = {'version': CACHE_VERSION, 'features': list(feature_names), 'horizon_hours': horizon_hours,
+                'risk_ratio': risk_ratio}
+    prefix = f"{gauge_id}-{settings_digest(settings)}"
+    path = os.path.join(cache_dir, f"{prefix}-{frame_digest([gauge_df, weather_df])}.npz")
+    if os.path.exists(path):
+        with np.load(path) as cached:
+            return (cached['X'], cached['y'], cached['times']), True
+    
+    frame = build_feature_frame(gauge_df, weather_df, feature_names)
+    # Labels need the raw level even when it is not a model feature
+    labels = frame[['timestamp']].copy()
+    labels['water_level'] = gauge_df.dropna(subset=['water_level'])['water_level'].to_numpy()
+    if 'flood_stage' in frame:
+        labels['flood_stage'] = frame['flood_stage'].to_numpy()
+    rows, y = label_rows(labels, horizon_hours, risk_ratio)
+    X = frame[list(feature_names)].to_numpy(dtype=np.float64)[rows]
+    times = epoch_seconds(labels['timestamp'])[rows]
+    
+    for stale in glob.glob(os.path.join(cache_dir, f"{glob.escape(prefix)}-*.npz")):
+        os.remove(stale)
+    np.savez(path, X=X, y=y, times=times)
+    return (X, y, times), False
+
+def build_dataset(usgs_df, noaa_df, feature_names, horizon_hours, risk_ratio, cache_dir):
+    """
+    Pooled (X, y, times) over every gauge, ordered by time then gauge, plus
+    cache stats
+    
+    Row order depends only on the readings, not the feature list, so two
+    feature lists built from the same data line up row for row.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    stats = {'gauges': 0, 'cached': 0, 'built': 0}
+    parts = []
+    for gauge_id, gauge_df in usgs_df.groupby('gauge_id', sort=True):
+        gauge_df = gauge_df.dropna(subset=['water_level']).sort_values('timestamp', kind='stable')
+        if len(gauge_df) < 2:
+            continue
+        station = GAUGE_STATIONS.get(gauge_id, DEFAULT_PAIRED_STATION)
+        weather_df = noaa_df[noaa_df['station_id'] == station] if len(noaa_df) else None
+        (X, y, times), cached = gauge_matrix(gauge_id, gauge_df, weather_df, feature_names,
+                                             horizon_hours, risk_ratio, cache_dir)
+        stats['gauges'] += 1
+        stats['cached' if cached else 'built'] += 1
+        parts.append((X, y, times, np.full(len(y), len(parts))))
+    
+    if not parts:
+        return np.empty((0, len(feature_names))), np.empty(0, dtype=np.int8), np.empty(0, dtype=np.int64), stats
+    X, y, times, gauges = (np.concatenate(arrays) for arrays in zip(*parts))
+    order = np.lexsort((gauges, times))
+    return X[order], y[order], times[order], stats
+
+def time_series_folds(times, n_folds, gap_seconds):
+    """
+    (train, test) index arrays for forward-chaining folds over sorted times
+    
+    Rows are cut into n_folds + 1 equal slices by time; fold k tests slice
+    k + 1 and trains on everything at least gap_seconds older than its
+    first reading. Folds whose training rows are empty are dropped.
+    """
+    bounds = np.linspace(0, len(times), n_folds + 2).astype(int)
+    folds = []
+    for start, end in zip(bounds[1:-1], bounds[2:]):
+        if end <= start:
+            continue
+        train = np.flatnonzero(times < times[start] - gap_seconds)
+        if len(train):
+            folds.append((train, np.arange(start, end)))
+    return folds
+
+def score_predictions(metric, y, probabilities):
+    """Metric value where higher is better (NaN when the test slice has one class)"""
+    from sklearn.metrics import average_precision_score, log_loss, roc_auc_score
+    
+    if len(np.unique(y)) < 2:
+        return float('nan')
+    if metric == 'average_precision':
+        return float(average_precision_score(y, probabilities))
+    if metric == 'roc_auc':
+        return float(roc_auc_score(y, probabilities))
+    return -float(log_loss(y, np.clip(probabilities, 1e-6, 1 - 1e-6), labels=[0, 1]))
+
+def make_model(params, n_jobs=1):
+    """RandomForestClassifier as the notebook trains it, with params applied"""
+    from sklearn.ensemble import RandomForestClassifier
+    
+    settings = {'random_state': RANDOM_STATE, 'class_weight': 'balanced', 'n_jobs': n_jobs}
+    settings.update(params)
+    return RandomForestClassifier(**settings)
+
+def init_worker(matrix_dir, feature_names, n_folds, gap_seconds, metric):
+    """Open the shared matrix read-only (memory-mapped) and cut the folds once per process"""
+    X = np.load(os.path.join(matrix_dir, 'X.npy'), mmap_mode='r')
+    y = np.load(os.path.join(matrix_dir, 'y.npy'), mmap_mode='r')
+    times = np.load(os.path.join(matrix_dir, 'times.npy'), mmap_mode='r')
+    _worker.update(X=X, y=y, feature_names=feature_names, metric=metric,
+                   folds=time_series_folds(times, n_folds, gap_seconds))
+
+def fit_fold(task):
+    """Score one (candidate, params, fold) task; returns (candidate, fold, score, seconds)"""
+    candidate, params, fold = task
+    started = time.perf_counter()
+    train, test = _worker['folds'][fold]
+    y_train = np.asarray(_worker['y'][train])
+    if len(np.unique(y_train)) < 2:
+        return candidate, fold, float('nan'), 0.0
+    artifact = fit_pipeline(_worker['X'][train], y_train, _worker['feature_names'], make_model(params))
+    probabilities = predict_proba(artifact, _worker['X'][test])
+    score = score_predictions(_worker['metric'], np.asarray(_worker['y'][test]), probabilities)
+    return candidate, fold, score, time.perf_counter() - started
+
+def expand_grid(grid, max_candidates=None):
+    """Every combination of the grid's values, optionally a seeded random subset"""
+    names = sorted(grid)
+    candidates = [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+    if max_candidates and len(candidates) > max_candidates:
+        candidates = random.Random(RANDOM_STATE).sample(candidates, max_candidates)
+    return candidates
+
+def search(X, y, times, feature_names, candidates, n_folds, gap_seconds, metric, jobs, work_dir):
+    """
+    Cross-validated score of every candidate, as a (candidates, folds) array
+    
+    The matrix is written once to work_dir and memory-mapped by every
+    worker, so tasks only carry their candidate and fold numbers.
+    """
+    for name, values in (('X', X), ('y', y), ('times', times)):
+        np.save(os.path.join(work_dir, f'{name}.npy'), values)
+    init_args = (work_dir, list(feature_names), n_folds, gap_seconds, metric)
+    fold_count = len(time_series_folds(times, n_folds, gap_seconds))
+    tasks = [(candidate, params, fold)
+             for candidate, params in enumerate(candidates) for fold in range(fold_count)]
+    
+    scores = np.full((len(candidates), fold_count), np.nan)
+    if jobs <= 1:
+        init_worker(*init_args)
+        results = map(fit_fold, tasks)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=init_args)
+        results = executor.map(fit_fold, tasks)
+    try:
+        for done, (candidate, fold, score, seconds) in enumerate(results, start=1):
+            scores[candidate, fold] = score
+            if done % max(len(tasks) // 10, 1) == 0 or done == len(tasks):
+                print(f"   {done}/{len(tasks)} fits done")
+    finally:
+        if executor:
+            executor.shutdown()
+    return scores
+
+def model_bucket(bucket=None):
+    """Models bucket from the argument, S3_BUCKET or the account's default name"""
+    import boto3
+    
+    bucket = bucket or os.environ.get('S3_BUCKET')
+    if not bucket:
+        bucket = f"flood-prediction-models-{boto3.client('sts').get_caller_identity()['Account']}"
+    return bucket
+
+def load_current_artifact(s3, bucket, work_dir):
+    """The artifact the predictor would load now (legacy model files too), or None"""
+    from botocore.exceptions import ClientError
+    
+    try:
+        path = os.path.join(work_dir, 'current.bin')
+        s3.download_file(bucket, FOREST_KEY, path)
+        return load_forest(path)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ('NoSuchKey', '404'):
+            raise
+    path = os.path.join(work_dir, 'current.joblib')
+    try:
+        s3.download_file(bucket, ARTIFACT_KEY, path)
+        return load_artifact(path)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ('NoSuchKey', '404'):
+            raise
+    try:
+        import joblib
+        s3.download_file(bucket, MODEL_KEY, path)
+        features = json.loads(s3.get_object(Bucket=bucket, Key=MODEL_FEATURES_KEY)['Body'].read())
+        return wrap_legacy_model(joblib.load(path), features)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ('NoSuchKey', '404'):
+            raise
+    return None
+
+def publish(artifact, s3, bucket, work_dir):
+    """
+    Upload the compiled forest the predictor loads, then the joblib artifact
+    and its feature list; returns the compiled file's size
+    
+    The forest upload is the point the new model takes effect. If a later
+    upload fails the predictor already serves the new model, so the error
+    says publishing is incomplete rather than that it did not happen.
+    """
+    path = os.path.join(work_dir, 'flood_pipeline.joblib')
+    features_path = os.path.join(work_dir, 'pipeline_features.json')
+    forest_path = os.path.join(work_dir, 'flood_forest.bin')
+    save_artifact(artifact, path, features_path=features_path)
+    size = export_forest(artifact, forest_path)
+    s3.upload_file(forest_path, bucket, FOREST_KEY)
+    for local_path, key in ((path, ARTIFACT_KEY), (features_path, FEATURES_KEY)):
+        try:
+            s3.upload_file(local_path, bucket, key)
+        except Exception as e:
+            raise RuntimeError(f"Publishing incomplete: the predictor serves the new s3://{bucket}/{FOREST_KEY}, "
+                               f"but uploading {key} failed ({e}) - rerun with --force to finish") from e
+    return size
+
+def utc_text(epoch):
+    """ISO 8601 UTC text for epoch seconds"""
+    return np.datetime_as_string(np.datetime64(int(epoch), 's'), unit='s') + 'Z'
+
+def run_retraining(usgs_df, noaa_df, feature_names=None, grid=None, max_candidates=None, n_folds=DEFAULT_FOLDS,
+                   metric=DEFAULT_METRIC, horizon_hours=DEFAULT_HORIZON_HOURS, risk_ratio=DEFAULT_RISK_RATIO,
+                   jobs=1, cache_dir=DEFAULT_CACHE, min_improvement=DEFAULT_MIN_IMPROVEMENT, bucket=None,
+                   dry_run=False, force=False, s3=None):
+    """
+    Search, compare with the current model and publish; returns the report dict
+    
+    report['published'] is True only when a new artifact was uploaded.
+    """
+    started = time.perf_counter()
+    feature_names = list(feature_names or PIPELINE_FEATURES)
+    candidates = expand_grid(grid or DEFAULT_GRID, max_candidates)
+    gap_seconds = horizon_hours * 3600
+    report = {'metric': metric, 'published': False}
+    
+    phase_started = time.perf_counter()
+    X, y, times, stats = build_dataset(usgs_df, noaa_df, feature_names, horizon_hours, risk_ratio, cache_dir)
+    report['features'] = dict(stats, rows=len(y), positives=int(y.sum()),
+                              seconds=round(time.perf_counter() - phase_started, 1))
+    print(f"🧮 {len(y)} labelled rows ({int(y.sum())} at risk) from {stats['gauges']} gauges - "
+          f"{stats['cached']} cached, {stats['built']} rebuilt")
+    folds = time_series_folds(times, n_folds, gap_seconds)
+    if len(np.unique(y)) < 2 or not folds:
+        raise ValueError("Need both classes and at least one fold with training rows - load more history")
+    report['data_range'] = [utc_text(times[0]), utc_text(times[-1])]
+    
+    with tempfile.TemporaryDirectory(prefix='retrain-') as work_dir:
+        phase_started = time.perf_counter()
+        print(f"🔍 {len(candidates)} candidates x {len(folds)} time-ordered folds on {jobs} workers")
+        scores = search(X, y, times, feature_names, candidates, n_folds, gap_seconds, metric, jobs, work_dir)
+        with np.errstate(all='ignore'):
+            means = np.array([np.nanmean(row) if np.isfinite(row).any() else np.nan for row in scores])
+        if not np.isfinite(means).any():
+            raise ValueError("No fold had both classes in its test slice - load more history or use fewer folds")
+        best = int(np.nanargmax(means))
+        report['search'] = {
+            'candidates': len(candidates),
+            'folds': len(folds),
+            'seconds': round(time.perf_counter() - phase_started, 1),
+            'best_params': candidates[best],
+            'cv_score': round(float(means[best]), 5),
+            'fold_scores': [None if np.isnan(score) else round(float(score), 5) for score in scores[best]]
+        }
+        print(f"🏆 Best {metric} {means[best]:.4f}: {candidates[best]}")
+        
+        # Judge both models on readings neither was trained on: the newest
+        # fold, minus anything the current model has already seen
+        holdout_start = times[folds[-1][1][0]]
+        candidate_score = scores[best, -1]
+        current_score = None
+        current = None
+        try:
+            if s3 is None:
+                from aws_runtime import get_client
+                s3 = get_client('s3')
+            bucket = model_bucket(bucket)
+            current = load_current_artifact(s3, bucket, work_dir)
+        except Exception as e:
+            # A dry run still reports the search without AWS access
+            if not dry_run:
+                raise
+            print(f"⚠️ Could not load the current model: {e}")
+        
+        if current is not None:
+            trained_through = current.get('metadata', {}).get('data_end')
+            if trained_through:
+                seen = np.datetime64(trained_through.rstrip('Z'), 's').astype(np.int64)
+                holdout_start = max(holdout_start, seen + gap_seconds)
+            test = np.flatnonzero(times >= holdout_start)
+            train = np.flatnonzero(times < holdout_start - gap_seconds)
+            if len(test) and len(np.unique(y[test])) > 1:
+                current_features = current['feature_names']
+                X_current = X if current_features == feature_names else build_dataset(
+                    usgs_df, noaa_df, current_features, horizon_hours, risk_ratio, cache_dir)[0]
+                current_score = score_predictions(metric, y[test], predict_proba(current, X_current[test]))
+                challenger = fit_pipeline(X[train], y[train], feature_names,
+                                          make_model(candidates[best], n_jobs=jobs))
+                candidate_score = score_predictions(metric, y[test], predict_proba(challenger, X[test]))
+            else:
+                candidate_score = float('nan')
+        else:
+            test = folds[-1][1]
+        report['holdout'] = {
+            'start': utc_text(holdout_start),
+            'rows': int(len(test)),
+            'candidate': None if np.isnan(candidate_score) else round(float(candidate_score), 5),
+            'current': None if current_score is None else round(float(current_score), 5)
+        }
+        
+        if current is None:
+            better = True
+            reason = "no current model to beat"
+        elif np.isnan(candidate_score):
+            better = False
+            reason = (f"no readings with both classes since {utc_text(holdout_start)}, "
+                      f"so the models cannot be compared")
+        else:
+            better = candidate_score >= current_score + min_improvement
+            reason = f"holdout {metric} {candidate_score:.4f} vs current {current_score:.4f}"
+        report['decision'] = reason
+        print(f"⚖️ {reason}")
+        
+        if (better or force) and not dry_run:
+            phase_started = time.perf_counter()
+            metadata = {
+                'trained_by': 'retrain_model',
+                'params': candidates[best],
+                'metric': metric,
+                'cv_score': report['search']['cv_score'],
+                'holdout_score': report['holdout']['candidate'],
+                'train_samples': len(y),
+                'data_start': report['data_range'][0],
+                'data_end': report['data_range'][1],
+                'horizon_hours': horizon_hours,
+                'risk_ratio': risk_ratio
+            }
+            artifact = fit_pipeline(X, y, feature_names, make_model(candidates[best], n_jobs=jobs), metadata)
+            # Predictions in the Lambda are single-threaded
+            artifact['model'].n_jobs = None
+            report['artifact_bytes'] = publish(artifact, s3, bucket, work_dir)
+            report['published'] = True
+            report['publish_seconds'] = round(time.perf_counter() - phase_started, 1)
+            print(f"📤 Published s3://{bucket}/{FOREST_KEY} ({report['artifact_bytes']} bytes) "
+                  f"and {ARTIFACT_KEY}")
+        elif better and dry_run:
+            print("🧪 Dry run - nothing published")
+        else:
+            print("⏭️ Keeping the current model")
+    
+    report['seconds'] = round(time.perf_counter() - started, 1)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description='Retrain the flood model and publish it when it improves')
+    parser.add_argument('--snapshot', default=DEFAULT_SNAPSHOT, help='Training snapshot directory')
+    parser.add_argument('--history', default=DEFAULT_HISTORY, help='Backfilled history directory')
+    parser.add_argument('--archive-bucket', default=os.environ.get('ARCHIVE_BUCKET'),
+                        help='Cold archive bucket (default: ARCHIVE_BUCKET)')
+    parser.add_argument('--synthetic', type=int, default=0, metavar='READINGS',
+                        help='Train on synthetic readings per gauge instead of loading data')
+    parser.add_argument('--sites', default=None, help='USGS sites (default: monitored gauges)')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE, help='Feature matrix cache directory')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='Worker processes')
+    parser.add_argument('--folds', type=int, default=DEFAULT_FOLDS, help='Time-ordered CV folds')
+    parser.add_argument('--metric', default=DEFAULT_METRIC, choices=METRICS)
+    parser.add_argument('--grid', default=None, help='Parameter grid as JSON, e.g. {"max_depth": [8, 12]}')
+    parser.add_argument('--max-candidates', type=int, default=None, help='Random subset of the grid to try')
+    parser.add_argument('--horizon-hours', type=float, default=DEFAULT_HORIZON_HOURS)
+    parser.add_argument('--risk-ratio', type=float, default=DEFAULT_RISK_RATIO)
+    parser.add_argument('--min-improvement', type=float, default=DEFAULT_MIN_IMPROVEMENT,
+                        help='How much the holdout score must improve to publish')
+    parser.add_argument('--bucket', default=None, help='Models bucket (default: S3_BUCKET or the account bucket)')
+    parser.add_argument('--dry-run', action='store_true', help='Search and compare but do not publish')
+    parser.add_argument('--force', action='store_true', help='Publish even if the current model scores better')
+    parser.add_argument('--report', default=None, help='Write the run report as JSON here')
+    args = parser.parse_args()
+    
+    sites = parse_id_list(args.sites) if args.sites else DEFAULT_USGS_SITES
+    if args.synthetic:
+        print(f"🧪 Generating {args.synthetic} synthetic readings for {len(sites)} gauges")
+        usgs_df, noaa_df = synthetic_sources(args.synthetic, sites)
+    else:
+        stations = sorted({GAUGE_STATIONS.get(site, DEFAULT_PAIRED_STATION) for site in sites} |
+                          set(DEFAULT_NOAA_STATIONS))
+        print(f"📥 Loading readings from {args.snapshot}/, {args.history}/"
+              f"{' and s3://' + args.archive_bucket if args.archive_bucket else ''}")
+        usgs_df = load_source('usgs', args.snapshot, args.history, args.archive_bucket, sites)
+        noaa_df = load_source('noaa', args.snapshot, args.history, args.archive_bucket, stations)
+        if not len(usgs_df):
+            print("❌ No gauge readings found - run snapshot_export.py or backfill_history.py first")
+            sys.exit(1)
+    
+    try:
+        report = run_retraining(
+            usgs_df, noaa_df, grid=json.loads(args.grid) if args.grid else None,
+            max_candidates=args.max_candidates, n_folds=args.folds, metric=args.metric,
+            horizon_hours=args.horizon_hours, risk_ratio=args.risk_ratio, jobs=max(args.jobs, 1),
+            cache_dir=args.cache_dir, min_improvement=args.min_improvement, bucket=args.bucket,
+            dry_run=args.dry_run, force=args.force
+        )
+    except (ValueError, RuntimeError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(f"✅ Done in {report['seconds']}s - {'published' if report['published'] else 'not published'}")
+
+if __name__ == "__main__":
+    main()
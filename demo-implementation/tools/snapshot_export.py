@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Training Snapshot Export
+Copies FloodGaugeReadings and WeatherObservations into a local Parquet snapshot
+(partitioned by gauge/station and date) with a parallel segmented scan
+
+Later runs only append items written since the previous export, so training
+reads the columnar snapshot instead of scanning DynamoDB every time. With
+--storage-mode bucketed, gauge readings are unpacked from FloodGaugeBuckets
+into the same per-reading rows.
+
+Usage:
+    python snapshot_export.py --output ./training-snapshot --segments 8
+    python snapshot_export.py --tables usgs --full
+    python snapshot_export.py --storage-mode bucketed
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from decimal import Decimal
+
+import boto3
+from boto3.dynamodb.conditions import Attr
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda-functions'))
+
+from concurrent_fetch import run_all
+from flood_data_access import (GAUGE_BUCKET_TABLE, NOAA_TABLE, STORAGE_MODES, USGS_TABLE,
+                               get_storage_mode, parse_timestamp)
+from packed_readings import bucket_to_items
+
+# pyarrow is only needed by this tool and the notebook, not by the Lambdas
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+DEFAULT_OUTPUT = 'training-snapshot'
+DEFAULT_SEGMENTS = 8
+STATE_FILE = '_export_state.json'
+
+# source -> (table name, partition key attribute)
+SOURCES = {
+    'usgs': (USGS_TABLE, 'gauge_id'),
+    'noaa': (NOAA_TABLE, 'station_id')
+}
+
+# Attributes exported per source and their Parquet types. Every part file is
+# written with exactly these columns, so parts from different runs always
+# share one schema; attributes not listed here are not exported.
+SNAPSHOT_COLUMNS = {
+    'usgs': {
+        'water_level': 'float64',
+        'flood_stage': 'float64',
+        'rate_of_rise': 'float64',
+        'trend': 'string',
+        'location_name': 'string',
+        'ttl': 'float64'
+    },
+    'noaa': {
+        'precipitation_1hr': 'float64',
+        'precipitation_forecast_24hr': 'float64',
+        'temperature': 'float64',
+        'active_flood_warnings': 'float64',
+        'location_name': 'string',
+        'ttl': 'float64'
+    }
+}
+
+def require_pyarrow():
+    """Fail with an install hint when pyarrow is missing"""
+    if pa is None:
+        raise ImportError("pyarrow is required for training snapshots: pip install pyarrow")
+
+def load_state(output_dir):
+    """Per-source export watermarks from the previous run"""
+    path = os.path.join(output_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_state(output_dir, state):
+    """Write the watermarks atomically so an interrupted run never corrupts them"""
+    path = os.path.join(output_dir, STATE_FILE)
+    with open(path + '.partial', 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + '.partial', path)
+
+def snapshot_schema(source):
+    """Schema of every part file for a source (partition columns live in the path)"""
+    return pa.schema([('timestamp', pa.timestamp('us', tz='UTC'))] +
+                     [(name, pa.type_for_alias(type_name))
+                      for name, type_name in SNAPSHOT_COLUMNS[source].items()])
+
+def to_column_value(value):
+    """DynamoDB attribute value to a plain Parquet-friendly value"""
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+def scan_segment(table, segment, total_segments, since_ttl=None, expand=None):
+    """
+    Scan one segment of the table into column lists
+    
+    Items are converted page by page, so memory holds columns rather than
+    one dict per item. since_ttl keeps only items written since the last
+    export (ttl is set from the ingest time by both collectors). expand
+    turns one stored item into several rows (packed gauge buckets).
+    """
+    params = {'Segment': segment, 'TotalSegments': total_segments}
+    if since_ttl is not None:
+        params['FilterExpression'] = Attr('ttl').gte(since_ttl)
+    
+    columns = {}
+    rows = 0
+    while True:
+        response = table.scan(**params)
+        for stored in response['Items']:
+            for item in (expand(stored) if expand else (stored,)):
+                for name in set(columns) | set(item):
+                    # Attributes first seen part way through get back-filled with None
+                    column = columns.setdefault(name, [None] * rows)
+                    column.append(to_column_value(item.get(name)))
+                rows += 1
+        
+        if 'LastEvaluatedKey' not in response:
+            break
+        params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    
+    return rows, columns
+
+def parallel_scan(table, total_segments=DEFAULT_SEGMENTS, since_ttl=None, expand=None):
+    """Scan every segment concurrently and merge the column lists"""
+    outcomes = run_all(lambda segment: scan_segment(table, segment, total_segments, since_ttl, expand),
+                       list(range(total_segments)), max_workers=total_segments)
+    
+    merged = {}
+    total_rows = 0
+    for outcome in outcomes:
+        if 'error' in outcome:
+            raise outcome['error']
+        rows, columns = outcome['result']
+        for name in set(merged) | set(columns):
+            merged.setdefault(name, [None] * total_rows).extend(columns.get(name, [None] * rows))
+        total_rows += rows
+    
+    return total_rows, merged
+
+def build_table(columns, key_name, source):
+    """
+    Arrow table in the source's snapshot schema, plus the date used for partitioning
+    
+    Stored timestamps mix site-local offsets (USGS) and UTC (NOAA), so they
+    are normalized before anything is partitioned or compared. Declared
+    columns missing from every scanned item are written as nulls.
+    """
+    timestamps = [parse_timestamp(value) for value in columns.pop('timestamp')]
+    rows = len(timestamps)
+    
+    arrays = {
+        key_name: pa.array(columns.pop(key_name), type=pa.string()),
+        'date': pa.array([value.strftime('%Y-%m-%d') for value in timestamps], type=pa.string())
+    }
+    for field in snapshot_schema(source):
+        if field.name == 'timestamp':
+            arrays[field.name] = pa.array(timestamps, type=field.type)
+            continue
+        values = columns.get(field.name, [None] * rows)
+        if pa.types.is_string(field.type):
+            values = [None if value is None else str(value) for value in values]
+        else:
+            values = [None if value is None else float(value) for value in values]
+        arrays[field.name] = pa.array(values, type=field.type)
+    return pa.table(arrays)
+
+def existing_keys(source_dir, key_name, partitions):
+    """(id, timestamp) pairs already in the snapshot for the partitions being appended to"""
+    keys = set()
+    for key_value, date in partitions:
+        path = os.path.join(source_dir, f'{key_name}={key_value}', f'date={date}')
+        if not os.path.isdir(path):
+            continue
+        existing = pq.read_table(path, columns=['timestamp'])
+        keys.update((key_value, value) for value in existing.column('timestamp').to_pylist())
+    return keys
+
+def write_partitions(table, source_dir, key_name, run_id):
+    """
+    Append one Parquet file per (id, date) partition, skipping rows already stored
+    
+    Returns the number of rows written.
+    """
+    ids = table.column(key_name).to_pylist()
+    dates = table.column('date').to_pylist()
+    timestamps = table.column('timestamp').to_pylist()
+    
+    seen = existing_keys(source_dir, key_name, set(zip(ids, dates)))
+    groups = {}
+    for row, (key_value, date, timestamp) in enumerate(zip(ids, dates, timestamps)):
+        if (key_value, timestamp) in seen:
+            continue
+        seen.add((key_value, timestamp))
+        groups.setdefault((key_value, date), []).append(row)
+    
+    written = 0
+    for (key_value, date), rows in groups.items():
+        path = os.path.join(source_dir, f'{key_name}={key_value}', f'date={date}')
+        os.makedirs(path, exist_ok=True)
+        part = table.take(pa.array(rows)).drop([key_name, 'date']).sort_by('timestamp')
+        pq.write_table(part, os.path.join(path, f'part-{run_id}.parquet'), compression='zstd')
+        written += len(rows)
+    return written
+
+def export_source(source, output_dir, total_segments=DEFAULT_SEGMENTS, full=False, dynamodb=None,
+                  state=None, storage_mode=None):
+    """
+    Export one source ('usgs' or 'noaa'), appending only new items unless full
+    
+    storage_mode (default STORAGE_MODE) says where gauge readings live; a
+    rewritten bucket is re-exported whole and its known rows skipped.
+    """
+    require_pyarrow()
+    table_name, key_name = SOURCES[source]
+    dynamodb = dynamodb or boto3.resource('dynamodb')
+    state = state if state is not None else load_state(output_dir)
+    
+    expand = None
+    if source == 'usgs' and (storage_mode or get_storage_mode()) == 'bucketed':
+        table_name, expand = GAUGE_BUCKET_TABLE, bucket_to_items
+    
+    since_ttl = None if full else state.get(source, {}).get('max_ttl')
+    started = time.perf_counter()
+    rows, columns = parallel_scan(dynamodb.Table(table_name), total_segments, since_ttl, expand)
+    
+    written = 0
+    if rows:
+        max_ttl = max((value for value in columns.get('ttl', []) if value is not None), default=None)
+        table = build_table(columns, key_name, source)
+        written = write_partitions(table, os.path.join(output_dir, source), key_name,
+                                   uuid.uuid4().hex[:12])
+        if max_ttl is not None:
+            state[source] = {'max_ttl': int(max_ttl), 'exported_at': int(time.time())}
+    
+    return {
+        'source': source,
+        'items_scanned': rows,
+        'rows_written': written,
+        'seconds': round(time.perf_counter() - started, 2)
+    }
+
+def export_tables(output_dir=DEFAULT_OUTPUT, sources=('usgs', 'noaa'), total_segments=DEFAULT_SEGMENTS,
+                  full=False, dynamodb=None, storage_mode=None):
+    """Export every source and record the new watermarks"""
+    os.makedirs(output_dir, exist_ok=True)
+    state = {} if full else load_state(output_dir)
+    
+    results = [
+        export_source(source, output_dir, total_segments, full, dynamodb, state, storage_mode)
+        for source in sources
+    ]
+    save_state(output_dir, state)
+    return results
+
+def utc_timestamp(value):
+    """pandas Timestamp in UTC (naive values are taken as UTC)"""
+    import pandas as pd
+    
+    value = pd.Timestamp(value)
+    return value.tz_localize('UTC') if value.tzinfo is None else value.tz_convert('UTC')
+
+def read_snapshot(output_dir, source, ids=None, start=None, end=None, columns=None):
+    """
+    Read a source back as a DataFrame, sorted by timestamp
+    
+    ids, start and end are pushed down as partition/row-group filters, so
+    only the matching files are opened. Parts are read with the declared
+    snapshot schema, so which run's file is found first never changes the
+    columns or their types.
+    """
+    require_pyarrow()
+    import pandas as pd
+    
+    key_name = SOURCES[source][1]
+    source_dir = os.path.join(output_dir, source)
+    if not os.path.isdir(source_dir):
+        return pd.DataFrame()
+    
+    # IDs stay strings - gauge numbers have leading zeros
+    partition_schema = pa.schema([(key_name, pa.string()), ('date', pa.string())])
+    dataset = ds.dataset(source_dir, format='parquet',
+                         schema=pa.unify_schemas([snapshot_schema(source), partition_schema]),
+                         partitioning=ds.partitioning(partition_schema, flavor='hive'))
+    condition = None
+    for clause in (
+        ds.field(key_name).isin(list(ids)) if ids else None,
+        ds.field('timestamp') >= utc_timestamp(start) if start is not None else None,
+        ds.field('timestamp') <= utc_timestamp(end) if end is not None else None
+    ):
+        if clause is not None:
+            condition = clause if condition is None else condition & clause
+    
+    frame = dataset.to_table(columns=columns, filter=condition).to_pandas()
+    if 'date' in frame:
+        frame = frame.drop(columns=['date'])
+    if key_name in frame:
+        frame[key_name] = frame[key_name].astype(str)
+    return frame.sort_values('timestamp').reset_index(drop=True)
+
+def main():
+    parser = argparse.ArgumentParser(description='Export DynamoDB flood data to a Parquet training snapshot')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='Snapshot directory')
+    parser.add_argument('--tables', default='usgs,noaa', help='Sources to export (usgs,noaa)')
+    parser.add_argument('--segments', type=int, default=DEFAULT_SEGMENTS, help='Parallel scan segments')
+    parser.add_argument('--region', default=None, help='AWS region')
+    parser.add_argument('--full', action='store_true', help='Re-export everything, ignoring watermarks')
+    parser.add_argument('--storage-mode', choices=STORAGE_MODES, default=None,
+                        help='Gauge reading storage (default STORAGE_MODE or items)')
+    args = parser.parse_args()
+    
+    sources = [source.strip() for source in args.tables.split(',') if source.strip()]
+    unknown = [source for source in sources if source not in SOURCES]
+    if unknown:
+        parser.error(f"Unknown tables: {', '.join(unknown)}")
+    
+    dynamodb = boto3.resource('dynamodb', region_name=args.region) if args.region else None
+    for result in export_tables(args.output, sources, args.segments, args.full, dynamodb,
+                                args.storage_mode):
+        print(f"📦 {result['source']}: scanned {result['items_scanned']} items, "
+              f"wrote {result['rows_written']} new rows in {result['seconds']}s")
+
+if __name__ == "__main__":
+    main()